@@ -1,6 +1,11 @@
 import os
-from anthropic import Anthropic, HUMAN_PROMPT, AI_PROMPT
-import base64
+from .clients import get_client
+from .images import prepare_image
+from .ratelimit import rate_limited, estimate_text_tokens, estimate_image_tokens, estimate_images_tokens
+from .resilience import resilient
+from .singleflight import single_flight
+import asyncio
+from typing import BinaryIO, List, Union
 
 class AnthropicWrapper:
     def __init__(self, api_key=None, model="claude-3-5-sonnet-20240620", system_prompt=None):
@@ -17,7 +22,8 @@ class AnthropicWrapper:
         self.system_prompt = system_prompt
         if not self.api_key:
             raise ValueError("API key must be provided either as a parameter or set in the environment variables.")
-        self.client = Anthropic(api_key=self.api_key)
+        self.client = get_client("anthropic", self.api_key)
+        self.async_client = get_client("anthropic", self.api_key, asynchronous=True)
 
     @property
     def system_prompt(self):
@@ -29,6 +35,9 @@ class AnthropicWrapper:
         """Sets the system prompt."""
         self._system_prompt = value
     
+    @single_flight("anthropic")
+    @resilient("anthropic")
+    @rate_limited("anthropic", cost=estimate_text_tokens)
     def generate_text(self, prompt, max_tokens=4000, temperature=0.5, **kwargs):
         """
         Generate text using the specified model.
@@ -60,44 +69,184 @@ class AnthropicWrapper:
         )
     
 
+    @single_flight("anthropic")
+    @resilient("anthropic")
+    @rate_limited("anthropic", cost=estimate_text_tokens)
+    async def agenerate_text(self, prompt, max_tokens=4000, temperature=0.5, **kwargs):
+        """
+        Asynchronously generate text using the specified model.
+
+        Same parameters and return value as `generate_text`, but awaits the async
+        Anthropic client so the calling event loop is never blocked.
+        """
+        messages = [{"role": "user", "content": prompt}]
+
+        response = await self.async_client.messages.create(
+            model=self.model,
+            messages=messages,
+            system=self.system_prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **kwargs
+        )
+
+        return (
+            response.content[0].text,
+            response.usage.input_tokens,
+            response.usage.output_tokens
+        )
+
+    @resilient("anthropic")
+    @rate_limited("anthropic", cost=estimate_text_tokens)
+    async def astream_text(self, prompt, max_tokens=4000, temperature=0.5, **kwargs):
+        """
+        Asynchronously stream generated text from the specified model.
+
+        Parameters are the same as `generate_text`.
+
+        Yields:
+        - {"type": "delta", "text": str} for each chunk of generated text, then a final
+          {"type": "usage", "input_tokens": int, "output_tokens": int}.
+        """
+        messages = [{"role": "user", "content": prompt}]
+
+        async with self.async_client.messages.stream(
+            model=self.model,
+            messages=messages,
+            system=self.system_prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **kwargs
+        ) as stream:
+            async for text in stream.text_stream:
+                yield {"type": "delta", "text": text}
+            message = await stream.get_final_message()
+
+        yield {"type": "usage", "input_tokens": message.usage.input_tokens, "output_tokens": message.usage.output_tokens}
+
+    @resilient("anthropic", observe=False)
+    @rate_limited("anthropic", cost=estimate_image_tokens)
     def image_to_text(self, 
-                      image_path: str, 
+                      image_path: Union[str, BinaryIO], 
                       prompt: str = "Describe this image in detail.",
                       max_tokens: int = 1000) -> str:
         """
         Convert an image to text description using Claude.
 
         Parameters:
-        - image_path (str): Path to the image file.
+        - image_path (str or file): Path to the image file, or an open binary file, which is rewound first. Large images are scaled down to what the model uses; see `prepare_image`.
         - prompt (str): The prompt to guide Claude's description. Default is "Describe this image in detail."
         - max_tokens (int): The maximum number of tokens to generate. Default is 1000.
 
         Returns:
         - str: The generated text description of the image.
         """
-        with open(image_path, "rb") as image_file:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=max_tokens,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": "image/jpeg",
-                                    "data": image_file.read().decode("utf-8")
-                                }
-                            },
-                            {
-                                "type": "text",
-                                "text": prompt
-                            }
-                        ]
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            messages=_image_messages(*prepare_image(image_path, "anthropic"), prompt)
+        )
+
+        return response.content[0].text
+
+    @resilient("anthropic", observe=False)
+    @rate_limited("anthropic", cost=estimate_image_tokens)
+    async def aimage_to_text(self,
+                             image_path: Union[str, BinaryIO],
+                             prompt: str = "Describe this image in detail.",
+                             max_tokens: int = 1000) -> str:
+        """
+        Asynchronously convert an image to text description using Claude.
+
+        Same parameters and return value as `image_to_text`.
+        """
+        image_data, media_type = await asyncio.to_thread(prepare_image, image_path, "anthropic")
+        response = await self.async_client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            messages=_image_messages(image_data, media_type, prompt)
+        )
+
+        return response.content[0].text
+
+    @resilient("anthropic", observe=False)
+    @rate_limited("anthropic", cost=estimate_images_tokens)
+    def images_to_text(self,
+                       image_paths: List[Union[str, BinaryIO]],
+                       prompt: str,
+                       max_tokens: int = 4000) -> str:
+        """
+        Answer one prompt about several images in a single Claude request.
+
+        Each image is preceded by its label, "Image 1" to "Image N", and the
+        prompt comes last, so it can refer to them; see `packed_prompt`.
+
+        Parameters:
+        - image_paths (list): Paths of the image files, or open binary files. Each is prepared as in `image_to_text`.
+        - prompt (str): The prompt covering all the images.
+        - max_tokens (int): The maximum number of tokens to generate. Default is 4000.
+
+        Returns:
+        - str: Claude's answer.
+        """
+        images = [prepare_image(image_path, "anthropic") for image_path in image_paths]
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            messages=_images_messages(images, prompt)
+        )
+
+        return response.content[0].text
+
+    @resilient("anthropic", observe=False)
+    @rate_limited("anthropic", cost=estimate_images_tokens)
+    async def aimages_to_text(self,
+                              image_paths: List[Union[str, BinaryIO]],
+                              prompt: str,
+                              max_tokens: int = 4000) -> str:
+        """
+        Asynchronously answer one prompt about several images in a single Claude request.
+
+        Same parameters and return value as `images_to_text`.
+        """
+        images = await asyncio.to_thread(lambda: [prepare_image(image_path, "anthropic") for image_path in image_paths])
+        response = await self.async_client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            messages=_images_messages(images, prompt)
+        )
+
+        return response.content[0].text
+
+
+def _images_messages(images, prompt):
+    """Build the single-turn message list for a multi-image request from (base64 data, media type) pairs."""
+    content = []
+    for number, (image_data, media_type) in enumerate(images, 1):
+        content.append({"type": "text", "text": f"Image {number}:"})
+        content.append({"type": "image", "source": {"type": "base64", "media_type": media_type, "data": image_data}})
+    content.append({"type": "text", "text": prompt})
+    return [{"role": "user", "content": content}]
+
+
+def _image_messages(image_data, media_type, prompt):
+    """Build the single-turn message list for an image description request."""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": media_type,
+                        "data": image_data
                     }
-                ]
-            )
-        
-        return response.content[0].text
\ No newline at end of file
+                },
+                {
+                    "type": "text",
+                    "text": prompt
+                }
+            ]
+        }
+    ]
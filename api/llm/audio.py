@@ -0,0 +1,235 @@
+import asyncio
+import math
+import os
+import re
+import time
+
+# Silence detection: quieter than SILENCE_NOISE_DB for at least SILENCE_MIN_SECONDS.
+SILENCE_NOISE_DB = float(os.getenv("SILENCE_NOISE_DB", "-35"))
+SILENCE_MIN_SECONDS = float(os.getenv("SILENCE_MIN_SECONDS", "0.5"))
+
+# ffmpeg processes allowed to run at once; each keeps roughly one core busy.
+FFMPEG_CONCURRENCY = int(os.getenv("FFMPEG_CONCURRENCY", str(os.cpu_count() or 2)))
+_ffmpeg_slots = asyncio.Semaphore(FFMPEG_CONCURRENCY)
+
+# Speech-only encodings: 16 kHz mono is what Whisper resamples to anyway.
+TRANSCODE_FORMATS = {
+    "opus": (".ogg", ["-c:a", "libopus", "-b:a", os.getenv("TRANSCODE_OPUS_BITRATE", "24k"), "-application", "voip"]),
+    "flac": (".flac", ["-c:a", "flac", "-compression_level", "8", "-sample_fmt", "s16"]),
+}
+TRANSCODE_SAMPLE_RATE = 16000
+
+_SILENCE_START = re.compile(r"silence_start: (-?[\d.]+)")
+_SILENCE_END = re.compile(r"silence_end: (-?[\d.]+)")
+
+
+class FFmpegError(RuntimeError):
+    """Raised when ffmpeg or ffprobe is missing or fails on an input."""
+
+
+async def run_ffmpeg(*args, program="ffmpeg"):
+    """
+    Run ffmpeg (or ffprobe) as a subprocess without blocking the event loop.
+
+    The work happens in the child process; the event loop only awaits its
+    output. At most FFMPEG_CONCURRENCY processes run at once, so a burst of
+    uploads queues instead of oversubscribing the CPUs.
+
+    Parameters:
+    - args (str): Command-line arguments.
+    - program (str): "ffmpeg" or "ffprobe".
+
+    Returns:
+    - tuple: (stdout, stderr) as text.
+    """
+    async with _ffmpeg_slots:
+        return await _run(program, args)
+
+
+def ffmpeg_slot():
+    """Return the semaphore capping concurrent ffmpeg processes, for code that runs ffmpeg itself."""
+    return _ffmpeg_slots
+
+
+async def _run(program, args):
+    try:
+        process = await asyncio.create_subprocess_exec(
+            program, "-hide_banner", *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        raise FFmpegError(f"{program} is not installed")
+    try:
+        stdout, stderr = await process.communicate()
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    stdout, stderr = stdout.decode(errors="replace"), stderr.decode(errors="replace")
+    if process.returncode != 0:
+        raise FFmpegError(f"{program} failed: {stderr.strip().splitlines()[-1] if stderr.strip() else process.returncode}")
+    return stdout, stderr
+
+
+async def probe_duration(path):
+    """Return the duration of an audio file in seconds."""
+    stdout, _ = await run_ffmpeg("-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path, program="ffprobe")
+    try:
+        return float(stdout.strip())
+    except ValueError:
+        raise FFmpegError(f"could not read the duration of {os.path.basename(path)}")
+
+
+async def detect_silences(path, noise_db=SILENCE_NOISE_DB, min_silence=SILENCE_MIN_SECONDS):
+    """
+    Find the silent stretches of an audio file with ffmpeg's silencedetect filter.
+
+    Parameters:
+    - path (str): The audio file.
+    - noise_db (float): Level in dB below which audio counts as silence.
+    - min_silence (float): Shortest stretch, in seconds, reported as silence.
+
+    Returns:
+    - list: (start, end) pairs in seconds. A silence running to the end of the file has end None.
+    """
+    _, stderr = await run_ffmpeg(
+        "-nostats", "-i", path, "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-"
+    )
+    return parse_silences(stderr)
+
+
+def parse_silences(output):
+    """Parse silencedetect log output into (start, end) pairs."""
+    silences = []
+    start = None
+    for line in output.splitlines():
+        match = _SILENCE_START.search(line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = _SILENCE_END.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    if start is not None:
+        silences.append((start, None))
+    return silences
+
+
+def plan_chunks(duration, silences, target=600.0, min_length=None, overlap=2.0):
+    """
+    Choose where to split a recording so chunks end in silence where possible.
+
+    Each cut is the middle of the silence closest to `target` seconds after the
+    previous cut, among silences between `min_length` and `target` seconds after
+    it. When there is no such silence the audio is cut at `target`. Every chunk
+    but the first starts `overlap` seconds before its cut, so words on a hard
+    cut are heard whole by at least one chunk.
+
+    Parameters:
+    - duration (float): Length of the recording in seconds.
+    - silences (list): (start, end) pairs from `detect_silences`.
+    - target (float): Longest chunk, in seconds, not counting the overlap.
+    - min_length (float, optional): Shortest chunk worth cutting at a silence. Defaults to half of `target`.
+    - overlap (float): Seconds each chunk shares with the one before it.
+
+    Returns:
+    - list: Dicts with "start" and "end" (the audio to extract) and "cut" (where the chunk's own part begins).
+    """
+    min_length = target / 2 if min_length is None else min_length
+    midpoints = [(start + (end if end is not None else duration)) / 2 for start, end in silences]
+    cuts = [0.0]
+    while duration - cuts[-1] > target:
+        previous = cuts[-1]
+        candidates = [point for point in midpoints if previous + min_length <= point <= previous + target]
+        cuts.append(max(candidates) if candidates else previous + target)
+    cuts.append(duration)
+    return [
+        {"start": max(0.0, cut - overlap) if index else 0.0, "cut": cut, "end": cuts[index + 1]}
+        for index, cut in enumerate(cuts[:-1])
+    ]
+
+
+def chunk_seconds_for_size(size, duration, max_bytes, overlap=0.0):
+    """
+    Return the longest chunk, in seconds, whose audio fits in `max_bytes` at the file's average bitrate.
+
+    Chunks are copied without re-encoding, so they keep the file's bitrate. A
+    tenth of `max_bytes` is held back for variable bitrates and container
+    headers, and `overlap` for the audio each chunk shares with the one before.
+
+    Parameters:
+    - size (int): Size of the recording in bytes.
+    - duration (float): Length of the recording in seconds.
+    - max_bytes (int): Largest chunk a provider accepts.
+    - overlap (float): Seconds added to each chunk by `plan_chunks`.
+
+    Returns:
+    - float: Seconds; infinity when the whole recording fits.
+    """
+    if size <= max_bytes or not duration:
+        return math.inf
+    return max(1.0, max_bytes * 0.9 / (size / duration) - overlap)
+
+
+async def extract_chunk(path, start, end, output_path):
+    """Copy the audio between `start` and `end` seconds into `output_path` without re-encoding."""
+    await run_ffmpeg(
+        "-v", "error", "-y", "-ss", f"{start:.3f}", "-i", path, "-t", f"{end - start:.3f}",
+        "-map", "0:a:0", "-c", "copy", output_path,
+    )
+    return output_path
+
+
+class TranscodeStats:
+    def __init__(self):
+        """Totals for `transcode_for_speech`, shown in `GET /stats`."""
+        self.files = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.seconds = 0.0
+
+    def record(self, input_bytes, output_bytes, seconds):
+        self.files += 1
+        self.input_bytes += input_bytes
+        self.output_bytes += output_bytes
+        self.seconds += seconds
+
+    def snapshot(self):
+        """Return the totals and the overall size reduction as a dict."""
+        return {
+            "files": self.files,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "seconds": self.seconds,
+            "compression_ratio": self.input_bytes / self.output_bytes if self.output_bytes else 0.0,
+        }
+
+
+transcode_stats = TranscodeStats()
+
+
+async def transcode_for_speech(path, codec="opus", output_path=None):
+    """
+    Re-encode a recording as 16 kHz mono speech audio, usually 5-10x smaller than the upload.
+
+    Parameters:
+    - path (str): The recording.
+    - codec (str): "opus" (lossy, Ogg container) or "flac" (lossless).
+    - output_path (str, optional): Where to write the result. Defaults to the input's path with "-speech" and the codec's extension.
+
+    Returns:
+    - str: The path of the transcoded file.
+    """
+    extension, codec_args = TRANSCODE_FORMATS[codec]
+    output_path = output_path or f"{os.path.splitext(path)[0]}-speech{extension}"
+    started = time.perf_counter()
+    await run_ffmpeg(
+        "-v", "error", "-y", "-i", path, "-map", "0:a:0", "-vn",
+        "-ac", "1", "-ar", str(TRANSCODE_SAMPLE_RATE), *codec_args, output_path,
+    )
+    transcode_stats.record(os.path.getsize(path), os.path.getsize(output_path), time.perf_counter() - started)
+    return output_path
@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_key(**fields):
+    """
+    Build a stable cache key from request fields.
+
+    Parameters:
+    - fields: Values that identify the request. Values JSON cannot encode are keyed by their repr.
+
+    Returns:
+    - str: A SHA-256 hex digest of the canonical JSON encoding of the fields.
+    """
+    encoded = json.dumps(fields, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=repr)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self,
+                 namespace="default",
+                 max_entries=1024,
+                 max_bytes=64 * 1024 * 1024,
+                 ttl=3600,
+                 stale_ttl=86400,
+                 db_path=None,
+                 db_max_bytes=512 * 1024 * 1024):
+        """
+        Initialize a two-tier response cache.
+
+        Entries live in an in-memory LRU and, when `db_path` is given, in a SQLite
+        table that survives restarts. An entry is fresh for `ttl` seconds, then stale
+        for a further `stale_ttl` seconds (servable only when explicitly allowed),
+        then dropped.
+
+        Parameters:
+        - namespace (str): Separates caches that share one SQLite file.
+        - max_entries (int): Maximum number of entries held in memory.
+        - max_bytes (int): Maximum total size of the values held in memory.
+        - ttl (float): Seconds an entry is considered fresh.
+        - stale_ttl (float): Seconds an expired entry can still be served as stale.
+        - db_path (str, optional): Path of the SQLite file for the disk tier.
+        - db_max_bytes (int): Maximum total size of the values held on disk.
+        """
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.db_max_bytes = db_max_bytes
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0}
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._db_bytes = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "namespace TEXT, key TEXT, value TEXT, created REAL, accessed REAL, size INTEGER, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS response_cache_accessed ON response_cache (namespace, accessed)")
+            self._db_bytes = self._disk_size()
+
+    def get(self, key, allow_stale=False):
+        """
+        Look up a cached value.
+
+        Parameters:
+        - key (str): The cache key.
+        - allow_stale (bool): Also return entries past their TTL but within the stale window.
+
+        Returns:
+        - tuple: (value, is_stale), or None on a miss.
+        """
+        entry = self._recall(key)
+        if entry is None and self._db is not None:
+            entry = self._load(key)
+        hit, expired = self._check(key, entry, allow_stale)
+        if expired and self._db is not None:
+            self._delete(key)
+        return hit
+
+    async def aget(self, key, allow_stale=False):
+        """Same as `get`, but reads the disk tier in a worker thread so the event loop is not blocked."""
+        entry = self._recall(key)
+        if entry is None and self._db is not None:
+            entry = await asyncio.to_thread(self._load, key)
+        hit, expired = self._check(key, entry, allow_stale)
+        if expired and self._db is not None:
+            await asyncio.to_thread(self._delete, key)
+        return hit
+
+    def set(self, key, value):
+        """
+        Store a JSON-serializable value under a key.
+
+        Parameters:
+        - key (str): The cache key.
+        - value: The value to cache.
+        """
+        encoded, created = self._put(key, value)
+        if self._db is not None:
+            self._store(key, encoded, created)
+
+    async def aset(self, key, value):
+        """Same as `set`, but writes the disk tier in a worker thread so the event loop is not blocked."""
+        encoded, created = self._put(key, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._store, key, encoded, created)
+
+    def clear(self):
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM response_cache WHERE namespace = ?", (self.namespace,))
+                self._db_bytes = 0
+
+    def _recall(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def _check(self, key, entry, allow_stale):
+        """Return (hit, expired) for an entry found in either tier, counting the outcome."""
+        with self._lock:
+            if entry is None:
+                self.stats["misses"] += 1
+                return None, False
+            created, value, size = entry
+            age = time.time() - created
+            if age > self.ttl + self.stale_ttl:
+                self._forget(key)
+                self.stats["misses"] += 1
+                return None, True
+            if key not in self._entries:
+                self._remember(key, created, value, size)
+            is_stale = age > self.ttl
+            if is_stale and not allow_stale:
+                self.stats["misses"] += 1
+                return None, False
+            self._entries.move_to_end(key)
+            self.stats["stale_hits" if is_stale else "hits"] += 1
+            return (value, is_stale), False
+
+    def _put(self, key, value):
+        encoded = json.dumps(value)
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, value, len(encoded))
+        return encoded, created
+
+    def _remember(self, key, created, value, size):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[2]
+        self._entries[key] = (created, value, size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.stats["evictions"] += 1
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _load(self, key):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT created, value, size FROM response_cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE response_cache SET accessed = ? WHERE namespace = ? AND key = ?",
+                (time.time(), self.namespace, key),
+            )
+        return row[0], json.loads(row[1]), row[2]
+
+    def _store(self, key, encoded, created):
+        with self._db_lock:
+            previous = self._db.execute(
+                "SELECT size FROM response_cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, encoded, created, created, len(encoded)),
+            )
+            self._db_bytes += len(encoded) - (previous[0] if previous else 0)
+            if self._db_bytes > self.db_max_bytes:
+                self._evict_disk()
+
+    def _delete(self, key):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT size FROM response_cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            if row is not None:
+                self._db.execute("DELETE FROM response_cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                self._db_bytes -= row[0]
+
+    def _disk_size(self):
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM response_cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def _evict_disk(self):
+        """Delete the least recently used rows until the disk tier fits; call with `_db_lock` held."""
+        # Other processes may share the file, so the running total is checked against the table before evicting.
+        self._db_bytes = self._disk_size()
+        if self._db_bytes <= self.db_max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT key, size FROM response_cache WHERE namespace = ? ORDER BY accessed", (self.namespace,)
+        ).fetchall()
+        for key, size in rows:
+            if self._db_bytes <= self.db_max_bytes:
+                break
+            self._db.execute("DELETE FROM response_cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+            self._db_bytes -= size
+            self.stats["evictions"] += 1
@@ -0,0 +1,227 @@
+import re
+import threading
+import time
+
+from .ratelimit import estimate_text_tokens
+
+# Openings that mark a reply as a refusal rather than an answer.
+REFUSAL_PATTERNS = [
+    r"^\s*(i'?m|i am) sorry,? but",
+    r"^\s*(i'?m|i am) (unable|not able) to",
+    r"^\s*i (can(no|'?)t|won'?t) (help|assist|provide|create|do)",
+    r"^\s*as an ai\b",
+    r"^\s*unfortunately,? i (can(no|'?)t|am unable)",
+]
+_refusal = re.compile("|".join(REFUSAL_PATTERNS), re.IGNORECASE)
+
+
+class AcceptanceCheck:
+    def __init__(self, min_chars=0, required_sections=(), reject_refusals=True):
+        """
+        Initialize a local check deciding whether a cheap model's answer is good enough.
+
+        Parameters:
+        - min_chars (int): Minimum length of the answer, ignoring surrounding whitespace.
+        - required_sections (list): Markdown headings the answer must contain, matched case-insensitively.
+        - reject_refusals (bool): Reject answers that open with a refusal.
+        """
+        self.min_chars = min_chars
+        self.required_sections = list(required_sections)
+        self.reject_refusals = reject_refusals
+
+    def __call__(self, text):
+        """
+        Check an answer.
+
+        Parameters:
+        - text (str): The generated text.
+
+        Returns:
+        - list: The reasons the answer was rejected; empty if it is accepted.
+        """
+        text = (text or "").strip()
+        reasons = []
+        if len(text) < self.min_chars:
+            reasons.append("too_short")
+        headings = [line.lstrip("#").strip().lower() for line in text.splitlines() if line.startswith("#")]
+        for section in self.required_sections:
+            if not any(section.lower() in heading for heading in headings):
+                reasons.append(f"missing_section:{section}")
+        if self.reject_refusals and _refusal.search(text):
+            reasons.append("refusal")
+        return reasons
+
+
+class CascadeStats:
+    def __init__(self):
+        """
+        Initialize cascade counters.
+
+        `latency_saved` is the expected latency of the quality model minus the actual
+        latency of the cheap model, summed over accepted answers. `latency_added`
+        is the time spent on cheap answers that were rejected.
+        """
+        self.stats = {"requests": 0, "accepted": 0, "escalated": 0, "latency_saved": 0.0, "latency_added": 0.0}
+        self.reasons = {}
+        self._lock = threading.Lock()
+
+    def accepted(self, saved):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["accepted"] += 1
+            self.stats["latency_saved"] += max(0.0, saved or 0.0)
+
+    def escalated(self, reasons, added):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["escalated"] += 1
+            self.stats["latency_added"] += added
+            for reason in reasons:
+                # Count missing sections together; the section names are request-specific.
+                reason = reason.split(":", 1)[0]
+                self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def snapshot(self):
+        """Return the counters, the escalation rate and rejection reasons as a dict."""
+        with self._lock:
+            requests = self.stats["requests"]
+            return {
+                **self.stats,
+                "escalation_rate": self.stats["escalated"] / requests if requests else 0.0,
+                "reasons": dict(self.reasons),
+            }
+
+
+# Shared by the API and the Streamlit models.
+cascade_stats = CascadeStats()
+
+
+def exceeds_context(spec, prompt, max_tokens):
+    """
+    Whether a text request is too long for a model's context window.
+
+    Parameters:
+    - spec (dict, optional): The model's registry entry. A model not in the registry is assumed to fit.
+    - prompt (str): The prompt, including any system prompt.
+    - max_tokens (int): The output tokens asked for.
+
+    Returns:
+    - bool: True if the model cannot take the request at all.
+    """
+    return bool(spec) and spec["context_window"] < estimate_text_tokens({"prompt": prompt, "max_tokens": max_tokens})
+
+
+def run_cascade(cheap, quality, check, quality_latency=None, stats=cascade_stats):
+    """
+    Call `cheap()` and return its answer if `check` accepts it; otherwise call `quality()`.
+
+    An error from the cheap model also escalates.
+
+    Parameters:
+    - cheap (callable): Calls the cheap, fast model.
+    - quality (callable): Calls the quality model.
+    - check (callable): Maps the cheap result to a list of rejection reasons, e.g. an AcceptanceCheck applied to its text.
+    - quality_latency (float, optional): Expected seconds for the quality model, to estimate the time saved.
+    - stats (CascadeStats): Where to record the outcome.
+
+    Returns:
+    - tuple: (result, reasons), where reasons is empty if the cheap answer was used.
+    """
+    started = time.perf_counter()
+    try:
+        result = cheap()
+        reasons = check(result)
+    except Exception:
+        reasons = ["error"]
+    elapsed = time.perf_counter() - started
+    if not reasons:
+        stats.accepted(quality_latency - elapsed if quality_latency else 0.0)
+        return result, reasons
+    stats.escalated(reasons, elapsed)
+    return quality(), reasons
+
+
+async def arun_cascade(cheap, quality, check, quality_latency=None, stats=cascade_stats):
+    """
+    Asynchronous `run_cascade`: `cheap` and `quality` return coroutines.
+
+    Same parameters and return value as `run_cascade`.
+    """
+    started = time.perf_counter()
+    try:
+        result = await cheap()
+        reasons = check(result)
+    except Exception:
+        reasons = ["error"]
+    elapsed = time.perf_counter() - started
+    if not reasons:
+        stats.accepted(quality_latency - elapsed if quality_latency else 0.0)
+        return result, reasons
+    stats.escalated(reasons, elapsed)
+    return await quality(), reasons
+
+
+class CascadeModel:
+    def __init__(self, cheap_model, quality_model, check=None, quality_latency=None, cheap_spec=None):
+        """
+        Initialize a text model that tries a cheap model first and escalates when its answer fails a check.
+
+        Offers the same `system_prompt` / `generate_text` interface as the provider
+        wrappers, so the Streamlit features can use it in their place.
+
+        Parameters:
+        - cheap_model: The model tried first, e.g. a GroqWrapper.
+        - quality_model: The model used when the cheap answer is rejected, e.g. a RoutedModel.
+        - check (AcceptanceCheck, optional): The default check. Defaults to rejecting refusals only.
+        - quality_latency (callable, optional): Returns the quality model's expected seconds, or None, for the stats.
+        - cheap_spec (dict, optional): The cheap model's registry entry. Requests too long for its context window go straight to the quality model.
+        """
+        self.cheap_model = cheap_model
+        self.quality_model = quality_model
+        self.check = check or AcceptanceCheck()
+        self.quality_latency = quality_latency
+        self.cheap_spec = cheap_spec
+        self.system_prompt = None
+        self.escalated = False
+
+    @property
+    def system_prompt(self):
+        """Gets the system prompt."""
+        return self._system_prompt
+
+    @system_prompt.setter
+    def system_prompt(self, value):
+        """Sets the system prompt."""
+        self._system_prompt = value
+
+    def generate_text(self, prompt, max_tokens=4000, temperature=0.5, check=None, **kwargs):
+        """
+        Generate text with the cheap model, escalating to the quality model if needed.
+
+        Parameters:
+        - prompt (str): The prompt text to generate responses for.
+        - max_tokens (int): The maximum number of tokens to generate.
+        - temperature (float): The temperature for text generation.
+        - check (AcceptanceCheck, optional): Overrides the default check for this call.
+        - kwargs: Additional keyword arguments for the provider API call.
+
+        Returns:
+        - Generated text from the model, input tokens count, and output tokens count.
+        """
+        def call(model):
+            model.system_prompt = self.system_prompt
+            return model.generate_text(prompt=prompt, max_tokens=max_tokens, temperature=temperature, **kwargs)
+
+        if exceeds_context(self.cheap_spec, (self.system_prompt or "") + prompt, max_tokens):
+            # The cheap model cannot take this request at all.
+            cascade_stats.escalated(["context_window"], 0.0)
+            self.escalated = True
+            return call(self.quality_model)
+        result, reasons = run_cascade(
+            lambda: call(self.cheap_model),
+            lambda: call(self.quality_model),
+            lambda result: (check or self.check)(result[0]),
+            self.quality_latency() if self.quality_latency else None,
+        )
+        self.escalated = bool(reasons)
+        return result
@@ -0,0 +1,126 @@
+import os
+import threading
+import httpx
+
+from .ratelimit import response_hooks
+
+# Connection pool and timeout settings shared by every provider client.
+# They can be overridden through the environment or `configure()` before the
+# first client for a provider is built.
+POOL_SETTINGS = {
+    "max_connections": int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100")),
+    "max_keepalive_connections": int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20")),
+    "keepalive_expiry": float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60")),
+    "connect_timeout": float(os.getenv("LLM_CONNECT_TIMEOUT", "10")),
+    "read_timeout": float(os.getenv("LLM_READ_TIMEOUT", "600")),
+    # Retries are handled by llm/resilience.py; SDK retries would multiply them.
+    "sdk_max_retries": int(os.getenv("LLM_SDK_MAX_RETRIES", "0")),
+}
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def configure(**settings):
+    """
+    Update the pool settings used for clients created from now on.
+
+    Parameters:
+    - settings: Any of the keys in `POOL_SETTINGS`.
+    """
+    unknown = set(settings) - set(POOL_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown pool settings: {', '.join(sorted(unknown))}")
+    POOL_SETTINGS.update(settings)
+
+
+def get_client(provider, api_key, asynchronous=False):
+    """
+    Return the process-wide SDK client for a provider and API key.
+
+    The client (and its keep-alive HTTP connection pool) is created on first use
+    and reused for the life of the process.
+
+    Parameters:
+    - provider (str): One of 'openai', 'groq', 'anthropic' or 'replicate'.
+    - api_key (str): The API key the client authenticates with.
+    - asynchronous (bool): Return the async SDK client instead of the sync one.
+
+    Returns:
+    - The SDK client instance.
+    """
+    if provider == "replicate":
+        asynchronous = False
+    key = (provider, api_key, asynchronous)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _build_client(provider, api_key, asynchronous)
+    return client
+
+
+def close_clients():
+    """Close every synchronous client and forget all pooled clients."""
+    with _lock:
+        clients = list(_clients.items())
+        _clients.clear()
+    for (provider, _, asynchronous), client in clients:
+        if not asynchronous and hasattr(client, "close"):
+            client.close()
+
+
+async def aclose_clients():
+    """Close every pooled client, awaiting the async ones."""
+    with _lock:
+        clients = list(_clients.items())
+        _clients.clear()
+    for (provider, _, asynchronous), client in clients:
+        if asynchronous and hasattr(client, "close"):
+            await client.close()
+        elif hasattr(client, "close"):
+            client.close()
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=POOL_SETTINGS["max_connections"],
+        max_keepalive_connections=POOL_SETTINGS["max_keepalive_connections"],
+        keepalive_expiry=POOL_SETTINGS["keepalive_expiry"],
+    )
+
+
+def _timeout():
+    return httpx.Timeout(POOL_SETTINGS["read_timeout"], connect=POOL_SETTINGS["connect_timeout"])
+
+
+def _build_client(provider, api_key, asynchronous):
+    http_client_class = httpx.AsyncClient if asynchronous else httpx.Client
+    if provider == "openai":
+        import openai
+        client_class = openai.AsyncOpenAI if asynchronous else openai.OpenAI
+    elif provider == "groq":
+        import groq
+        client_class = groq.AsyncGroq if asynchronous else groq.Groq
+    elif provider == "anthropic":
+        import anthropic
+        client_class = anthropic.AsyncAnthropic if asynchronous else anthropic.Anthropic
+    elif provider == "replicate":
+        import replicate
+        # Replicate clients hold both a sync and an async pool internally.
+        return replicate.Client(api_token=api_key, timeout=_timeout(), limits=_limits())
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+
+    sync_hooks, async_hooks = response_hooks(provider)
+    return client_class(
+        api_key=api_key,
+        timeout=_timeout(),
+        max_retries=POOL_SETTINGS["sdk_max_retries"],
+        http_client=http_client_class(
+            limits=_limits(),
+            timeout=_timeout(),
+            event_hooks=async_hooks if asynchronous else sync_hooks,
+        ),
+    )
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Monotonic time by which the current request must be answered, or None.
+_deadline = ContextVar("llm_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when a request's deadline passes before a provider call finishes."""
+
+
+# Message of the CancelledError sent to work whose callers all ran out of time.
+DEADLINE_CANCEL = "deadline"
+
+
+def cancel_reason(error):
+    """
+    Return "deadline" if a CancelledError was sent because the deadline passed, else "cancelled".
+
+    Call it where the error was caught. A task cancelled for several reasons at
+    once keeps only the first message, so the current deadline is checked too.
+    """
+    if error.args == (DEADLINE_CANCEL,):
+        return "deadline"
+    left = remaining()
+    return "deadline" if left is not None and left <= 0 else "cancelled"
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """
+    Give the calls made inside the block a deadline `seconds` from now.
+
+    An enclosing deadline that is sooner still applies. Tasks started inside
+    the block inherit the deadline.
+
+    Parameters:
+    - seconds (float, optional): The time allowed. None leaves the current deadline as it is.
+    """
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Return the seconds left before the current deadline, or None if there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+async def bounded(awaitable):
+    """
+    Await `awaitable`, cancelling it if the current deadline passes first.
+
+    Cancelling a provider call closes its HTTP request, so a stream stops
+    generating output.
+
+    Raises:
+    - DeadlineExceeded: If the deadline passes first, or had already passed.
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        close = getattr(awaitable, "close", None)
+        if close is not None:
+            close()
+        raise DeadlineExceeded("Request deadline exceeded before the provider call")
+    try:
+        if hasattr(asyncio, "timeout"):
+            # Stays in the current task, which SDK streams entered their context managers in.
+            async with asyncio.timeout(left):
+                return await awaitable
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        if remaining() > 0:
+            # The call's own timeout, not the deadline.
+            raise
+        raise DeadlineExceeded("Request deadline exceeded")
+
+
+class CancellationStats:
+    def __init__(self):
+        """
+        Counts of provider calls cut short, shown in `GET /stats`.
+
+        Output tokens saved are an estimate: what the model usually writes
+        (see `ModelHealth.output_tokens`), capped at the call's max_tokens,
+        minus what had already been received.
+        """
+        self.stats = {
+            "disconnects": 0,
+            "deadline_exceeded": 0,
+            "cancelled_calls": 0,
+            "output_tokens_received": 0,
+            "output_tokens_saved": 0,
+        }
+        self._lock = threading.Lock()
+
+    def record_disconnect(self):
+        """Count a request abandoned by its client."""
+        with self._lock:
+            self.stats["disconnects"] += 1
+
+    def record_call(self, reason, max_tokens=None, received=0, expected=None):
+        """
+        Record a provider call stopped before it finished.
+
+        Parameters:
+        - reason (str): "deadline" or "cancelled".
+        - max_tokens (int, optional): The call's output limit.
+        - received (int): Output tokens already received.
+        - expected (float, optional): Output tokens the model usually writes; max_tokens is used when unknown.
+        """
+        saved = 0
+        if max_tokens:
+            expected = max_tokens if expected is None else min(max_tokens, expected)
+            saved = max(0, int(expected) - received)
+        with self._lock:
+            self.stats["deadline_exceeded" if reason == "deadline" else "cancelled_calls"] += 1
+            self.stats["output_tokens_received"] += received
+            self.stats["output_tokens_saved"] += saved
+
+
+cancellation_stats = CancellationStats()
@@ -1,5 +1,8 @@
 import os
-import groq
+from .clients import get_client
+from .ratelimit import rate_limited, estimate_text_tokens
+from .resilience import resilient
+from .singleflight import single_flight
 
 
 class GroqWrapper:
@@ -17,7 +20,8 @@ class GroqWrapper:
         self.system_prompt = system_prompt
         if not self.api_key:
             raise ValueError("API key must be provided either as a parameter or set in the environment variables.")
-        groq.api_key = self.api_key
+        self.client = get_client("groq", self.api_key)
+        self.async_client = get_client("groq", self.api_key, asynchronous=True)
 
     @property
     def system_prompt(self):
@@ -29,6 +33,9 @@ class GroqWrapper:
         """Sets the system prompt."""
         self._system_prompt = value
     
+    @single_flight("groq")
+    @resilient("groq")
+    @rate_limited("groq", cost=estimate_text_tokens)
     def generate_text(self, prompt, max_tokens=4000, temperature=0.7, **kwargs):
         """
         Generate text using the specified model.
@@ -42,12 +49,11 @@ class GroqWrapper:
         Returns:
         - Generated text from the model.
         """
-        client = groq.Groq()  # Initialize the OpenAI client
         messages = []
         if self.system_prompt:
             messages.append({"role": "system", "content": self.system_prompt})
         messages.append({"role": "user", "content": prompt})
-        response = client.chat.completions.create(
+        response = self.client.chat.completions.create(
             model = self.model,
             messages=messages,
             max_tokens=max_tokens,
@@ -56,3 +62,59 @@ class GroqWrapper:
         )
         return response.choices[0].message.content, int(response.usage.prompt_tokens), int(response.usage.completion_tokens)
 
+    @single_flight("groq")
+    @resilient("groq")
+    @rate_limited("groq", cost=estimate_text_tokens)
+    async def agenerate_text(self, prompt, max_tokens=4000, temperature=0.7, **kwargs):
+        """
+        Asynchronously generate text using the specified model.
+
+        Same parameters and return value as `generate_text`, but awaits the async
+        Groq client so the calling event loop is never blocked.
+        """
+        messages = []
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        response = await self.async_client.chat.completions.create(
+            model = self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **kwargs
+        )
+        return response.choices[0].message.content, int(response.usage.prompt_tokens), int(response.usage.completion_tokens)
+
+    @resilient("groq")
+    @rate_limited("groq", cost=estimate_text_tokens)
+    async def astream_text(self, prompt, max_tokens=4000, temperature=0.7, **kwargs):
+        """
+        Asynchronously stream generated text from the specified model.
+
+        Parameters are the same as `generate_text`.
+
+        Yields:
+        - {"type": "delta", "text": str} for each chunk of generated text, then a final
+          {"type": "usage", "input_tokens": int, "output_tokens": int}.
+        """
+        messages = []
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        stream = await self.async_client.chat.completions.create(
+            model = self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            **kwargs
+        )
+        input_tokens = output_tokens = 0
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield {"type": "delta", "text": chunk.choices[0].delta.content}
+            # Groq reports usage on the last chunk under its `x_groq` extension.
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if usage:
+                input_tokens, output_tokens = int(usage.prompt_tokens), int(usage.completion_tokens)
+        yield {"type": "usage", "input_tokens": input_tokens, "output_tokens": output_tokens}
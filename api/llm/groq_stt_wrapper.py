@@ -1,6 +1,9 @@
 import os
-from groq import Groq
-from typing import Optional
+from contextlib import contextmanager
+from .clients import get_client
+from .ratelimit import rate_limited
+from .resilience import resilient
+from typing import BinaryIO, Optional, Union
 
 class GroqSTTWrapper:
     def __init__(self, api_key=None, model="whisper-large-v3"):
@@ -15,43 +18,98 @@ class GroqSTTWrapper:
         self.model = model
         if not self.api_key:
             raise ValueError("API key must be provided either as a parameter or set in the environment variables.")
-        self.client = Groq(api_key=self.api_key)
+        self.client = get_client("groq", self.api_key)
+        self.async_client = get_client("groq", self.api_key, asynchronous=True)
 
+    @resilient("groq")
+    @rate_limited("groq")
     def transcribe(self, 
-                   audio_file: str, 
+                   audio_file: Union[str, BinaryIO], 
                    language: Optional[str] = None, 
                    prompt: Optional[str] = None,
                    response_format: str = "json",
-                   temperature: float = 0.0):
+                   temperature: float = 0.0,
+                   filename: Optional[str] = None):
         """
         Transcribe the given audio file using the Groq speech-to-text API.
 
         Parameters:
-        - audio_file (str): Path to the audio file to transcribe.
+        - audio_file (str or file): Path to the audio file to transcribe, or an open binary file, which is rewound and streamed to the provider rather than read into memory.
         - language (str, optional): The language of the input audio.
         - prompt (str, optional): An optional text to guide the model's style or continue a previous audio segment.
         - response_format (str, optional): The format of the transcript output. Default is "json".
         - temperature (float, optional): The sampling temperature. Default is 0.0.
+        - filename (str, optional): Name sent with a file object, so the provider can tell the format. Defaults to the path's file name.
 
         Returns:
         - Transcribed text or JSON object, depending on the response_format.
         """
-        with open(audio_file, "rb") as file:
-            params = {
-                "file": (os.path.basename(audio_file), file.read()),
-                "model": self.model,
-                "response_format": response_format,
-                "temperature": temperature
-            }
-            
-            if language:
-                params["language"] = language
-            if prompt:
-                params["prompt"] = prompt
-
+        with _opened(audio_file) as audio:
+            params = self._params(_filename(audio_file, filename), audio, language, prompt, response_format, temperature)
             response = self.client.audio.transcriptions.create(**params)
-        
-        if response_format == "json":
+
+        return self._format(response, response_format)
+
+    @resilient("groq")
+    @rate_limited("groq")
+    async def atranscribe(self,
+                          audio_file: Union[str, BinaryIO],
+                          language: Optional[str] = None,
+                          prompt: Optional[str] = None,
+                          response_format: str = "json",
+                          temperature: float = 0.0,
+                          filename: Optional[str] = None):
+        """
+        Asynchronously transcribe the given audio file using the Groq speech-to-text API.
+
+        Same parameters and return value as `transcribe`; the file is streamed
+        in chunks by the async Groq client.
+        """
+        with _opened(audio_file) as audio:
+            params = self._params(_filename(audio_file, filename), audio, language, prompt, response_format, temperature)
+            response = await self.async_client.audio.transcriptions.create(**params)
+
+        return self._format(response, response_format)
+
+    def _params(self, filename, audio, language, prompt, response_format, temperature):
+        """Build the keyword arguments for a transcription request."""
+        params = {
+            "file": (filename, audio),
+            "model": self.model,
+            "response_format": response_format,
+            "temperature": temperature
+        }
+
+        if language:
+            params["language"] = language
+        if prompt:
+            params["prompt"] = prompt
+        return params
+
+    @staticmethod
+    def _format(response, response_format):
+        """Return the transcription payload in the requested format."""
+        if response_format == "json" or response_format == "verbose_json":
             return response.json()
         else:
-            return response.text
\ No newline at end of file
+            return response.text
+
+
+@contextmanager
+def _opened(audio_file):
+    """Yield a binary file at its start: paths are opened and closed, file objects are rewound and left open."""
+    if isinstance(audio_file, (str, os.PathLike)):
+        with open(audio_file, "rb") as f:
+            yield f
+    else:
+        audio_file.seek(0)
+        yield audio_file
+
+
+def _filename(audio_file, filename=None):
+    """Return the file name to send with an upload."""
+    if filename:
+        return os.path.basename(filename)
+    if isinstance(audio_file, (str, os.PathLike)):
+        return os.path.basename(audio_file)
+    return "audio"
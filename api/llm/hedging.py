@@ -0,0 +1,292 @@
+import asyncio
+import os
+import threading
+from collections import deque
+
+
+class HedgePolicy:
+    def __init__(self,
+                 percentile=float(os.getenv("HEDGE_PERCENTILE", "0.95")),
+                 default_delay=float(os.getenv("HEDGE_DEFAULT_DELAY", "20")),
+                 min_samples=20,
+                 window=500,
+                 max_ratio=float(os.getenv("HEDGE_MAX_RATIO", "0.1"))):
+        """
+        Initialize a hedging policy.
+
+        A hedge fires once a call has run longer than the given percentile of recent
+        latencies for the same key. Hedges are paid for from a budget that grows by
+        `max_ratio` per request, so at most that fraction of requests is ever duplicated.
+
+        Parameters:
+        - percentile (float): Latency percentile, between 0 and 1, after which to hedge.
+        - default_delay (float): Delay in seconds used until `min_samples` latencies are known.
+        - min_samples (int): Observations needed before the percentile is trusted.
+        - window (int): Number of recent latencies kept per key.
+        - max_ratio (float): Maximum fraction of requests that may be hedged.
+        """
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.max_ratio = max_ratio
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "wasted_input_tokens": 0, "wasted_output_tokens": 0}
+        self._latencies = {}
+        self._budget = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        """Record an observed latency for a key."""
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = deque(maxlen=self.window)
+            latencies.append(seconds)
+
+    def delay(self, key):
+        """Return how long to wait for a call with this key before hedging it."""
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if not latencies or len(latencies) < self.min_samples:
+                return self.default_delay
+            ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+
+    def start_request(self):
+        """Count a request and credit the hedge budget."""
+        with self._lock:
+            self.stats["requests"] += 1
+            # Cap the credit so a long quiet period cannot fund a burst of hedges.
+            self._budget = min(self._budget + self.max_ratio, max(1.0, self.max_ratio * 100))
+
+    def try_hedge(self):
+        """Spend hedge budget if available; return whether a hedge may be sent."""
+        with self._lock:
+            if self._budget < 1.0:
+                return False
+            self._budget -= 1.0
+            self.stats["hedged"] += 1
+            return True
+
+    def record_waste(self, input_tokens, output_tokens=0):
+        """Add the prompt tokens sent to a cancelled duplicate call, and the output it had produced."""
+        with self._lock:
+            self.stats["wasted_input_tokens"] += input_tokens
+            self.stats["wasted_output_tokens"] += output_tokens
+
+    def record_hedge_win(self):
+        """Count a request answered by its hedge rather than the original call."""
+        with self._lock:
+            self.stats["hedge_wins"] += 1
+
+
+async def _first_success(tasks):
+    """Wait for the first task to succeed; if all fail, raise the first task's error."""
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            if task in done and not task.cancelled() and task.exception() is None:
+                return task
+    return tasks[0]
+
+
+async def _cancel(task, reason=None):
+    task.cancel(reason)
+    try:
+        await task
+    except BaseException:
+        pass
+
+
+async def hedged_call(primary, backup, key, policy):
+    """
+    Run `primary()` and, if it is slow, race it against `backup()`.
+
+    Both are coroutine factories returning (text, input_tokens, output_tokens). The
+    loser is cancelled. A cancelled call reports no usage, so its waste is estimated
+    from the winner: the same input tokens, and the winner's output tokens scaled by
+    how long the loser ran compared to the winner.
+
+    Parameters:
+    - primary (callable): Starts the original call.
+    - backup (callable): Starts the duplicate call.
+    - key: Identifies the latency distribution to use, e.g. (provider, model).
+    - policy (HedgePolicy): Supplies the delay and the hedge budget.
+
+    Returns:
+    - tuple: (result, hedge_won), where hedge_won tells whether the backup answered first.
+    """
+    policy.start_request()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    tasks = [asyncio.ensure_future(primary())]
+    reason = None
+    try:
+        done, _ = await asyncio.wait(set(tasks), timeout=policy.delay(key))
+        if done or not policy.try_hedge():
+            result = await tasks[0]
+            policy.record(key, loop.time() - started)
+            return result, False
+        starts = [started, loop.time()]
+        tasks.append(asyncio.ensure_future(backup()))
+        winner = await _first_success(tasks)
+        result = winner.result()
+        finished = loop.time()
+        took = max(finished - starts[tasks.index(winner)], 1e-6)
+        for task, start in zip(tasks, starts):
+            if task is not winner and not task.done():
+                await _cancel(task)
+                policy.record_waste(result[1], int(result[2] * min(1.0, (finished - start) / took)))
+        if winner is tasks[0]:
+            policy.record(key, loop.time() - started)
+        else:
+            policy.record_hedge_win()
+        return result, winner is not tasks[0]
+    except asyncio.CancelledError as e:
+        # Pass the caller's cancel message on, e.g. `deadlines.DEADLINE_CANCEL`.
+        reason = e.args[0] if e.args else None
+        raise
+    finally:
+        for task in tasks:
+            if not task.done():
+                await _cancel(task, reason)
+
+
+class _Backup:
+    def __init__(self, factory):
+        """
+        The duplicate of a hedged stream, read in a task of its own and relayed through a queue.
+
+        Parameters:
+        - factory (callable): Returns the duplicate's async generator.
+        """
+        self.factory = factory
+        self.task = None
+        self.received = 0
+        self.answered = False
+        self._queue = asyncio.Queue()
+        self._head = None
+        self._interrupt = None
+
+    def start(self, policy, interrupt):
+        """Start the duplicate if the hedge budget allows; its first event fires `interrupt`."""
+        if policy.try_hedge():
+            self._interrupt = interrupt
+            self.task = asyncio.ensure_future(self._pump())
+
+    def stop_interrupting(self):
+        """Called once the caller is no longer waiting on the primary stream."""
+        self._interrupt = None
+
+    async def first(self):
+        """Wait for the duplicate's first item; return whether it is an event rather than an error."""
+        self._head = await self._queue.get()
+        return self._head[0] != "error"
+
+    async def events(self):
+        """Yield the duplicate's events, raising its error if it fails."""
+        item = self._head or await self._queue.get()
+        while item[0] != "end":
+            if item[0] == "error":
+                raise item[1]
+            yield item[1]
+            item = await self._queue.get()
+
+    async def cancel(self, reason=None):
+        if self.task is not None and not self.task.done():
+            await _cancel(self.task, reason)
+
+    async def _pump(self):
+        stream = self.factory()
+        try:
+            async for event in stream:
+                if event["type"] == "delta":
+                    self.received += len(event["text"])
+                self._queue.put_nowait(("event", event))
+                if self._interrupt is not None:
+                    # Stop the caller's wait for the primary's first event.
+                    self.answered = True
+                    self._interrupt.reschedule(asyncio.get_running_loop().time())
+                    self._interrupt = None
+            self._queue.put_nowait(("end", None))
+        except Exception as e:
+            self._interrupt = None
+            self._queue.put_nowait(("error", e))
+        finally:
+            await stream.aclose()
+
+
+async def hedged_stream(primary, backup, key, policy):
+    """
+    Stream from `primary()`, hedging with `backup()` if no first event arrives in time.
+
+    Both are factories returning async generators of wrapper stream events. Whichever
+    produces its first event first is streamed through; the other is cancelled. Its
+    prompt is counted as wasted input tokens once the winner reports usage, and the
+    text it had produced (about 4 characters a token) as wasted output tokens.
+
+    The primary is read in the caller's task from start to end, and the backup in
+    a task of its own, so each stream is driven by a single task as SDK stream
+    context managers require (see `deadlines.bounded`).
+
+    Parameters are the same as `hedged_call`, with `key` tracking time-to-first-event.
+
+    Yields:
+    - The winning stream's events. A {"type": "hedge"} event precedes them when the backup won.
+    """
+    policy.start_request()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    stream = primary()
+    hedge = _Backup(backup)
+    timer = None
+    reason = None
+    try:
+        primary_won = True
+        try:
+            async with asyncio.timeout(None) as interrupt:
+                timer = loop.call_later(policy.delay(key), hedge.start, policy, interrupt)
+                event = await stream.__anext__()
+        except StopAsyncIteration:
+            return
+        except Exception:
+            hedge.stop_interrupting()
+            # Either the backup's first event arrived first and interrupted the wait,
+            # or the primary failed and the backup, if running, may still answer.
+            if not hedge.answered and (hedge.task is None or not await hedge.first()):
+                raise
+            primary_won = False
+        finally:
+            timer.cancel()
+            hedge.stop_interrupting()
+
+        if primary_won:
+            policy.record(key, loop.time() - started)
+            losers = 0
+            if hedge.task is not None:
+                await hedge.cancel()
+                losers = 1
+                policy.record_waste(0, hedge.received // 4)
+            yield event
+            async for event in stream:
+                if event["type"] == "usage" and losers:
+                    # The cancelled stream had been sent the same prompt.
+                    policy.record_waste(event["input_tokens"] * losers)
+                yield event
+        else:
+            await stream.aclose()
+            policy.record_hedge_win()
+            yield {"type": "hedge"}
+            async for event in hedge.events():
+                if event["type"] == "usage":
+                    policy.record_waste(event["input_tokens"])
+                yield event
+    except asyncio.CancelledError as e:
+        reason = e.args[0] if e.args else None
+        raise
+    finally:
+        if timer is not None:
+            timer.cancel()
+        await hedge.cancel(reason)
+        await stream.aclose()
@@ -0,0 +1,245 @@
+import asyncio
+import os
+import time
+import uuid
+
+from .cache import make_key
+from .replicate_wrapper import POLL_MIN_INTERVAL, TERMINAL_STATUSES, next_poll_interval
+from .resilience import status_code_of
+
+# Status checks sent to the provider at the same time, across all jobs.
+POLL_CONCURRENCY = int(os.getenv("REPLICATE_POLL_CONCURRENCY", "8"))
+# Consecutive failed status checks after which a job is marked failed.
+POLL_MAX_ERRORS = 10
+# Finished jobs stay readable for this many seconds.
+JOB_RETENTION_SECONDS = float(os.getenv("TEXT_TO_IMAGE_JOB_RETENTION", "3600"))
+# Task IDs the provider did not know are answered with 404 without asking again for this many seconds.
+UNKNOWN_TASK_TTL = float(os.getenv("TEXT_TO_IMAGE_UNKNOWN_TTL", "60"))
+
+
+class ImageJob:
+    def __init__(self, task_id, prediction_id=None, key=None, status="starting"):
+        """
+        One text-to-image task as seen by clients.
+
+        Parameters:
+        - task_id (str): The ID returned to the client. It is the prediction ID, except for cache hits.
+        - prediction_id (str, optional): The upstream prediction being tracked.
+        - key (str, optional): Cache key of the prompt, model and aspect ratio.
+        - status (str): The prediction status: starting, processing, succeeded, failed or canceled.
+        """
+        self.task_id = task_id
+        self.prediction_id = prediction_id
+        self.key = key
+        self.status = status
+        self.image_url = None
+        self.error = None
+        self.version = 0
+        self.updated_at = time.time()
+        self.interval = POLL_MIN_INTERVAL
+        self.next_poll = time.monotonic() + POLL_MIN_INTERVAL
+        self.errors = 0
+
+    @property
+    def done(self):
+        return self.status in TERMINAL_STATUSES
+
+    @property
+    def etag(self):
+        """Strong ETag of the job's current state; it changes whenever the status does."""
+        return f'"{self.task_id}-{self.version}"'
+
+    def update(self, status, image_url=None, error=None):
+        """Record a new state and return whether anything changed."""
+        if (status, image_url, error) == (self.status, self.image_url, self.error):
+            return False
+        self.status, self.image_url, self.error = status, image_url, error
+        self.version += 1
+        self.updated_at = time.time()
+        return True
+
+
+class ImageJobRegistry:
+    def __init__(self, wrapper, cache):
+        """
+        Track text-to-image predictions locally, polled by one shared background task.
+
+        Clients read job state from the registry, so upstream status checks scale
+        with the number of running jobs, not with how often clients poll. Each job
+        is checked after POLL_MIN_INTERVAL seconds, backing off while its status
+        stays the same (see `next_poll_interval`). The poller runs only while jobs
+        are pending. Finished images are cached by prompt, model and aspect ratio;
+        a repeat prompt is answered from the cache, or joins the running job, or
+        the one still being started. IDs the provider does not know are
+        remembered for UNKNOWN_TASK_TTL seconds, so polling a made-up or
+        expired ID does not reach the provider each time.
+
+        Parameters:
+        - wrapper (callable): Returns the wrapper to call, `ReplicateWrapper` or `LocalReplicateWrapper`.
+        - cache (ResponseCache): Cache of finished image URLs.
+        """
+        self.wrapper = wrapper
+        self.cache = cache
+        self.stats = {"submitted": 0, "cache_hits": 0, "coalesced": 0, "upstream_polls": 0, "poll_errors": 0, "unknown_hits": 0}
+        self._jobs = {}
+        self._pending = {}
+        self._by_key = {}
+        self._starting = {}
+        self._unknown = {}
+        self._poller = None
+        self._wakeup = None
+        self._slots = None
+
+    def snapshot(self):
+        """Return the counters and the number of jobs tracked as a dict."""
+        return {**self.stats, "jobs": len(self._jobs), "pending": len(self._pending)}
+
+    async def submit(self, prompt, aspect_ratio, model):
+        """
+        Start a text-to-image job, or reuse a finished or running one for the same request.
+
+        Returns:
+        - tuple: (ImageJob, cached). `cached` is True when the image came from the cache.
+        """
+        self._prune()
+        key = make_key(prompt=prompt, aspect_ratio=aspect_ratio, model=model)
+        hit = await self.cache.aget(key)
+        if hit is not None:
+            self.stats["cache_hits"] += 1
+            job = ImageJob(f"cached-{uuid.uuid4().hex}", key=key)
+            job.update("succeeded", hit[0]["image_url"])
+            self._jobs[job.task_id] = job
+            return job, True
+        running = self._by_key.get(key)
+        if running is not None and not running.done:
+            self.stats["coalesced"] += 1
+            return running, False
+        starting = self._starting.get(key)
+        if starting is not None:
+            self.stats["coalesced"] += 1
+        else:
+            # Registered before the provider call, so an identical submit made meanwhile waits for it.
+            starting = self._starting[key] = asyncio.ensure_future(self._start(key, prompt, aspect_ratio, model))
+            # Its error is raised to the callers waiting; mark it seen in case they were all cancelled.
+            starting.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return await asyncio.shield(starting), False
+
+    def get(self, task_id):
+        """Return the job with this ID, or None if it is not tracked here."""
+        return self._jobs.get(task_id)
+
+    async def adopt(self, task_id):
+        """
+        Look up a prediction this registry did not start, e.g. before a restart, and track it.
+
+        Returns:
+        - ImageJob or None: None when the provider does not know the ID either.
+        """
+        if task_id.startswith("cached-"):
+            return None
+        self._prune()
+        if self._unknown.get(task_id, 0) > time.monotonic():
+            self.stats["unknown_hits"] += 1
+            return None
+        try:
+            status = await self.wrapper().aget_prediction_status(task_id)
+        except Exception as e:
+            if status_code_of(e) == 404:
+                self._unknown[task_id] = time.monotonic() + UNKNOWN_TASK_TTL
+                return None
+            raise
+        self.stats["upstream_polls"] += 1
+        job = self._jobs.get(task_id)
+        if job is None:
+            job = self._jobs[task_id] = ImageJob(task_id, task_id)
+            await self._apply(job, status)
+            if not job.done:
+                self._track(job)
+        return job
+
+    async def aclose(self):
+        """Stop the poller. Jobs still running are no longer checked."""
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+
+    async def _start(self, key, prompt, aspect_ratio, model):
+        try:
+            prediction = await self.wrapper().astart_text_to_image(prompt=prompt, aspect_ratio=aspect_ratio, model=model)
+        finally:
+            self._starting.pop(key, None)
+        self.stats["submitted"] += 1
+        job = ImageJob(prediction.id, prediction.id, key, prediction.status)
+        self._jobs[job.task_id] = job
+        self._by_key[key] = job
+        self._track(job)
+        return job
+
+    def _track(self, job):
+        self._pending[job.task_id] = job
+        if self._poller is None or self._poller.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(POLL_CONCURRENCY)
+            self._poller = asyncio.ensure_future(self._poll_loop())
+        else:
+            self._wakeup.set()
+
+    async def _poll_loop(self):
+        while self._pending:
+            now = time.monotonic()
+            due = [job for job in self._pending.values() if job.next_poll <= now]
+            if due:
+                await asyncio.gather(*(self._poll(job) for job in due))
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), min(job.next_poll for job in self._pending.values()) - now)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, job):
+        async with self._slots:
+            try:
+                status = await self.wrapper().aget_prediction_status(job.prediction_id)
+            except Exception as e:
+                self.stats["poll_errors"] += 1
+                job.errors += 1
+                if status_code_of(e) == 404 or job.errors >= POLL_MAX_ERRORS:
+                    job.update("failed", error=f"Error checking text-to-image status: {str(e)}")
+                    self._finish(job)
+                else:
+                    job.interval = next_poll_interval(job.interval, False)
+                    job.next_poll = time.monotonic() + job.interval
+                return
+        self.stats["upstream_polls"] += 1
+        job.errors = 0
+        changed = await self._apply(job, status)
+        if job.done:
+            self._finish(job)
+        else:
+            job.interval = next_poll_interval(job.interval, changed)
+            job.next_poll = time.monotonic() + job.interval
+
+    async def _apply(self, job, status):
+        """Copy a prediction status from the provider onto a job and return whether it changed."""
+        output = status.get("output")
+        image_url = (output[0] if output else None) if isinstance(output, list) else output
+        changed = job.update(status["status"], image_url, status.get("error") if status["status"] == "failed" else None)
+        if job.status == "succeeded" and job.image_url and job.key is not None:
+            await self.cache.aset(job.key, {"image_url": job.image_url})
+        return changed
+
+    def _finish(self, job):
+        self._pending.pop(job.task_id, None)
+        if self._by_key.get(job.key) is job:
+            del self._by_key[job.key]
+
+    def _prune(self):
+        """Forget finished jobs older than JOB_RETENTION_SECONDS, and unknown IDs past UNKNOWN_TASK_TTL."""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for task_id in [task_id for task_id, job in self._jobs.items() if job.done and job.updated_at < cutoff]:
+            del self._jobs[task_id]
+        now = time.monotonic()
+        for task_id in [task_id for task_id, expires in self._unknown.items() if expires <= now]:
+            del self._unknown[task_id]
@@ -0,0 +1,175 @@
+import base64
+import io
+import os
+import re
+
+from PIL import Image, ImageOps, features
+
+# Largest image each provider uses at full detail. Bigger images are scaled down
+# by the provider anyway, so sending more pixels only costs upload time.
+# OpenAI fits images in 2048x2048 and then scales the short side to 768;
+# Anthropic recommends at most 1568 px on the long edge.
+PROVIDER_IMAGE_LIMITS = {
+    "openai": {"long_side": 2048, "short_side": 768},
+    "anthropic": {"long_side": 1568, "short_side": None},
+}
+# Formats every provider accepts as they are.
+MEDIA_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "GIF": "image/gif", "WEBP": "image/webp"}
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+# Images already within the limits and smaller than this are sent untouched.
+PASSTHROUGH_BYTES = 256 * 1024
+# Larger ones are re-encoded only if that makes them this much smaller.
+REENCODE_MIN_SAVING = 0.2
+# Most images described in one request when a batch packs them. Both APIs take
+# more, but answers get shorter and less reliable as packs grow.
+IMAGE_PACK_LIMITS = {
+    "openai": int(os.getenv("OPENAI_IMAGE_PACK_LIMIT", "10")),
+    "anthropic": int(os.getenv("ANTHROPIC_IMAGE_PACK_LIMIT", "20")),
+}
+# Output budget of a packed request; each image's max_tokens is summed up to this.
+PACK_MAX_TOKENS = int(os.getenv("PACK_MAX_TOKENS", "4096"))
+
+_PACK_HEADING = re.compile(r"^[#*\s]*Image (\d+)[*:\s]*$", re.MULTILINE | re.IGNORECASE)
+
+
+class ImageStats:
+    def __init__(self):
+        """Totals for `prepare_image`, shown in `GET /stats`."""
+        self.images = 0
+        self.resized = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.packed_requests = 0
+        self.packed_images = 0
+        self.pack_fallbacks = 0
+
+    def record(self, input_bytes, output_bytes, resized):
+        self.images += 1
+        self.resized += int(resized)
+        self.input_bytes += input_bytes
+        self.output_bytes += output_bytes
+
+    def record_pack(self, images, split):
+        """Count a packed request; `split` is whether its answer could be split per image."""
+        self.packed_requests += 1
+        if split:
+            self.packed_images += images
+        else:
+            self.pack_fallbacks += 1
+
+    def snapshot(self):
+        """Return the totals and the overall size reduction as a dict."""
+        return {
+            "images": self.images,
+            "resized": self.resized,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "compression_ratio": self.input_bytes / self.output_bytes if self.output_bytes else 0.0,
+            "packed_requests": self.packed_requests,
+            "packed_images": self.packed_images,
+            "pack_fallbacks": self.pack_fallbacks,
+        }
+
+
+image_stats = ImageStats()
+
+
+def prepare_image(image, provider):
+    """
+    Read an image and turn it into the base64 payload a vision API expects, in memory.
+
+    The real format is detected from the content, not the file name. Images
+    larger than the provider's limits in PROVIDER_IMAGE_LIMITS are scaled down
+    and re-encoded as WebP (JPEG where Pillow lacks WebP). Smaller images in a
+    format the provider accepts are sent as they are, unless they are over
+    PASSTHROUGH_BYTES and re-encoding saves at least REENCODE_MIN_SAVING.
+
+    Parameters:
+    - image (str or file): Path to the image, or an open binary file, which is rewound first.
+    - provider (str): "openai" or "anthropic".
+
+    Returns:
+    - tuple: (base64 data, media type such as "image/png").
+    """
+    if isinstance(image, (str, os.PathLike)):
+        with open(image, "rb") as f:
+            original = f.read()
+    else:
+        image.seek(0)
+        original = image.read()
+
+    limits = PROVIDER_IMAGE_LIMITS.get(provider, PROVIDER_IMAGE_LIMITS["anthropic"])
+    with Image.open(io.BytesIO(original)) as picture:
+        source_format = picture.format
+        target = _target_size(picture.size, limits)
+        resized = target != picture.size
+        if not resized and source_format in MEDIA_TYPES and len(original) < PASSTHROUGH_BYTES:
+            data, media_type = original, MEDIA_TYPES[source_format]
+        else:
+            if resized and source_format == "JPEG":
+                # Let the JPEG decoder skip detail that would be thrown away.
+                picture.draft("RGB", target)
+            picture = ImageOps.exif_transpose(picture)
+            if resized:
+                # Recomputed after rotation and draft decoding, which change the size.
+                target = _target_size(picture.size, limits)
+                picture = picture.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            data, media_type = _encode(picture)
+            if not resized and source_format in MEDIA_TYPES and len(data) > len(original) * (1 - REENCODE_MIN_SAVING):
+                data, media_type = original, MEDIA_TYPES[source_format]
+    image_stats.record(len(original), len(data), resized)
+    return base64.b64encode(data).decode("utf-8"), media_type
+
+
+def _target_size(size, limits):
+    """Scale (width, height) down to fit the limits, keeping the aspect ratio."""
+    width, height = size
+    scale = min(1.0, limits["long_side"] / max(width, height))
+    if limits["short_side"]:
+        scale = min(scale, limits["short_side"] / min(width, height))
+    if scale >= 1.0:
+        return size
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _encode(picture):
+    """Encode a decoded image compactly, keeping transparency."""
+    buffer = io.BytesIO()
+    has_alpha = picture.mode in ("RGBA", "LA", "PA") or (picture.mode == "P" and "transparency" in picture.info)
+    if features.check("webp"):
+        picture = picture.convert("RGBA" if has_alpha else "RGB")
+        picture.save(buffer, "WEBP", quality=IMAGE_QUALITY, method=4)
+        return buffer.getvalue(), "image/webp"
+    if has_alpha:
+        picture.convert("RGBA").save(buffer, "PNG", optimize=True)
+        return buffer.getvalue(), "image/png"
+    picture.convert("RGB").save(buffer, "JPEG", quality=IMAGE_QUALITY, optimize=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def packed_prompt(prompt, count):
+    """
+    Wrap a per-image prompt so one answer covers `count` images, each in its own section.
+
+    The images are sent labelled "Image 1" to "Image N"; `split_packed` splits the answer.
+    """
+    return (
+        f"You are given {count} images, labelled Image 1 to Image {count}. "
+        f"Answer the following separately for each image, in order. Start each answer with a line "
+        f"containing only its label, like \"Image 1\", and do not refer to the other images.\n\n{prompt}"
+    )
+
+
+def split_packed(text, count):
+    """
+    Split an answer to `packed_prompt` into one text per image.
+
+    Returns:
+    - list or None: The `count` answers in image order, or None if the answer does not have exactly one section per image.
+    """
+    headings = list(_PACK_HEADING.finditer(text or ""))
+    if [int(match.group(1)) for match in headings] != list(range(1, count + 1)):
+        return None
+    ends = [match.start() for match in headings[1:]] + [len(text)]
+    answers = [text[match.end():end].strip() for match, end in zip(headings, ends)]
+    return answers if all(answers) else None
@@ -0,0 +1,381 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+FINISHED_STATUSES = {"succeeded", "failed", "canceled"}
+# How often idle workers look for jobs submitted by other processes sharing the database.
+JOB_POLL_SECONDS = 1.0
+# A running job whose lease has not been renewed for this long is taken to be
+# abandoned by a crashed process, and runs again.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+
+class QueueClosedError(RuntimeError):
+    """Raised when a job is submitted while the queue is draining for shutdown."""
+
+
+class JobQueue:
+    def __init__(self, db_path, workers=4, ttl=86400, describe_error=None):
+        """
+        A persistent priority queue of jobs run by a bounded pool of async workers.
+
+        Job state lives in SQLite, so queued jobs survive a restart and several
+        processes can share one database file; claiming a job is a single
+        `BEGIN IMMEDIATE` transaction. Jobs run highest priority first, oldest
+        first within a priority. A running job holds a lease that its worker
+        renews; if the process dies, the job runs again once the lease lapses.
+        Finished jobs are kept for `ttl` seconds.
+
+        Another process holding the database's write lock can make a write wait
+        for up to 30 seconds, so the async methods write in a worker thread.
+        Reads use a connection of their own, which in WAL mode never waits for
+        a writer.
+
+        Parameters:
+        - db_path (str): Path of the SQLite file, or ":memory:".
+        - workers (int): Jobs run at the same time by this process.
+        - ttl (float): Seconds finished jobs and their results are kept.
+        - describe_error (callable, optional): Maps a handler exception to (status_code, message). Defaults to (500, str(e)).
+        """
+        self.db_path = db_path
+        self.workers = workers
+        self.ttl = ttl
+        self.describe_error = describe_error or (lambda e: (500, str(e)))
+        self.stats = {"submitted": 0, "succeeded": 0, "failed": 0, "canceled": 0, "requeued": 0, "recovered": 0}
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self._read_db = None
+        # An in-memory database is private to its connection, so reads share the writer's.
+        self._read_lock = self._lock if db_path == ":memory:" else threading.Lock()
+        self._workers = []
+        self._running = {}
+        self._wakeup = None
+        self._changed = None
+        self._closing = False
+
+    def register(self, kind, model, handler):
+        """
+        Register a job kind.
+
+        Parameters:
+        - kind (str): Name clients submit, e.g. "generate-text".
+        - model (type): Pydantic model the payload is validated against on submit.
+        - handler (callable): Coroutine function taking the validated model and returning a JSON-serializable result.
+        """
+        self._handlers[kind] = (model, handler)
+
+    @property
+    def kinds(self):
+        return sorted(self._handlers)
+
+    def start(self):
+        """Start the workers. Jobs queued before a restart are picked up at once."""
+        if self._workers:
+            return
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._changed = asyncio.Condition()
+        self._workers = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def submit(self, kind, payload, priority="normal"):
+        """
+        Validate and queue a job.
+
+        Returns:
+        - dict: The new job, as returned by `get`.
+
+        Raises:
+        - KeyError: If `kind` is not registered.
+        - pydantic.ValidationError: If the payload does not fit the kind's model.
+        - QueueClosedError: If the queue is draining.
+        """
+        if self._closing:
+            raise QueueClosedError("The job queue is shutting down.")
+        model, _ = self._handlers[kind]
+        payload = model.model_validate(payload).model_dump(mode="json")
+        self.start()
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self._insert, job_id, kind, json.dumps(payload), PRIORITIES[priority])
+        self.stats["submitted"] += 1
+        self._wakeup.set()
+        return await self.aget(job_id)
+
+    def get(self, job_id):
+        """
+        Return a job's state as a dict, or None if it is unknown or has expired.
+
+        The dict has "id", "kind", "priority", "status" (queued, running,
+        succeeded, failed or canceled), "version", "created_at", "started_at",
+        "finished_at", "result", "status_code" and "error".
+        """
+        rows = self._read(
+            "SELECT id, kind, priority, status, version, created, started, finished, result, status_code, error "
+            "FROM jobs WHERE id = ? AND (expires IS NULL OR expires > ?)",
+            (job_id, time.time()),
+        )
+        if not rows:
+            return None
+        row = rows[0]
+        names = {value: name for name, value in PRIORITIES.items()}
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "priority": names.get(row[2], str(row[2])),
+            "status": row[3],
+            "version": row[4],
+            "created_at": row[5],
+            "started_at": row[6],
+            "finished_at": row[7],
+            "result": json.loads(row[8]) if row[8] is not None else None,
+            "status_code": row[9],
+            "error": row[10],
+        }
+
+    async def aget(self, job_id):
+        """Same as `get`, but reads in a worker thread so the event loop is not blocked."""
+        return await asyncio.to_thread(self.get, job_id)
+
+    async def cancel(self, job_id):
+        """
+        Cancel a queued job, or a job running in this process.
+
+        Returns:
+        - dict or None: The job afterwards, or None if it is unknown.
+        """
+        self.stats["canceled"] += await asyncio.to_thread(self._cancel_queued, job_id)
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self._notify()
+        return await self.aget(job_id)
+
+    async def watch(self, job_id, poll=JOB_POLL_SECONDS):
+        """
+        Yield a job's state each time it changes, ending once it has finished.
+
+        Changes made in this process are seen at once; those made by other
+        processes sharing the database within `poll` seconds.
+        """
+        version = None
+        while True:
+            job = await self.aget(job_id)
+            if job is None:
+                return
+            if job["version"] != version:
+                version = job["version"]
+                yield job
+            if job["status"] in FINISHED_STATUSES:
+                return
+            if self._changed is None:
+                await asyncio.sleep(poll)
+                continue
+            async with self._changed:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), poll)
+                except asyncio.TimeoutError:
+                    pass
+
+    def snapshot(self):
+        """Return the counters and the number of jobs per status as a dict."""
+        counts = {}
+        if self._db is not None:
+            counts = dict(self._read("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return {
+            **self.stats,
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "running_here": len(self._running),
+            "workers": len(self._workers),
+        }
+
+    async def drain(self, timeout):
+        """
+        Stop for shutdown: accept no new jobs, let running ones finish for up to `timeout` seconds.
+
+        Jobs still running after that are cancelled and put back in the queue, to
+        run again after the next start. Queued jobs stay queued.
+        """
+        self._closing = True
+        for worker in self._workers:
+            worker.cancel()
+        running = list(self._running.values())
+        if running:
+            await asyncio.wait(running, timeout=timeout)
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, *self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _connect(self):
+        if self._db is None:
+            db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT, payload TEXT, priority INTEGER, status TEXT, "
+                "created REAL, started REAL, finished REAL, expires REAL, "
+                "result TEXT, status_code INTEGER, error TEXT, version INTEGER, owner TEXT, lease REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created)")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires)")
+            # Set only once the table exists, since readers check it without the lock.
+            self._db = db
+        return self._db
+
+    def _reader(self):
+        if self.db_path == ":memory:":
+            return self._connect()
+        if self._read_db is None:
+            if self._db is None:
+                with self._lock:
+                    self._connect()
+            self._read_db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        return self._read_db
+
+    def _read(self, query, params=()):
+        with self._read_lock:
+            return self._reader().execute(query, params).fetchall()
+
+    def _insert(self, job_id, kind, payload, priority):
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            self._prune(now)
+            db.execute(
+                "INSERT INTO jobs (id, kind, payload, priority, status, created, version, owner, lease) VALUES (?, ?, ?, ?, 'queued', ?, 0, '', 0)",
+                (job_id, kind, payload, priority, now),
+            )
+
+    def _cancel_queued(self, job_id):
+        now = time.time()
+        with self._lock:
+            return self._connect().execute(
+                "UPDATE jobs SET status = 'canceled', finished = ?, expires = ?, version = version + 1 "
+                "WHERE id = ? AND status = 'queued'",
+                (now, now + self.ttl, job_id),
+            ).rowcount
+
+    def _renew(self, job_id):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET lease = ? WHERE id = ? AND owner = ?",
+                (time.time() + JOB_LEASE_SECONDS, job_id, _OWNER),
+            )
+
+    def _requeue(self, job_id):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, owner = '', lease = 0, version = version + 1 "
+                "WHERE id = ? AND owner = ?",
+                (job_id, _OWNER),
+            )
+
+    async def _work(self):
+        while True:
+            claim = asyncio.ensure_future(asyncio.to_thread(self._claim))
+            try:
+                job = await asyncio.shield(claim)
+            except asyncio.CancelledError:
+                # The thread cannot be stopped; put back a job it claimed after all.
+                job = await claim
+                if job is not None:
+                    await asyncio.to_thread(self._requeue, job[0])
+                    self.stats["requeued"] += 1
+                raise
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # The job runs in its own task, which cancelling the worker leaves
+            # alone, so a drain can still wait for it.
+            job_id = job[0]
+            task = self._running[job_id] = asyncio.ensure_future(self._run(*job))
+            while not task.done():
+                await asyncio.wait([task], timeout=JOB_LEASE_SECONDS / 3)
+                if not task.done():
+                    await asyncio.to_thread(self._renew, job_id)
+
+    def _claim(self):
+        """Mark the next queued or abandoned job as running and return (id, kind, payload), or None."""
+        if self._closing:
+            return None
+        now = time.time()
+        claimable = "WHERE status = 'queued' OR (status = 'running' AND lease < ?) "
+        # Only take the write lock, shared with other processes, when there is something to claim.
+        if not self._read("SELECT 1 FROM jobs " + claimable + "LIMIT 1", (now,)):
+            return None
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT id, kind, payload, status FROM jobs " + claimable + "ORDER BY priority, created LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = 'running', started = ?, owner = ?, lease = ?, version = version + 1 WHERE id = ?",
+                        (now, _OWNER, now + JOB_LEASE_SECONDS, row[0]),
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        if row[3] == "running":
+            self.stats["recovered"] += 1
+        return row[:3]
+
+    async def _run(self, job_id, kind, payload):
+        await self._notify()
+        try:
+            model, handler = self._handlers[kind]
+            result = await handler(model.model_validate(json.loads(payload)))
+            await asyncio.to_thread(self._finish, job_id, "succeeded", result=json.dumps(result), status_code=200)
+        except asyncio.CancelledError:
+            if self._closing:
+                await asyncio.to_thread(self._requeue, job_id)
+                self.stats["requeued"] += 1
+            else:
+                await asyncio.to_thread(self._finish, job_id, "canceled")
+            raise
+        except Exception as e:
+            status_code, message = self.describe_error(e)
+            await asyncio.to_thread(self._finish, job_id, "failed", status_code=status_code, error=message)
+        finally:
+            self._running.pop(job_id, None)
+            await self._notify()
+
+    def _finish(self, job_id, status, result=None, status_code=None, error=None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, status_code = ?, error = ?, finished = ?, expires = ?, "
+                "version = version + 1 WHERE id = ? AND owner = ?",
+                (status, result, status_code, error, now, now + self.ttl, job_id, _OWNER),
+            )
+        self.stats[status] += 1
+
+    async def _notify(self):
+        if self._changed is not None:
+            async with self._changed:
+                self._changed.notify_all()
+
+    def _prune(self, now):
+        self._db.execute("DELETE FROM jobs WHERE expires IS NOT NULL AND expires <= ?", (now,))
+
+
+# Identifies this process's claims, so a job reclaimed by another process after its lease lapsed is left to that process.
+_OWNER = uuid.uuid4().hex
@@ -0,0 +1,101 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import time
+import uuid
+from typing import Any, Dict
+
+from PIL import Image
+
+# How long a local prediction takes, and how long of that it spends "starting".
+LOCAL_REPLICATE_SECONDS = float(os.getenv("LOCAL_REPLICATE_SECONDS", "3"))
+LOCAL_REPLICATE_STARTUP_SECONDS = 0.5
+
+
+class PredictionNotFound(LookupError):
+    """Raised for an unknown prediction ID, like Replicate's 404."""
+    status_code = 404
+
+
+class LocalPrediction:
+    def __init__(self, id, status, output=None, error=None):
+        self.id = id
+        self.status = status
+        self.output = output
+        self.error = error
+
+
+class LocalReplicateWrapper:
+    def __init__(self, seconds=None):
+        """
+        A stand-in for `ReplicateWrapper` that needs no network or API key.
+
+        Predictions move from "starting" to "processing" to "succeeded" on a
+        timer, and their output is a small PNG data URL whose colour depends on
+        the prompt. Prompts containing "fail" fail. Select it with
+        REPLICATE_BACKEND=local for development and load tests of the job
+        registry; `calls` counts the simulated upstream requests.
+
+        Parameters:
+        - seconds (float, optional): How long each prediction takes. Defaults to LOCAL_REPLICATE_SECONDS (3).
+        """
+        self.seconds = LOCAL_REPLICATE_SECONDS if seconds is None else seconds
+        self.calls = {"create": 0, "get": 0}
+        self._predictions = {}
+
+    async def astart_text_to_image(self,
+                                   prompt: str,
+                                   aspect_ratio: str = "3:2",
+                                   model: str = "stability-ai/stable-diffusion-3",
+                                   **kwargs):
+        """
+        Start a simulated image generation.
+
+        Same parameters as `ReplicateWrapper.astart_text_to_image`.
+
+        Returns:
+        - LocalPrediction: The new prediction, with `id` and `status` "starting".
+        """
+        self.calls["create"] += 1
+        # Suspend as a real request would, so concurrent submits interleave.
+        await asyncio.sleep(0)
+        prediction_id = uuid.uuid4().hex
+        self._predictions[prediction_id] = (time.monotonic(), prompt, aspect_ratio)
+        return LocalPrediction(prediction_id, "starting")
+
+    async def aget_prediction_status(self, prediction_id: str) -> Dict[str, Any]:
+        """
+        Get the status of a simulated prediction.
+
+        Same parameters and return value as `ReplicateWrapper.aget_prediction_status`.
+        """
+        self.calls["get"] += 1
+        await asyncio.sleep(0)
+        if prediction_id not in self._predictions:
+            raise PredictionNotFound(f"Prediction {prediction_id} not found")
+        started, prompt, aspect_ratio = self._predictions[prediction_id]
+        elapsed = time.monotonic() - started
+        status, output, error = "processing", None, None
+        if elapsed < min(LOCAL_REPLICATE_STARTUP_SECONDS, self.seconds):
+            status = "starting"
+        elif elapsed >= self.seconds:
+            if "fail" in prompt.lower():
+                status, error = "failed", "Simulated failure"
+            else:
+                status, output = "succeeded", [_placeholder(prompt, aspect_ratio)]
+        return {"id": prediction_id, "status": status, "output": output, "error": error, "logs": ""}
+
+
+def _placeholder(prompt, aspect_ratio):
+    """Return a small PNG data URL, coloured by the prompt and shaped by the aspect ratio."""
+    try:
+        width, height = (int(part) for part in aspect_ratio.split(":"))
+    except ValueError:
+        width, height = 1, 1
+    scale = 64 / max(width, height)
+    colour = tuple(hashlib.sha256(prompt.encode("utf-8")).digest()[:3])
+    buffer = io.BytesIO()
+    Image.new("RGB", (max(1, round(width * scale)), max(1, round(height * scale))), colour).save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
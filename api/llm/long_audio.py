@@ -0,0 +1,221 @@
+import asyncio
+import json
+import math
+import os
+import re
+import tempfile
+
+from .audio import chunk_seconds_for_size, detect_silences, extract_chunk, plan_chunks, probe_duration, transcode_for_speech
+
+LONG_AUDIO_CHUNK_SECONDS = float(os.getenv("LONG_AUDIO_CHUNK_SECONDS", "600"))
+LONG_AUDIO_OVERLAP_SECONDS = float(os.getenv("LONG_AUDIO_OVERLAP_SECONDS", "2"))
+LONG_AUDIO_CONCURRENCY = int(os.getenv("LONG_AUDIO_CONCURRENCY", "4"))
+# Largest file sent to a provider in one request; OpenAI and Groq reject uploads over 25 MB.
+LONG_AUDIO_MAX_CHUNK_BYTES = int(os.getenv("LONG_AUDIO_MAX_CHUNK_BYTES", str(24 * 1024 * 1024)))
+# Longest run of words repeated across a chunk boundary that is treated as overlap.
+MAX_REPEATED_WORDS = 20
+
+RESPONSE_FORMATS = ("json", "text", "verbose_json", "srt", "vtt")
+
+
+async def astream_long_transcription(wrapper, audio_path, chunk_seconds=None, overlap=None, concurrency=None, offsets=None, **params):
+    """
+    Transcribe a long recording in chunks, yielding each chunk's transcript in order.
+
+    The recording is split on silences into chunks of at most `chunk_seconds`,
+    which overlap by `overlap` seconds. Chunks are shortened further so that,
+    at the file's average bitrate, each stays under LONG_AUDIO_MAX_CHUNK_BYTES;
+    a chunk that still comes out larger is re-encoded as speech audio (see
+    `transcode_for_speech`) before it is sent. Up to `concurrency` chunks are
+    transcribed at the same time. A chunk is yielded once it and all chunks
+    before it are done. Its timestamps are shifted to the whole recording, and
+    the overlap is removed: segments belong to the chunk holding their
+    midpoint, and words repeated at the start of a chunk are dropped.
+
+    Parameters:
+    - wrapper: A speech-to-text wrapper, `WhisperWrapper` or `GroqSTTWrapper`.
+    - audio_path (str): Path of the recording.
+    - chunk_seconds (float, optional): Longest chunk. Defaults to LONG_AUDIO_CHUNK_SECONDS (600).
+    - overlap (float, optional): Seconds shared by neighbouring chunks. Defaults to LONG_AUDIO_OVERLAP_SECONDS (2).
+    - concurrency (int, optional): Chunks transcribed at once. Defaults to LONG_AUDIO_CONCURRENCY (4).
+    - offsets (OffsetMap, optional): Set when `audio_path` had silences cut out; times are mapped back to the untrimmed recording.
+    - params: Passed on to the wrapper's `atranscribe`, e.g. language, prompt or temperature.
+
+    Yields:
+    - dict: "index", "start", "end", "text", "segments" and, when requested, "words", with times in seconds from the start of the recording.
+    """
+    overlap = LONG_AUDIO_OVERLAP_SECONDS if overlap is None else overlap
+    semaphore = asyncio.Semaphore(concurrency or LONG_AUDIO_CONCURRENCY)
+    duration = await probe_duration(audio_path)
+    size = os.path.getsize(audio_path)
+    chunk_seconds = min(
+        chunk_seconds or LONG_AUDIO_CHUNK_SECONDS,
+        chunk_seconds_for_size(size, duration, LONG_AUDIO_MAX_CHUNK_BYTES, overlap),
+    )
+    silences = await detect_silences(audio_path) if duration > chunk_seconds else []
+    chunks = plan_chunks(duration, silences, target=chunk_seconds, overlap=overlap)
+    workdir = tempfile.TemporaryDirectory(prefix="long-audio-")
+    extension = os.path.splitext(audio_path)[1]
+
+    async def transcribe(index, chunk):
+        async with semaphore:
+            if len(chunks) == 1 and size <= LONG_AUDIO_MAX_CHUNK_BYTES:
+                return await _transcribe(wrapper, audio_path, params)
+            chunk_path = os.path.join(workdir.name, f"chunk-{index:04d}{extension}")
+            paths = [await extract_chunk(audio_path, chunk["start"], chunk["end"], chunk_path)]
+            try:
+                if os.path.getsize(chunk_path) > LONG_AUDIO_MAX_CHUNK_BYTES:
+                    # Louder or busier than the file's average bitrate suggested.
+                    paths.append(await transcode_for_speech(chunk_path))
+                return await _transcribe(wrapper, paths[-1], params)
+            finally:
+                for path in paths:
+                    os.unlink(path)
+
+    tasks = [asyncio.ensure_future(transcribe(index, chunk)) for index, chunk in enumerate(chunks)]
+    try:
+        previous_text = ""
+        for index, (chunk, task) in enumerate(zip(chunks, tasks)):
+            result = await task
+            lower = chunk["cut"] - overlap / 2 if index else -math.inf
+            upper = chunks[index + 1]["cut"] - overlap / 2 if index + 1 < len(chunks) else math.inf
+            piece = _place(result, chunk, lower, upper)
+            if offsets is not None:
+                _restore_times(piece, offsets)
+                if index + 1 == len(chunks):
+                    piece["end"] = offsets.original_duration
+            _drop_repeated_words(previous_text, piece)
+            piece["index"] = index
+            if piece["text"]:
+                previous_text = piece["text"]
+            yield piece
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        workdir.cleanup()
+
+
+async def atranscribe_long(wrapper, audio_path, response_format="json", **kwargs):
+    """
+    Transcribe a long recording in parallel chunks and stitch the result together.
+
+    Parameters:
+    - wrapper: A speech-to-text wrapper, `WhisperWrapper` or `GroqSTTWrapper`.
+    - audio_path (str): Path of the recording.
+    - response_format (str): "json", "text", "verbose_json", "srt" or "vtt".
+    - kwargs: Passed on to `astream_long_transcription`.
+
+    Returns:
+    - str: The transcript in the requested format; JSON formats are serialized.
+    """
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"Unsupported response format for long audio: {response_format}")
+    pieces = [piece async for piece in astream_long_transcription(wrapper, audio_path, **kwargs)]
+    return format_transcript(pieces, response_format)
+
+
+def format_transcript(pieces, response_format):
+    """Join chunk transcripts from `astream_long_transcription` into one transcript."""
+    text = " ".join(piece["text"] for piece in pieces if piece["text"])
+    if response_format == "text":
+        return text
+    if response_format == "json":
+        return json.dumps({"text": text})
+    segments = [segment for piece in pieces for segment in piece["segments"]]
+    for number, segment in enumerate(segments):
+        segment["id"] = number
+    if response_format == "srt":
+        return "\n".join(
+            f"{number}\n{_timestamp(segment['start'], ',')} --> {_timestamp(segment['end'], ',')}\n{segment['text'].strip()}\n"
+            for number, segment in enumerate(segments, 1)
+        )
+    if response_format == "vtt":
+        return "WEBVTT\n\n" + "\n".join(
+            f"{_timestamp(segment['start'], '.')} --> {_timestamp(segment['end'], '.')}\n{segment['text'].strip()}\n"
+            for segment in segments
+        )
+    transcript = {
+        "task": "transcribe",
+        "language": next((piece["language"] for piece in pieces if piece.get("language")), None),
+        "duration": pieces[-1]["end"] if pieces else 0.0,
+        "text": text,
+        "segments": segments,
+    }
+    words = [word for piece in pieces for word in piece.get("words", [])]
+    if words:
+        transcript["words"] = words
+    return json.dumps(transcript)
+
+
+async def _transcribe(wrapper, path, params):
+    response = await wrapper.atranscribe(path, response_format="verbose_json", **params)
+    return json.loads(response) if isinstance(response, str) else response
+
+
+def _place(result, chunk, lower, upper):
+    """Shift a chunk's timestamps to the recording and keep the segments and words it owns."""
+    offset = chunk["start"]
+
+    def owned(items):
+        kept = []
+        for item in items or []:
+            item = dict(item, start=item["start"] + offset, end=item["end"] + offset)
+            if lower <= (item["start"] + item["end"]) / 2 < upper:
+                kept.append(item)
+        return kept
+
+    piece = {"start": chunk["cut"], "end": chunk["end"], "language": result.get("language")}
+    if result.get("segments"):
+        piece["segments"] = owned(result["segments"])
+        piece["text"] = " ".join(segment["text"].strip() for segment in piece["segments"])
+    else:
+        piece["segments"] = []
+        piece["text"] = (result.get("text") or "").strip()
+    if result.get("words"):
+        piece["words"] = owned(result["words"])
+    return piece
+
+
+def _restore_times(piece, offsets):
+    """Move a piece's times from the trimmed audio to the original recording."""
+    piece["start"], piece["end"] = offsets.to_original(piece["start"]), offsets.to_original(piece["end"])
+    piece["segments"] = offsets.remap(piece["segments"])
+    if "words" in piece:
+        piece["words"] = offsets.remap(piece["words"])
+
+
+def _drop_repeated_words(previous_text, piece):
+    """Remove words at the start of a chunk that repeat the end of the previous one."""
+    previous = _normalized_words(previous_text)[-MAX_REPEATED_WORDS:]
+    current = _normalized_words(piece["text"])[:MAX_REPEATED_WORDS]
+    repeated = next(
+        (count for count in range(min(len(previous), len(current)), 1, -1) if previous[-count:] == current[:count]),
+        0,
+    )
+    if not repeated:
+        return
+    if not piece["segments"]:
+        piece["text"] = " ".join(piece["text"].split()[repeated:])
+        return
+    remaining = repeated
+    while remaining and piece["segments"]:
+        words = piece["segments"][0]["text"].split()
+        if len(words) > remaining:
+            piece["segments"][0]["text"] = " " + " ".join(words[remaining:])
+            break
+        remaining -= len(words)
+        piece["segments"].pop(0)
+    piece["text"] = " ".join(segment["text"].strip() for segment in piece["segments"])
+
+
+def _normalized_words(text):
+    return [re.sub(r"[^\w']", "", word.lower()) for word in text.split()]
+
+
+def _timestamp(seconds, separator):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
@@ -0,0 +1,82 @@
+try:
+    from prometheus_client import Counter, Histogram
+except ImportError:  # Metrics are optional outside the API service.
+    Counter = Histogram = None
+
+# Buckets for whole provider calls, which range from sub-second to minutes.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300)
+FIRST_TOKEN_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, 20)
+
+if Counter is not None:
+    PROVIDER_LATENCY = Histogram(
+        "llm_provider_request_duration_seconds",
+        "Duration of successful provider calls.",
+        ["provider", "model", "method"],
+        buckets=LATENCY_BUCKETS,
+    )
+    TIME_TO_FIRST_TOKEN = Histogram(
+        "llm_provider_time_to_first_token_seconds",
+        "Time from starting a streamed provider call to its first event.",
+        ["provider", "model"],
+        buckets=FIRST_TOKEN_BUCKETS,
+    )
+    TOKENS = Counter(
+        "llm_provider_tokens_total",
+        "Tokens reported by providers.",
+        ["provider", "model", "direction"],
+    )
+    ERRORS = Counter(
+        "llm_provider_errors_total",
+        "Failed provider call attempts, by kind: rate_limited, timeout, transient, circuit_open or client.",
+        ["provider", "model", "kind"],
+    )
+    RETRIES = Counter(
+        "llm_provider_retries_total",
+        "Provider calls retried after a transient error.",
+        ["provider", "model"],
+    )
+
+
+def record_success(provider, model, method, latency, result):
+    """
+    Record a successful provider call.
+
+    Parameters:
+    - provider (str): The provider name.
+    - model (str): The model name.
+    - method (str): The wrapper method, e.g. "agenerate_text".
+    - latency (float, optional): Seconds the call took; None for streams.
+    - result: The call's return value; token counts are taken from (text, input_tokens, output_tokens) tuples.
+    """
+    if Counter is None:
+        return
+    if latency is not None:
+        PROVIDER_LATENCY.labels(provider, model, method).observe(latency)
+    if isinstance(result, tuple) and len(result) == 3 and isinstance(result[1], int):
+        record_tokens(provider, model, result[1], result[2])
+
+
+def record_tokens(provider, model, input_tokens, output_tokens):
+    """Add a call's token usage to the token counters."""
+    if Counter is None:
+        return
+    TOKENS.labels(provider, model, "input").inc(input_tokens or 0)
+    TOKENS.labels(provider, model, "output").inc(output_tokens or 0)
+
+
+def record_first_token(provider, model, seconds):
+    """Record the time a streamed call took to produce its first event."""
+    if Counter is not None:
+        TIME_TO_FIRST_TOKEN.labels(provider, model).observe(seconds)
+
+
+def record_error(provider, model, kind):
+    """Count a failed call attempt of the given kind."""
+    if Counter is not None:
+        ERRORS.labels(provider, model, kind).inc()
+
+
+def record_retry(provider, model):
+    """Count a retry after a transient error."""
+    if Counter is not None:
+        RETRIES.labels(provider, model).inc()
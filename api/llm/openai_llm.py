@@ -1,6 +1,11 @@
-import openai
 import os
-import base64
+import asyncio
+from typing import BinaryIO, List, Union
+from .clients import get_client
+from .images import prepare_image
+from .ratelimit import rate_limited, estimate_text_tokens, estimate_image_tokens, estimate_images_tokens
+from .resilience import resilient
+from .singleflight import single_flight
 
 class OpenAIWrapper:
     def __init__(self, api_key=None, model="gpt-4o", system_prompt=None):
@@ -17,7 +22,8 @@ class OpenAIWrapper:
         self.system_prompt = system_prompt
         if not self.api_key:
             raise ValueError("API key must be provided either as a parameter or set in the environment variables.")
-        openai.api_key = self.api_key
+        self.client = get_client("openai", self.api_key)
+        self.async_client = get_client("openai", self.api_key, asynchronous=True)
 
     @property
     def system_prompt(self):
@@ -29,6 +35,9 @@ class OpenAIWrapper:
         """Sets the system prompt."""
         self._system_prompt = value
     
+    @single_flight("openai")
+    @resilient("openai")
+    @rate_limited("openai", cost=estimate_text_tokens)
     def generate_text(self, prompt, max_tokens=4000, temperature=0.7, **kwargs):
         """
         Generate text using the specified model.
@@ -42,12 +51,11 @@ class OpenAIWrapper:
         Returns:
         - Generated text from the model.
         """
-        client = openai.OpenAI()  # Initialize the OpenAI client
         messages = []
         if self.system_prompt:
             messages.append({"role": "system", "content": self.system_prompt})
         messages.append({"role": "user", "content": prompt})
-        response = client.chat.completions.create(
+        response = self.client.chat.completions.create(
             model = self.model,
             messages=messages,
             max_tokens=max_tokens,
@@ -56,23 +64,80 @@ class OpenAIWrapper:
         )
         return response.choices[0].message.content, int(response.usage.prompt_tokens), int(response.usage.completion_tokens)
 
+    @single_flight("openai")
+    @resilient("openai")
+    @rate_limited("openai", cost=estimate_text_tokens)
+    async def agenerate_text(self, prompt, max_tokens=4000, temperature=0.7, **kwargs):
+        """
+        Asynchronously generate text using the specified model.
+
+        Same parameters and return value as `generate_text`, but awaits the async
+        OpenAI client so the calling event loop is never blocked.
+        """
+        messages = []
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        response = await self.async_client.chat.completions.create(
+            model = self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **kwargs
+        )
+        return response.choices[0].message.content, int(response.usage.prompt_tokens), int(response.usage.completion_tokens)
+
+    @resilient("openai")
+    @rate_limited("openai", cost=estimate_text_tokens)
+    async def astream_text(self, prompt, max_tokens=4000, temperature=0.7, **kwargs):
+        """
+        Asynchronously stream generated text from the specified model.
+
+        Parameters are the same as `generate_text`.
+
+        Yields:
+        - {"type": "delta", "text": str} for each chunk of generated text, then a final
+          {"type": "usage", "input_tokens": int, "output_tokens": int}.
+        """
+        messages = []
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        stream = await self.async_client.chat.completions.create(
+            model = self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs
+        )
+        input_tokens = output_tokens = 0
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield {"type": "delta", "text": chunk.choices[0].delta.content}
+            if chunk.usage:
+                input_tokens, output_tokens = int(chunk.usage.prompt_tokens), int(chunk.usage.completion_tokens)
+        yield {"type": "usage", "input_tokens": input_tokens, "output_tokens": output_tokens}
+
+    @resilient("openai", observe=False)
+    @rate_limited("openai", cost=estimate_image_tokens)
     def image_to_text(self, 
-                      image_path: str, 
+                      image_path: Union[str, BinaryIO], 
                       prompt: str = "Describe this image in detail.",
                       max_tokens: int = 1000) -> str:
             """
             Convert an image to text description using GPT-4 Vision.
 
             Parameters:
-            - image_path (str): Path to the image file.
+            - image_path (str or file): Path to the image file, or an open binary file, which is rewound first. Large images are scaled down to what the model uses; see `prepare_image`.
             - prompt (str): The prompt to guide the model's description. Default is "Describe this image in detail."
             - max_tokens (int): The maximum number of tokens to generate. Default is 1000.
 
             Returns:
             - str: The generated text description of the image.
             """
-            with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+            base64_image, media_type = prepare_image(image_path, "openai")
 
             response = self.client.chat.completions.create(
                 model="gpt-4-vision-preview",
@@ -84,7 +149,7 @@ class OpenAIWrapper:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                    "url": f"data:{media_type};base64,{base64_image}"
                                 }
                             }
                         ]
@@ -93,4 +158,94 @@ class OpenAIWrapper:
                 max_tokens=max_tokens
             )
             
-            return response.choices[0].message.content
\ No newline at end of file
+            return response.choices[0].message.content
+
+    @resilient("openai", observe=False)
+    @rate_limited("openai", cost=estimate_image_tokens)
+    async def aimage_to_text(self,
+                             image_path: Union[str, BinaryIO],
+                             prompt: str = "Describe this image in detail.",
+                             max_tokens: int = 1000) -> str:
+            """
+            Asynchronously convert an image to text description using GPT-4 Vision.
+
+            Same parameters and return value as `image_to_text`.
+            """
+            base64_image, media_type = await asyncio.to_thread(prepare_image, image_path, "openai")
+
+            response = await self.async_client.chat.completions.create(
+                model="gpt-4-vision-preview",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:{media_type};base64,{base64_image}"
+                                }
+                            }
+                        ]
+                    }
+                ],
+                max_tokens=max_tokens
+            )
+
+            return response.choices[0].message.content
+
+    @resilient("openai", observe=False)
+    @rate_limited("openai", cost=estimate_images_tokens)
+    def images_to_text(self,
+                       image_paths: List[Union[str, BinaryIO]],
+                       prompt: str,
+                       max_tokens: int = 4000) -> str:
+        """
+        Answer one prompt about several images in a single GPT-4 Vision request.
+
+        The images follow the prompt, each preceded by its label, "Image 1" to
+        "Image N", so the prompt can refer to them; see `packed_prompt`.
+
+        Parameters:
+        - image_paths (list): Paths of the image files, or open binary files. Each is prepared as in `image_to_text`.
+        - prompt (str): The prompt covering all the images.
+        - max_tokens (int): The maximum number of tokens to generate. Default is 4000.
+
+        Returns:
+        - str: The model's answer.
+        """
+        images = [prepare_image(image_path, "openai") for image_path in image_paths]
+        response = self.client.chat.completions.create(
+            model="gpt-4-vision-preview",
+            messages=_images_messages(images, prompt),
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content
+
+    @resilient("openai", observe=False)
+    @rate_limited("openai", cost=estimate_images_tokens)
+    async def aimages_to_text(self,
+                              image_paths: List[Union[str, BinaryIO]],
+                              prompt: str,
+                              max_tokens: int = 4000) -> str:
+        """
+        Asynchronously answer one prompt about several images in a single GPT-4 Vision request.
+
+        Same parameters and return value as `images_to_text`.
+        """
+        images = await asyncio.to_thread(lambda: [prepare_image(image_path, "openai") for image_path in image_paths])
+        response = await self.async_client.chat.completions.create(
+            model="gpt-4-vision-preview",
+            messages=_images_messages(images, prompt),
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content
+
+
+def _images_messages(images, prompt):
+    """Build the single-turn message list for a multi-image request from (base64 data, media type) pairs."""
+    content = [{"type": "text", "text": prompt}]
+    for number, (image_data, media_type) in enumerate(images, 1):
+        content.append({"type": "text", "text": f"Image {number}:"})
+        content.append({"type": "image_url", "image_url": {"url": f"data:{media_type};base64,{image_data}"}})
+    return [{"role": "user", "content": content}]
@@ -0,0 +1,400 @@
+import asyncio
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Rate-limit headers each provider returns, mapped to the bucket field they inform.
+# Groq's request headers count per day, so only its token headers are used.
+RATE_LIMIT_HEADERS = {
+    "openai": {
+        "rpm": "x-ratelimit-limit-requests",
+        "tpm": "x-ratelimit-limit-tokens",
+        "requests": "x-ratelimit-remaining-requests",
+        "tokens": "x-ratelimit-remaining-tokens",
+    },
+    "groq": {
+        "tpm": "x-ratelimit-limit-tokens",
+        "tokens": "x-ratelimit-remaining-tokens",
+    },
+    "anthropic": {
+        "rpm": "anthropic-ratelimit-requests-limit",
+        "tpm": "anthropic-ratelimit-tokens-limit",
+        "requests": "anthropic-ratelimit-requests-remaining",
+        "tokens": "anthropic-ratelimit-tokens-remaining",
+    },
+}
+# A bucket found to have no limits is not read from the database again for this
+# long, unless this process learns a limit for it sooner.
+UNLIMITED_RECHECK_SECONDS = 30.0
+
+
+class RateLimiter:
+    def __init__(self, db_path, max_sleep=5.0):
+        """
+        Initialize a token-bucket rate limiter shared by every process using `db_path`.
+
+        Each provider/model has a requests-per-minute and a tokens-per-minute bucket.
+        A limit of 0 means unlimited. Limits start from `RATE_LIMIT_<PROVIDER>_RPM` /
+        `RATE_LIMIT_<PROVIDER>_TPM` and are tightened by the provider's rate-limit
+        response headers as they are seen. Calls to a bucket with no limits skip
+        the database. Token costs are estimates taken up front; the unused part is
+        given back with `refund` once the provider reports the real usage.
+
+        Parameters:
+        - db_path (str): Path of the SQLite file holding the buckets.
+        - max_sleep (float): Longest single sleep while queued, so learned limits apply quickly.
+        """
+        self.db_path = db_path
+        self.max_sleep = max_sleep
+        self.stats = {"acquired": 0, "queued": 0, "waited_seconds": 0.0, "refunded_tokens": 0}
+        self._local = threading.local()
+        self._unlimited = {}
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "bucket TEXT PRIMARY KEY, rpm REAL, tpm REAL, requests REAL, tokens REAL, updated REAL)"
+            )
+
+    def acquire(self, provider, model, tokens=0):
+        """
+        Block until one request and `tokens` tokens are available for the provider/model.
+
+        Parameters:
+        - provider (str): The provider name.
+        - model (str): The model name.
+        - tokens (int): Estimated tokens the call will consume.
+
+        Returns:
+        - float: The tokens taken from the bucket, 0 when it has no token limit. Pass what the call did not use to `refund`.
+        """
+        if self._known_unlimited(provider, model):
+            self._record(0.0)
+            return 0
+        waited = 0.0
+        while True:
+            wait, taken = self._try_acquire(provider, model, tokens)
+            if wait <= 0:
+                self._record(waited)
+                return taken
+            wait = min(wait, self.max_sleep)
+            time.sleep(wait)
+            waited += wait
+
+    async def aacquire(self, provider, model, tokens=0):
+        """
+        Asynchronously wait until one request and `tokens` tokens are available.
+
+        Same parameters and return value as `acquire`; waiting never blocks the event loop.
+        """
+        if self._known_unlimited(provider, model):
+            self._record(0.0)
+            return 0
+        waited = 0.0
+        while True:
+            wait, taken = await asyncio.to_thread(self._try_acquire, provider, model, tokens)
+            if wait <= 0:
+                self._record(waited)
+                return taken
+            wait = min(wait, self.max_sleep)
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def refund(self, provider, model, tokens):
+        """
+        Give back tokens taken by `acquire` that a call did not use.
+
+        Parameters:
+        - provider (str): The provider name.
+        - model (str): The model name.
+        - tokens (float): Tokens to return to the bucket.
+        """
+        if tokens <= 0:
+            return
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            _, tpm, _, available = self._bucket(db, provider, model)
+            if tpm:
+                db.execute(
+                    "UPDATE buckets SET tokens = ? WHERE bucket = ?",
+                    (min(tpm, available + tokens), f"{provider}:{model}"),
+                )
+        self.stats["refunded_tokens"] += tokens
+
+    def update_from_headers(self, provider, model, headers, status_code=200):
+        """
+        Learn limits and remaining budget from a provider response.
+
+        Parameters:
+        - provider (str): The provider name.
+        - model (str): The model the request was for.
+        - headers (Mapping): The response headers.
+        - status_code (int): The response status; a 429 empties the buckets so every process backs off.
+        """
+        learned = self.parse_headers(provider, headers, status_code)
+        if learned:
+            self.learn(provider, model, learned)
+
+    @staticmethod
+    def parse_headers(provider, headers, status_code=200):
+        """Return the bucket fields a provider response informs, as a dict; empty when there is nothing to learn."""
+        names = RATE_LIMIT_HEADERS.get(provider)
+        if not names:
+            return {}
+        learned = {}
+        for field, header in names.items():
+            value = headers.get(header)
+            if value is None:
+                continue
+            try:
+                learned[field] = float(value)
+            except ValueError:
+                continue
+        if status_code == 429:
+            learned["requests"] = 0.0
+            learned["tokens"] = 0.0
+        return learned
+
+    def learn(self, provider, model, learned):
+        """Apply fields returned by `parse_headers` to a bucket."""
+        self._unlimited.pop(f"{provider}:{model}", None)
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            rpm, tpm, requests, tokens = self._bucket(db, provider, model)
+            # A bucket that was unlimited starts full once its limit is first learned.
+            if not rpm and learned.get("rpm"):
+                requests = learned["rpm"]
+            if not tpm and learned.get("tpm"):
+                tokens = learned["tpm"]
+            if learned.get("rpm"):
+                rpm = min(rpm, learned["rpm"]) if rpm and self._configured(provider, "RPM") else learned["rpm"]
+            if learned.get("tpm"):
+                tpm = min(tpm, learned["tpm"]) if tpm and self._configured(provider, "TPM") else learned["tpm"]
+            if "requests" in learned:
+                requests = min(requests, learned["requests"])
+            if "tokens" in learned:
+                tokens = min(tokens, learned["tokens"])
+            db.execute(
+                "UPDATE buckets SET rpm = ?, tpm = ?, requests = ?, tokens = ? WHERE bucket = ?",
+                (rpm, tpm, requests, tokens, f"{provider}:{model}"),
+            )
+
+    def _try_acquire(self, provider, model, cost):
+        """Take from the buckets if possible. Return (seconds to wait, tokens taken)."""
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            rpm, tpm, requests, tokens = self._bucket(db, provider, model)
+            if not rpm and not tpm:
+                self._unlimited[f"{provider}:{model}"] = time.monotonic()
+                return 0.0, 0
+            # A call larger than the whole per-minute budget is let through once the bucket is full.
+            cost = min(cost, tpm) if tpm else 0
+            wait = 0.0
+            if rpm and requests < 1:
+                wait = max(wait, (1 - requests) * 60.0 / rpm)
+            if tpm and tokens < cost:
+                wait = max(wait, (cost - tokens) * 60.0 / tpm)
+            if wait == 0:
+                db.execute(
+                    "UPDATE buckets SET requests = ?, tokens = ? WHERE bucket = ?",
+                    (requests - 1 if rpm else requests, tokens - cost if tpm else tokens, f"{provider}:{model}"),
+                )
+            return wait, cost if wait == 0 else 0
+
+    def _bucket(self, db, provider, model):
+        """Return (rpm, tpm, requests, tokens) for a bucket, refilled up to now."""
+        name = f"{provider}:{model}"
+        now = time.time()
+        row = db.execute("SELECT rpm, tpm, requests, tokens, updated FROM buckets WHERE bucket = ?", (name,)).fetchone()
+        if row is None:
+            rpm = float(os.getenv(f"RATE_LIMIT_{provider.upper()}_RPM", "0"))
+            tpm = float(os.getenv(f"RATE_LIMIT_{provider.upper()}_TPM", "0"))
+            db.execute("INSERT INTO buckets VALUES (?, ?, ?, ?, ?, ?)", (name, rpm, tpm, rpm, tpm, now))
+            return rpm, tpm, rpm, tpm
+        rpm, tpm, requests, tokens, updated = row
+        elapsed = max(0.0, now - updated)
+        requests = min(rpm, requests + elapsed * rpm / 60.0)
+        tokens = min(tpm, tokens + elapsed * tpm / 60.0)
+        db.execute("UPDATE buckets SET requests = ?, tokens = ?, updated = ? WHERE bucket = ?", (requests, tokens, now, name))
+        return rpm, tpm, requests, tokens
+
+    def _known_unlimited(self, provider, model):
+        seen = self._unlimited.get(f"{provider}:{model}")
+        return seen is not None and time.monotonic() - seen < UNLIMITED_RECHECK_SECONDS
+
+    @staticmethod
+    def _configured(provider, kind):
+        return float(os.getenv(f"RATE_LIMIT_{provider.upper()}_{kind}", "0")) > 0
+
+    def _record(self, waited):
+        self.stats["acquired"] += 1
+        if waited:
+            self.stats["queued"] += 1
+            self.stats["waited_seconds"] += waited
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+        return _Transaction(db)
+
+
+class _Transaction:
+    """Commit on success and roll back on error around an explicit BEGIN."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.db.in_transaction:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """
+    Return the process-wide rate limiter, or None when `RATE_LIMIT_ENABLED` is off.
+
+    The SQLite file defaults to one in the system temp directory so every worker
+    and the Streamlit app on the host share it; set `RATE_LIMIT_DB` to override.
+    """
+    global _limiter
+    if os.getenv("RATE_LIMIT_ENABLED", "1").lower() in ("0", "false", "no"):
+        return None
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                db_path = os.getenv("RATE_LIMIT_DB") or os.path.join(tempfile.gettempdir(), "llm_rate_limits.sqlite")
+                _limiter = RateLimiter(db_path)
+    return _limiter
+
+
+def estimate_text_tokens(arguments):
+    """Estimate the tokens a text call consumes: roughly 4 characters per prompt token plus max_tokens."""
+    return len(arguments.get("prompt") or "") // 4 + int(arguments.get("max_tokens") or 0)
+
+
+def estimate_image_tokens(arguments):
+    """Estimate the tokens an image description call consumes: a flat image allowance plus prompt and max_tokens."""
+    return 1000 + estimate_text_tokens(arguments)
+
+
+def estimate_images_tokens(arguments):
+    """Estimate the tokens a multi-image description call consumes: the image allowance per image plus prompt and max_tokens."""
+    return 1000 * len(arguments.get("image_paths") or ()) + estimate_text_tokens(arguments)
+
+
+def reported_tokens(result):
+    """Return the tokens a call used, from a (text, input_tokens, output_tokens) result or a stream's usage item; None if not reported."""
+    if isinstance(result, tuple) and len(result) == 3 and isinstance(result[1], int):
+        return result[1] + result[2]
+    if isinstance(result, dict) and result.get("type") == "usage":
+        return result["input_tokens"] + result["output_tokens"]
+    return None
+
+
+def rate_limited(provider, cost=None):
+    """
+    Decorate a wrapper method so each call first waits for rate-limit budget.
+
+    Works on sync methods, coroutines and async generators. The bucket is the
+    provider and the wrapper's `model`. When the call reports its usage, the
+    tokens estimated but not used are refunded.
+
+    Parameters:
+    - provider (str): The provider name.
+    - cost (callable, optional): Maps the call's bound arguments to an estimated token count.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        def tokens(args, kwargs):
+            if cost is None:
+                return 0
+            bound = signature.bind(None, *args, **kwargs)
+            bound.apply_defaults()
+            return cost(bound.arguments)
+
+        if inspect.isasyncgenfunction(method):
+            @functools.wraps(method)
+            async def wrapper(self, *args, **kwargs):
+                limiter = get_limiter()
+                taken = 0
+                if limiter is not None:
+                    taken = await limiter.aacquire(provider, self.model, tokens(args, kwargs))
+                async for item in method(self, *args, **kwargs):
+                    used = reported_tokens(item)
+                    if taken and used is not None and used < taken:
+                        await asyncio.to_thread(limiter.refund, provider, self.model, taken - used)
+                    yield item
+        elif inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def wrapper(self, *args, **kwargs):
+                limiter = get_limiter()
+                taken = 0
+                if limiter is not None:
+                    taken = await limiter.aacquire(provider, self.model, tokens(args, kwargs))
+                result = await method(self, *args, **kwargs)
+                used = reported_tokens(result)
+                if taken and used is not None and used < taken:
+                    await asyncio.to_thread(limiter.refund, provider, self.model, taken - used)
+                return result
+        else:
+            @functools.wraps(method)
+            def wrapper(self, *args, **kwargs):
+                limiter = get_limiter()
+                taken = 0
+                if limiter is not None:
+                    taken = limiter.acquire(provider, self.model, tokens(args, kwargs))
+                result = method(self, *args, **kwargs)
+                used = reported_tokens(result)
+                if taken and used is not None and used < taken:
+                    limiter.refund(provider, self.model, taken - used)
+                return result
+        return wrapper
+    return decorator
+
+
+def _request_model(request):
+    """Best-effort read of the model name from a JSON request body."""
+    try:
+        return json.loads(request.content).get("model")
+    except Exception:
+        return None
+
+
+def response_hooks(provider):
+    """
+    Return httpx event hooks that feed a provider's rate-limit headers to the limiter.
+
+    Returns:
+    - tuple: (sync_hooks, async_hooks) dictionaries for httpx.Client / httpx.AsyncClient.
+    """
+    def learn(response):
+        limiter = get_limiter()
+        model = _request_model(response.request)
+        if limiter is not None and model:
+            limiter.update_from_headers(provider, model, response.headers, response.status_code)
+
+    async def alearn(response):
+        limiter = get_limiter()
+        if limiter is None:
+            return
+        # Only responses that carry rate-limit information reach the database.
+        learned = limiter.parse_headers(provider, response.headers, response.status_code)
+        model = _request_model(response.request) if learned else None
+        if model:
+            await asyncio.to_thread(limiter.learn, provider, model, learned)
+
+    return {"response": [learn]}, {"response": [alearn]}
@@ -0,0 +1,125 @@
+import json
+import os
+
+# Environment variable holding each provider's API key.
+PROVIDER_KEYS = {
+    "openai": "OPENAI_API_KEY",
+    "groq": "GROQ_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+}
+
+# Known models. Prices are USD per million tokens. `quality` is a relative 1-10
+# ranking used to order models for quality-tier requests, and `latency` the
+# typical seconds for a full response, used until live latencies are observed.
+MODELS = {
+    ("anthropic", "claude-3-5-sonnet-20240620"): {
+        "context_window": 200000,
+        "input_price": 3.0,
+        "output_price": 15.0,
+        "capabilities": ["text", "vision"],
+        "quality": 10,
+        "latency": 12.0,
+    },
+    ("openai", "gpt-4o"): {
+        "context_window": 128000,
+        "input_price": 5.0,
+        "output_price": 15.0,
+        "capabilities": ["text", "vision"],
+        "quality": 9,
+        "latency": 10.0,
+    },
+    ("openai", "gpt-4-turbo"): {
+        "context_window": 128000,
+        "input_price": 10.0,
+        "output_price": 30.0,
+        "capabilities": ["text", "vision"],
+        "quality": 8,
+        "latency": 20.0,
+    },
+    ("groq", "llama3-70b-8192"): {
+        "context_window": 8192,
+        "input_price": 0.59,
+        "output_price": 0.79,
+        "capabilities": ["text"],
+        "quality": 7,
+        "latency": 3.0,
+    },
+    ("openai", "gpt-4o-mini"): {
+        "context_window": 128000,
+        "input_price": 0.15,
+        "output_price": 0.6,
+        "capabilities": ["text", "vision"],
+        "quality": 7,
+        "latency": 6.0,
+    },
+    ("anthropic", "claude-3-haiku-20240307"): {
+        "context_window": 200000,
+        "input_price": 0.25,
+        "output_price": 1.25,
+        "capabilities": ["text", "vision"],
+        "quality": 6,
+        "latency": 5.0,
+    },
+    ("groq", "mixtral-8x7b-32768"): {
+        "context_window": 32768,
+        "input_price": 0.24,
+        "output_price": 0.24,
+        "capabilities": ["text"],
+        "quality": 5,
+        "latency": 3.0,
+    },
+    ("groq", "llama3-8b-8192"): {
+        "context_window": 8192,
+        "input_price": 0.05,
+        "output_price": 0.08,
+        "capabilities": ["text"],
+        "quality": 5,
+        "latency": 1.5,
+    },
+    ("openai", "whisper-1"): {
+        "context_window": 0,
+        "input_price": 0.0,
+        "output_price": 0.0,
+        "capabilities": ["speech"],
+        "quality": 8,
+        "latency": 10.0,
+    },
+    ("groq", "whisper-large-v3"): {
+        "context_window": 0,
+        "input_price": 0.0,
+        "output_price": 0.0,
+        "capabilities": ["speech"],
+        "quality": 8,
+        "latency": 3.0,
+    },
+}
+
+
+def load_models():
+    """
+    Return the model registry, extended or overridden by `LLM_MODELS`.
+
+    The variable holds JSON mapping "provider:model" to the same fields as `MODELS`,
+    e.g. {"openai:gpt-4o": {"latency": 6}}. Fields not given keep their defaults,
+    so an existing entry can be tuned without restating it.
+
+    Returns:
+    - dict: {(provider, model): spec}
+    """
+    models = {key: dict(spec) for key, spec in MODELS.items()}
+    raw = os.getenv("LLM_MODELS")
+    if raw:
+        for name, spec in json.loads(raw).items():
+            key = tuple(name.split(":", 1))
+            models[key] = {**models.get(key, {}), **spec}
+    return models
+
+
+def provider_configured(provider):
+    """Whether an API key for the provider is set in the environment."""
+    return bool(os.getenv(PROVIDER_KEYS.get(provider, "")))
+
+
+def estimate_cost(spec, input_tokens, output_tokens):
+    """Return the USD cost of a call to a model with the given token counts."""
+    return (input_tokens * spec["input_price"] + output_tokens * spec["output_price"]) / 1e6
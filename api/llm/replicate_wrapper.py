@@ -1,8 +1,22 @@
 import os
-import replicate
 import time
+import asyncio
+from .clients import get_client
 from typing import Optional, Dict, Any
 
+# Polling of running predictions: the first check comes after POLL_MIN_INTERVAL
+# seconds, and the wait grows by POLL_BACKOFF up to POLL_MAX_INTERVAL while the
+# status stays the same. Most images take a few seconds; some models take minutes.
+POLL_MIN_INTERVAL = float(os.getenv("REPLICATE_POLL_MIN_INTERVAL", "1"))
+POLL_MAX_INTERVAL = float(os.getenv("REPLICATE_POLL_MAX_INTERVAL", "15"))
+POLL_BACKOFF = 1.5
+TERMINAL_STATUSES = {"succeeded", "failed", "canceled"}
+
+
+def next_poll_interval(interval, changed):
+    """Return the wait before the next status check: reset after a change, otherwise backed off."""
+    return POLL_MIN_INTERVAL if changed else min(POLL_MAX_INTERVAL, interval * POLL_BACKOFF)
+
 class ReplicateWrapper:
     def __init__(self, api_key=None):
         """
@@ -14,7 +28,7 @@ class ReplicateWrapper:
         self.api_key = api_key or os.getenv("REPLICATE_API_TOKEN")
         if not self.api_key:
             raise ValueError("API key must be provided either as a parameter or set in the environment variables.")
-        #os.environ["REPLICATE_API_TOKEN"] = self.api_key
+        self.client = get_client("replicate", self.api_key)
 
     def text_to_image(self, 
                       prompt: str, 
@@ -39,19 +53,69 @@ class ReplicateWrapper:
             **kwargs
         }
         
-        prediction = replicate.models.predictions.create(
+        prediction = self.client.models.predictions.create(
             model,
             input=input_data
         )
         
+        interval = POLL_MIN_INTERVAL
         while prediction.status != "succeeded":
-            time.sleep(2)
+            time.sleep(interval)
+            status = prediction.status
             prediction.reload()
             if prediction.status in {"failed" , "canceled"}:
                 raise Exception("Image generation failed")
+            interval = next_poll_interval(interval, prediction.status != status)
 
         return prediction.output[0]  # Return the URL of the generated image
 
+    async def astart_text_to_image(self,
+                                   prompt: str,
+                                   aspect_ratio: str = "3:2",
+                                   model: str = "stability-ai/stable-diffusion-3",
+                                   **kwargs):
+        """
+        Asynchronously start an image generation and return without waiting for it.
+
+        Parameters are the same as `text_to_image`.
+
+        Returns:
+        - Prediction: The created Replicate prediction; poll it by `prediction.id`.
+        """
+        input_data = {
+            "prompt": prompt,
+            "aspect_ratio": aspect_ratio,
+            **kwargs
+        }
+
+        return await self.client.models.predictions.async_create(
+            model,
+            input=input_data
+        )
+
+    async def atext_to_image(self,
+                             prompt: str,
+                             aspect_ratio: str = "3:2",
+                             model: str = "stability-ai/stable-diffusion-3",
+                             **kwargs) -> str:
+        """
+        Asynchronously generate an image from text, polling without blocking the event loop.
+
+        Same parameters and return value as `text_to_image`.
+        """
+        prediction = await self.astart_text_to_image(prompt, aspect_ratio, model, **kwargs)
+
+        interval = POLL_MIN_INTERVAL
+        while prediction.status != "succeeded":
+            await asyncio.sleep(interval)
+            status = prediction.status
+            await prediction.async_reload()
+            if prediction.status in {"failed" , "canceled"}:
+                raise Exception("Image generation failed")
+            interval = next_poll_interval(interval, prediction.status != status)
+
+        return prediction.output[0]
+
     def get_prediction_status(self, prediction_id: str) -> Dict[str, Any]:
         """
         Get the status of a prediction.
@@ -62,11 +126,26 @@ class ReplicateWrapper:
         Returns:
         - Dict[str, Any]: A dictionary containing the prediction status and details.
         """
-        prediction = replicate.predictions.get(prediction_id)
+        prediction = self.client.predictions.get(prediction_id)
         return {
             "id": prediction.id,
             "status": prediction.status,
             "output": prediction.output,
             "error": prediction.error,
             "logs": prediction.logs
-        }
\ No newline at end of file
+        }
+
+    async def aget_prediction_status(self, prediction_id: str) -> Dict[str, Any]:
+        """
+        Asynchronously get the status of a prediction.
+
+        Same parameters and return value as `get_prediction_status`.
+        """
+        prediction = await self.client.predictions.async_get(prediction_id)
+        return {
+            "id": prediction.id,
+            "status": prediction.status,
+            "output": prediction.output,
+            "error": prediction.error,
+            "logs": prediction.logs
+        }
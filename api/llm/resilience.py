@@ -0,0 +1,489 @@
+import asyncio
+import email.utils
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from . import deadlines, metrics, tracing
+from .deadlines import DeadlineExceeded
+
+# Statuses worth retrying: timeouts, conflicts, rate limits, server errors and
+# Anthropic's 529 "overloaded".
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+RETRY_SETTINGS = {
+    "max_attempts": int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "3")),
+    "base_delay": float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5")),
+    "max_delay": float(os.getenv("LLM_RETRY_MAX_DELAY", "20")),
+}
+BREAKER_SETTINGS = {
+    "failure_threshold": int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    "reset_timeout": float(os.getenv("LLM_BREAKER_RESET", "30")),
+}
+HEALTH_SETTINGS = {
+    "alpha": float(os.getenv("LLM_HEALTH_ALPHA", "0.2")),
+    "error_half_life": float(os.getenv("LLM_HEALTH_ERROR_HALF_LIFE", "120")),
+}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, provider, model, retry_after):
+        """
+        Raised instead of calling a provider/model whose circuit breaker is open.
+
+        Parameters:
+        - provider (str): The provider name.
+        - model (str): The model name.
+        - retry_after (float): Seconds until the breaker lets a trial call through.
+        """
+        super().__init__(f"{provider} {model} is unavailable after repeated failures; retry in {retry_after:.0f}s")
+        self.provider = provider
+        self.model = model
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, provider, model, failure_threshold, reset_timeout):
+        """
+        Initialize a circuit breaker for one provider/model.
+
+        After `failure_threshold` consecutive transient failures the breaker opens and
+        calls fail fast. After `reset_timeout` seconds one trial call is let through
+        (half-open); its success closes the breaker, its failure re-opens it.
+        """
+        self.provider = provider
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError if calls are not currently allowed."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            remaining = self.opened_at + self.reset_timeout - now
+            if remaining <= 0:
+                # Let one trial call through; the next one waits another reset_timeout.
+                self.state = "half_open"
+                self.opened_at = now
+                return
+            raise CircuitOpenError(self.provider, self.model, remaining)
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    @property
+    def healthy(self):
+        """Whether calls would currently be let through."""
+        with self._lock:
+            return self.state == "closed" or time.monotonic() >= self.opened_at + self.reset_timeout
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider, model):
+    """Return the process-wide circuit breaker for a provider/model."""
+    key = (provider, model)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(key)
+            if breaker is None:
+                breaker = _breakers[key] = CircuitBreaker(provider, model, **BREAKER_SETTINGS)
+    return breaker
+
+
+def breaker_states():
+    """Return {"provider:model": state} for every breaker seen so far."""
+    return {f"{provider}:{model}": breaker.state for (provider, model), breaker in list(_breakers.items())}
+
+
+class ModelHealth:
+    def __init__(self, alpha, error_half_life):
+        """
+        Track a provider/model's recent latency and error rate.
+
+        Both are exponentially weighted moving averages of the observed calls. The
+        error rate also decays with time since the last observation, so a model that
+        stopped receiving traffic after failing is eventually tried again.
+
+        Parameters:
+        - alpha (float): Weight of the newest observation, between 0 and 1.
+        - error_half_life (float): Seconds for an idle model's error rate to halve.
+        """
+        self.alpha = alpha
+        self.error_half_life = error_half_life
+        self.latency = None
+        self.samples = 0
+        self.output_tokens = None
+        self._error_rate = 0.0
+        self._observed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def observe(self, latency=None, ok=True, output_tokens=None):
+        """
+        Record one call.
+
+        Parameters:
+        - latency (float, optional): Seconds the call took; omitted for calls whose duration is not comparable, e.g. streams.
+        - ok (bool): Whether the call succeeded.
+        - output_tokens (int, optional): Tokens the call generated, when reported.
+        """
+        with self._lock:
+            self._error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self._decayed_error_rate()
+            self._observed_at = time.monotonic()
+            if latency is not None:
+                self.latency = latency if self.latency is None else self.alpha * latency + (1 - self.alpha) * self.latency
+                self.samples += 1
+            if output_tokens is not None:
+                self.output_tokens = output_tokens if self.output_tokens is None else self.alpha * output_tokens + (1 - self.alpha) * self.output_tokens
+
+    @property
+    def error_rate(self):
+        with self._lock:
+            return self._decayed_error_rate()
+
+    def _decayed_error_rate(self):
+        idle = time.monotonic() - self._observed_at
+        return self._error_rate * 0.5 ** (idle / self.error_half_life)
+
+    def snapshot(self):
+        """Return the current averages as a JSON-serializable dict."""
+        return {"latency": self.latency, "error_rate": round(self.error_rate, 4), "samples": self.samples, "output_tokens": self.output_tokens}
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_health(provider, model):
+    """Return the process-wide latency and error-rate tracker for a provider/model."""
+    key = (provider, model)
+    health = _health.get(key)
+    if health is None:
+        with _health_lock:
+            health = _health.get(key)
+            if health is None:
+                health = _health[key] = ModelHealth(**HEALTH_SETTINGS)
+    return health
+
+
+def health_states():
+    """Return {"provider:model": snapshot} for every model observed so far."""
+    return {f"{provider}:{model}": health.snapshot() for (provider, model), health in list(_health.items())}
+
+
+def status_code_of(error):
+    """Return the HTTP status carried by an SDK or httpx error, if any."""
+    status = getattr(error, "status_code", None)
+    if status is None and isinstance(getattr(error, "response", None), httpx.Response):
+        status = error.response.status_code
+    return status
+
+
+def is_timeout(error):
+    return (
+        isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError, TimeoutError))
+        or type(error).__name__ == "APITimeoutError"
+    )
+
+
+def is_transient(error):
+    """Whether an error is worth retrying: timeouts, connection failures, 429s and 5xx."""
+    if is_timeout(error) or isinstance(error, httpx.TransportError):
+        return True
+    if type(error).__name__ == "APIConnectionError":
+        return True
+    return status_code_of(error) in TRANSIENT_STATUS_CODES
+
+
+def error_kind(error):
+    """Classify a transient error for the metrics: rate_limited, timeout or transient."""
+    if status_code_of(error) == 429:
+        return "rate_limited"
+    if is_timeout(error):
+        return "timeout"
+    return "transient"
+
+
+def retry_after(error):
+    """Return the delay in seconds requested by a Retry-After header on the error's response, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, error=None):
+    """
+    Return how long to wait before retry number `attempt` (0-based).
+
+    Uses exponential backoff with full jitter, but never less than the provider's
+    Retry-After, capped at `LLM_RETRY_MAX_DELAY`.
+    """
+    delay = random.uniform(0, min(RETRY_SETTINGS["max_delay"], RETRY_SETTINGS["base_delay"] * 2 ** attempt))
+    requested = retry_after(error) if error is not None else None
+    if requested is not None:
+        delay = max(delay, requested)
+    return min(delay, RETRY_SETTINGS["max_delay"])
+
+
+def resilient(provider, observe=True):
+    """
+    Decorate a wrapper method with retries and the provider/model circuit breaker.
+
+    Transient errors are retried up to `LLM_RETRY_MAX_ATTEMPTS` times in total with
+    jittered exponential backoff. Streams are only retried if they fail before
+    producing their first event. Works on sync methods, coroutines and async generators.
+
+    Each attempt is also recorded in the model's `ModelHealth`, which the router
+    uses to pick models, and in the Prometheus metrics (`llm/metrics.py`). Inside a
+    trace (`llm/tracing.py`), every attempt is also recorded as a span.
+
+    Inside a `deadline_scope` every attempt, and every event of a stream, is
+    bounded by the deadline: the call is cancelled and DeadlineExceeded raised
+    when it passes, and no retry is started that could not finish in time.
+    Calls cut short by the deadline or by cancellation, e.g. a client
+    disconnecting, are counted in `deadlines.cancellation_stats`.
+
+    Parameters:
+    - provider (str): The provider name; the breaker is keyed by it and the wrapper's `model`.
+    - observe (bool): Whether to record attempts in the model's health. Turn off for
+      calls whose latency would skew the model's text-generation figures, e.g. image input.
+    """
+    def decorator(method):
+        name = method.__name__
+        signature = inspect.signature(method)
+
+        def trace(self, args, kwargs, attempt, started, result=None, error=None):
+            """Record the attempt as a span if a trace is active."""
+            if not tracing.active():
+                return
+            prompt = signature.bind(self, *args, **kwargs).arguments.get("prompt")
+            attributes = {"provider": provider, "model": self.model, "attempt": attempt + 1}
+            if isinstance(prompt, str):
+                attributes["prompt_chars"] = len(prompt)
+            if isinstance(result, tuple) and len(result) == 3:
+                attributes["input_tokens"], attributes["output_tokens"] = result[1], result[2]
+            tracing.record_span(f"{provider}.{name}", time.perf_counter() - started, error=error, **attributes)
+
+        def admit(breaker):
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                metrics.record_error(provider, breaker.model, "circuit_open")
+                raise
+
+        def succeeded(breaker, health, latency=None, result=None, output_tokens=None):
+            breaker.record_success()
+            if isinstance(result, tuple) and len(result) == 3 and isinstance(result[2], int):
+                output_tokens = result[2]
+            if health is not None:
+                health.observe(latency, ok=True, output_tokens=output_tokens)
+            metrics.record_success(provider, breaker.model, name, latency, result)
+
+        def cut_short(self, args, kwargs, reason, received=0):
+            """Count a call stopped by the deadline or cancelled, with the output tokens it saved."""
+            arguments = signature.bind(self, *args, **kwargs)
+            arguments.apply_defaults()
+            max_tokens = arguments.arguments.get("max_tokens")
+            expected = get_health(provider, self.model).output_tokens
+            deadlines.cancellation_stats.record_call(reason, max_tokens if isinstance(max_tokens, int) else None, received, expected)
+
+        def retry_delay(attempt, error):
+            """Return how long to wait before the next attempt, or None if the deadline leaves no time for it."""
+            delay = backoff_delay(attempt, error)
+            left = deadlines.remaining()
+            return None if left is not None and left <= delay else delay
+
+        def failed(breaker, health, error, attempt):
+            """Record a failed attempt; return whether it may be retried."""
+            if isinstance(error, DeadlineExceeded):
+                # The caller's time ran out; that says nothing about the provider.
+                metrics.record_error(provider, breaker.model, "deadline")
+                return False
+            if not is_transient(error):
+                # The request itself was bad; that says nothing about the provider either.
+                metrics.record_error(provider, breaker.model, "client")
+                return False
+            breaker.record_failure()
+            if health is not None:
+                health.observe(ok=False)
+            metrics.record_error(provider, breaker.model, error_kind(error))
+            if attempt == RETRY_SETTINGS["max_attempts"] - 1:
+                return False
+            metrics.record_retry(provider, breaker.model)
+            return True
+
+        if inspect.isasyncgenfunction(method):
+            @functools.wraps(method)
+            async def wrapper(self, *args, **kwargs):
+                breaker = get_breaker(provider, self.model)
+                health = get_health(provider, self.model) if observe else None
+                for attempt in range(RETRY_SETTINGS["max_attempts"]):
+                    admit(breaker)
+                    started = False
+                    opened = time.perf_counter()
+                    usage = None
+                    # Rough count of output received, for the tokens saved if the stream is cut short.
+                    received_chars = 0
+                    stream = method(self, *args, **kwargs)
+                    try:
+                        while True:
+                            try:
+                                item = await deadlines.bounded(stream.__anext__())
+                            except StopAsyncIteration:
+                                break
+                            if not started:
+                                started = True
+                                metrics.record_first_token(provider, self.model, time.perf_counter() - opened)
+                            if item.get("type") == "delta":
+                                received_chars += len(item.get("text") or "")
+                            if item.get("type") == "usage":
+                                usage = (None, item["input_tokens"], item["output_tokens"])
+                                metrics.record_tokens(provider, self.model, item["input_tokens"], item["output_tokens"])
+                            yield item
+                    except (asyncio.CancelledError, GeneratorExit) as e:
+                        if usage is None:
+                            cut_short(self, args, kwargs, deadlines.cancel_reason(e), received_chars // 4)
+                        raise
+                    except Exception as e:
+                        trace(self, args, kwargs, attempt, opened, usage, e)
+                        if isinstance(e, DeadlineExceeded):
+                            cut_short(self, args, kwargs, "deadline", received_chars // 4)
+                        if started:
+                            failed(breaker, health, e, RETRY_SETTINGS["max_attempts"] - 1)
+                            raise
+                        if not failed(breaker, health, e, attempt):
+                            raise
+                        delay = retry_delay(attempt, e)
+                        if delay is None:
+                            raise
+                        await asyncio.sleep(delay)
+                    else:
+                        # A stream's duration depends on how long it is read, so only its outcome counts.
+                        succeeded(breaker, health, output_tokens=usage[2] if usage else None)
+                        trace(self, args, kwargs, attempt, opened, usage)
+                        return
+                    finally:
+                        await stream.aclose()
+        elif inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def wrapper(self, *args, **kwargs):
+                breaker = get_breaker(provider, self.model)
+                health = get_health(provider, self.model) if observe else None
+                for attempt in range(RETRY_SETTINGS["max_attempts"]):
+                    admit(breaker)
+                    started = time.perf_counter()
+                    try:
+                        result = await deadlines.bounded(method(self, *args, **kwargs))
+                    except asyncio.CancelledError as e:
+                        cut_short(self, args, kwargs, deadlines.cancel_reason(e))
+                        raise
+                    except Exception as e:
+                        trace(self, args, kwargs, attempt, started, error=e)
+                        if isinstance(e, DeadlineExceeded):
+                            cut_short(self, args, kwargs, "deadline")
+                        if not failed(breaker, health, e, attempt):
+                            raise
+                        delay = retry_delay(attempt, e)
+                        if delay is None:
+                            raise
+                        await asyncio.sleep(delay)
+                    else:
+                        succeeded(breaker, health, time.perf_counter() - started, result)
+                        trace(self, args, kwargs, attempt, started, result)
+                        return result
+        else:
+            @functools.wraps(method)
+            def wrapper(self, *args, **kwargs):
+                breaker = get_breaker(provider, self.model)
+                health = get_health(provider, self.model) if observe else None
+                for attempt in range(RETRY_SETTINGS["max_attempts"]):
+                    admit(breaker)
+                    left = deadlines.remaining()
+                    if left is not None and left <= 0:
+                        raise DeadlineExceeded("Request deadline exceeded before the provider call")
+                    started = time.perf_counter()
+                    try:
+                        result = method(self, *args, **kwargs)
+                    except Exception as e:
+                        trace(self, args, kwargs, attempt, started, error=e)
+                        if not failed(breaker, health, e, attempt):
+                            raise
+                        delay = retry_delay(attempt, e)
+                        if delay is None:
+                            raise
+                        time.sleep(delay)
+                    else:
+                        succeeded(breaker, health, time.perf_counter() - started, result)
+                        trace(self, args, kwargs, attempt, started, result)
+                        return result
+        return wrapper
+    return decorator
+
+
+def load_fallbacks():
+    """
+    Read the fallback map from `LLM_FALLBACKS`.
+
+    The variable holds JSON mapping "provider:model" to the "provider:model" to use
+    while the first is failing, e.g. {"anthropic:claude-3-5-sonnet-20240620": "openai:gpt-4o"}.
+
+    Returns:
+    - dict: {(provider, model): (fallback_provider, fallback_model)}
+    """
+    raw = os.getenv("LLM_FALLBACKS")
+    if not raw:
+        return {}
+    fallbacks = {}
+    for source, target in json.loads(raw).items():
+        fallbacks[tuple(source.split(":", 1))] = tuple(target.split(":", 1))
+    return fallbacks
+
+
+FALLBACKS = load_fallbacks()
+
+
+def fallback_for(provider, model):
+    """Return the configured (provider, model) fallback for a model, or None."""
+    return FALLBACKS.get((provider, model))
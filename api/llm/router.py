@@ -0,0 +1,187 @@
+import os
+from .anthropic_llm import AnthropicWrapper
+from .groq_llm import GroqWrapper
+from .openai_llm import OpenAIWrapper
+from .ratelimit import estimate_text_tokens
+from .registry import load_models, provider_configured
+from .resilience import CircuitOpenError, get_breaker, get_health, is_transient
+
+TEXT_WRAPPERS = {
+    "openai": OpenAIWrapper,
+    "groq": GroqWrapper,
+    "anthropic": AnthropicWrapper,
+}
+
+# Lowest registry `quality` each tier will route to.
+TIER_MIN_QUALITY = {
+    "fast": int(os.getenv("ROUTER_FAST_MIN_QUALITY", "7")),
+    "quality": 0,
+}
+# Models whose recent error rate is above this are only used when nothing healthier is left.
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+
+
+class NoRouteError(Exception):
+    """Raised when no registered model can serve a request."""
+
+
+class Router:
+    def __init__(self, models=None):
+        """
+        Initialize a router over the model registry.
+
+        The router ranks models by their static registry entry combined with the live
+        latency and error-rate averages that `resilient` records for every call, and
+        the state of each model's circuit breaker.
+
+        Parameters:
+        - models (dict, optional): {(provider, model): spec}. Defaults to `registry.load_models()`.
+        """
+        self.models = models if models is not None else load_models()
+
+    def expected_latency(self, provider, model):
+        """
+        Return the seconds a call to the model is expected to take.
+
+        Uses the observed moving average once there is one, otherwise the registry's
+        typical latency, inflated by the recent error rate to account for retries.
+        """
+        health = get_health(provider, model)
+        latency = health.latency if health.samples else self.models[(provider, model)]["latency"]
+        return latency / max(0.1, 1.0 - health.error_rate)
+
+    def healthy(self, provider, model):
+        """Whether the model's circuit is closed and its recent error rate is acceptable."""
+        return get_breaker(provider, model).healthy and get_health(provider, model).error_rate <= ROUTER_MAX_ERROR_RATE
+
+    def rank(self, tier="quality", latency_slo=None, capability="text", min_context=0):
+        """
+        Order the models that can serve a request, best first.
+
+        Healthy models come before unhealthy ones, and models expected to meet the
+        latency SLO before those that are not. Within that, the "quality" tier prefers
+        the highest registry quality and the "fast" tier the lowest expected latency;
+        ties go to the faster, then the cheaper model.
+
+        Parameters:
+        - tier (str): "quality" or "fast".
+        - latency_slo (float, optional): Target seconds for the whole call.
+        - capability (str): Capability the model must have, e.g. "text" or "vision".
+        - min_context (int): Tokens the model's context window must hold.
+
+        Returns:
+        - list: (provider, model) tuples. Models whose provider has no API key configured are left out.
+        """
+        if tier not in TIER_MIN_QUALITY:
+            raise ValueError(f"Unknown tier '{tier}'. Choose 'fast' or 'quality'.")
+        ranked = []
+        for (provider, model), spec in self.models.items():
+            if (
+                provider not in TEXT_WRAPPERS
+                or capability not in spec["capabilities"]
+                or spec["context_window"] < min_context
+                or spec["quality"] < TIER_MIN_QUALITY[tier]
+                or not provider_configured(provider)
+            ):
+                continue
+            latency = self.expected_latency(provider, model)
+            meets_slo = latency_slo is None or latency <= latency_slo
+            price = spec["input_price"] + spec["output_price"]
+            preference = (-spec["quality"], latency, price) if tier == "quality" else (latency, -spec["quality"], price)
+            ranked.append(((not self.healthy(provider, model), not meets_slo, preference), (provider, model)))
+        ranked.sort()
+        return [candidate for _, candidate in ranked]
+
+    def choose(self, tier="quality", latency_slo=None, capability="text", min_context=0):
+        """
+        Return the best (provider, model) for a request.
+
+        Takes the same parameters as `rank`. Raises NoRouteError if no model qualifies.
+        """
+        ranked = self.rank(tier, latency_slo, capability, min_context)
+        if not ranked:
+            raise NoRouteError(f"No configured model can serve a '{tier}' {capability} request of {min_context} tokens.")
+        return ranked[0]
+
+
+_router = None
+
+
+def get_router():
+    """Return the process-wide router."""
+    global _router
+    if _router is None:
+        _router = Router()
+    return _router
+
+
+class RoutedModel:
+    def __init__(self, tier="quality", latency_slo=None, system_prompt=None, router=None):
+        """
+        Initialize a text model that picks the provider and model for every call.
+
+        Offers the same `system_prompt` / `generate_text` interface as the provider
+        wrappers, so the Streamlit features can use it in their place.
+
+        Parameters:
+        - tier (str): "quality" or "fast".
+        - latency_slo (float, optional): Target seconds per call.
+        - system_prompt (str): An optional system-level prompt to set context.
+        - router (Router, optional): Defaults to the process-wide router.
+        """
+        self.tier = tier
+        self.latency_slo = latency_slo
+        self.system_prompt = system_prompt
+        self.router = router or get_router()
+        self.model = None
+        self._wrappers = {}
+
+    @property
+    def system_prompt(self):
+        """Gets the system prompt."""
+        return self._system_prompt
+
+    @system_prompt.setter
+    def system_prompt(self, value):
+        """Sets the system prompt."""
+        self._system_prompt = value
+
+    def generate_text(self, prompt, max_tokens=4000, temperature=0.5, **kwargs):
+        """
+        Generate text with the model the router currently ranks best.
+
+        If that model turns out to be unavailable, the next-ranked one is tried.
+        `model` holds the "provider:model" that answered.
+
+        Parameters:
+        - prompt (str): The prompt text to generate responses for.
+        - max_tokens (int): The maximum number of tokens to generate.
+        - temperature (float): The temperature for text generation.
+        - kwargs: Additional keyword arguments for the provider API call.
+
+        Returns:
+        - Generated text from the model, input tokens count, and output tokens count.
+        """
+        min_context = estimate_text_tokens({"prompt": prompt, "max_tokens": max_tokens})
+        ranked = self.router.rank(self.tier, self.latency_slo, min_context=min_context)
+        if not ranked:
+            raise NoRouteError(f"No configured model can serve a '{self.tier}' text request of {min_context} tokens.")
+        candidates = ranked[:2]
+        for index, (provider, model) in enumerate(candidates):
+            wrapper = self._wrapper(provider, model)
+            wrapper.system_prompt = self.system_prompt
+            try:
+                result = wrapper.generate_text(prompt=prompt, max_tokens=max_tokens, temperature=temperature, **kwargs)
+            except Exception as e:
+                unavailable = isinstance(e, CircuitOpenError) or is_transient(e)
+                if not unavailable or index == len(candidates) - 1:
+                    raise
+            else:
+                self.model = f"{provider}:{model}"
+                return result
+
+    def _wrapper(self, provider, model):
+        wrapper = self._wrappers.get((provider, model))
+        if wrapper is None:
+            wrapper = self._wrappers[(provider, model)] = TEXT_WRAPPERS[provider](model=model)
+        return wrapper
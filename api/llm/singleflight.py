@@ -0,0 +1,171 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+from concurrent.futures import Future
+from contextvars import ContextVar
+
+from . import deadlines
+from .cache import make_key
+
+
+class _Call:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Initialize a single-flight group.
+
+        While a call for a key is in flight, later callers with the same key wait
+        for its result instead of starting their own call.
+        """
+        self.stats = {"calls": 0, "coalesced": 0}
+        self._async_calls = {}
+        self._sync_calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self):
+        """Number of distinct keys currently in flight."""
+        return len(self._async_calls) + len(self._sync_calls)
+
+    async def ado(self, key, fn):
+        """
+        Await `fn()` once per key across concurrent callers.
+
+        The upstream call runs in its own task, in a fresh context: it is not bound
+        by the first caller's deadline, nor traced under that caller's span. Each
+        caller waits for it only until its own deadline. The call is cancelled
+        when every caller waiting on it has been cancelled or given up.
+
+        Parameters:
+        - key (str): Identifies identical calls.
+        - fn (callable): Returns the coroutine to run when no call for `key` is in flight.
+
+        Returns:
+        - The result of the shared call. Its exception is raised to every caller.
+        """
+        loop_key = (id(asyncio.get_running_loop()), key)
+        self.stats["calls"] += 1
+        call = self._async_calls.get(loop_key)
+        if call is None:
+            call = self._async_calls[loop_key] = _Call(contextvars.Context().run(asyncio.ensure_future, fn()))
+            call.task.add_done_callback(lambda _: self._discard(self._async_calls, loop_key, call))
+        else:
+            self.stats["coalesced"] += 1
+        call.waiters += 1
+
+        async def wait():
+            return await asyncio.shield(call.task)
+
+        expired = False
+        try:
+            return await deadlines.bounded(wait())
+        except deadlines.DeadlineExceeded:
+            expired = True
+            raise
+        except asyncio.CancelledError as e:
+            expired = deadlines.cancel_reason(e) == "deadline"
+            raise
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel(deadlines.DEADLINE_CANCEL if expired else None)
+
+    def do(self, key, fn):
+        """
+        Run `fn()` once per key across concurrent threads.
+
+        Parameters:
+        - key (str): Identifies identical calls.
+        - fn (callable): The function to run when no call for `key` is in flight.
+
+        Returns:
+        - The result of the shared call. Its exception is raised to every caller.
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            future = self._sync_calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._sync_calls[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._sync_calls.pop(key, None)
+
+    def _discard(self, calls, key, call):
+        if calls.get(key) is call:
+            del calls[key]
+
+
+# Shared by the provider wrappers so identical calls coalesce across instances.
+wrapper_flight = SingleFlight()
+
+# Cleared for calls that must reach the provider even when an identical call is
+# in flight, e.g. a hedged duplicate.
+_coalescing = ContextVar("coalescing", default=True)
+
+
+async def uncoalesced(fn):
+    """
+    Await `fn()` without wrapper-level coalescing.
+
+    Run this in its own task; the setting applies to the current context only.
+    """
+    _coalescing.set(False)
+    return await fn()
+
+
+def single_flight(provider):
+    """
+    Decorate a wrapper's generation method so identical concurrent calls share one upstream request.
+
+    The key covers the provider, the wrapper's model and system prompt, and every
+    bound argument of the call (defaults included).
+
+    Parameters:
+    - provider (str): The provider name, included in the key.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        def flight_key(self, args, kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            arguments.pop("self")
+            return make_key(provider=provider, model=self.model, system_prompt=self.system_prompt, arguments=arguments)
+
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def wrapper(self, *args, **kwargs):
+                if not _coalescing.get():
+                    return await method(self, *args, **kwargs)
+                key = flight_key(self, args, kwargs)
+                return await wrapper_flight.ado(key, lambda: method(self, *args, **kwargs))
+        else:
+            @functools.wraps(method)
+            def wrapper(self, *args, **kwargs):
+                if not _coalescing.get():
+                    return method(self, *args, **kwargs)
+                key = flight_key(self, args, kwargs)
+                return wrapper_flight.do(key, lambda: method(self, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,223 @@
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import httpx
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        """
+        Initialize a span: one timed stage of a trace.
+
+        A span without a parent starts a new trace and collects every span of that
+        trace as they finish, in `spans`.
+
+        Parameters:
+        - name (str): The stage name, e.g. "draft" or "openai.generate_text".
+        - parent (Span, optional): The enclosing span.
+        - attributes (dict, optional): Details such as model, token counts or prompt size.
+        """
+        self.name = name
+        self.root = parent.root if parent is not None else self
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self.spans = [] if parent is None else None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        """Add or update attributes."""
+        self.attributes.update(attributes)
+
+    def finish(self, error=None, duration=None):
+        """Close the span, recording an error if the stage failed."""
+        self.duration = duration if duration is not None else time.perf_counter() - self._started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.root.spans.append(self)
+        if self.root is self:
+            export(self.spans)
+
+    def to_dict(self):
+        """Return the span as a JSON-serializable dict."""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a block as a span of the current trace, starting a trace if none is active.
+
+    Parameters:
+    - name (str): The stage name.
+    - attributes: Details to attach to the span.
+
+    Yields:
+    - Span: The span; call `set` on it to add attributes while the block runs.
+    """
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        _current_span.reset(token)
+        current.finish(error=e)
+        raise
+    else:
+        _current_span.reset(token)
+        current.finish()
+
+
+def active():
+    """Whether a trace is being recorded in the current context."""
+    return _current_span.get() is not None
+
+
+def record_span(name, duration, error=None, **attributes):
+    """
+    Add an already finished span under the current span; does nothing outside a trace.
+
+    Parameters:
+    - name (str): The span name.
+    - duration (float): Seconds the operation took.
+    - error (Exception, optional): The error the operation failed with.
+    - attributes: Details to attach to the span.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return
+    finished = Span(name, parent, attributes)
+    finished.start -= duration
+    finished.finish(error=error, duration=duration)
+
+
+class JsonlExporter:
+    def __init__(self, path):
+        """
+        Append every finished trace to a JSON Lines file, one span per line.
+
+        Parameters:
+        - path (str): The file to append to.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(lines)
+
+
+class OTLPExporter:
+    def __init__(self, endpoint, headers=None, service_name="chatprd"):
+        """
+        Send finished traces to an OpenTelemetry collector over OTLP/HTTP with JSON encoding.
+
+        Spans are posted from a background thread so a slow collector never delays
+        the caller. Failed exports are dropped.
+
+        Parameters:
+        - endpoint (str): The collector's base URL, e.g. "http://localhost:4318".
+        - headers (dict, optional): Extra request headers, e.g. for authentication.
+        - service_name (str): The `service.name` resource attribute.
+        """
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.headers = headers or {}
+        self.service_name = service_name
+
+    def export(self, spans):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "llm.tracing"}, "spans": [self._span(span) for span in spans]}],
+            }]
+        }
+        threading.Thread(target=self._post, args=(payload,), daemon=True).start()
+
+    def _post(self, payload):
+        try:
+            httpx.post(self.url, json=payload, headers=self.headers, timeout=10)
+        except httpx.HTTPError:
+            pass
+
+    @staticmethod
+    def _span(span):
+        start = int(span.start * 1e9)
+        otlp = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(span.duration * 1e9)),
+            "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items() if value is not None],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            otlp["parentSpanId"] = span.parent_id
+        return otlp
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def load_exporter():
+    """
+    Build the exporter selected by `TRACE_EXPORTER`: "jsonl" (default), "otlp" or "none".
+
+    The JSONL file is `TRACE_FILE`, by default `llm_traces.jsonl` in the system temp
+    directory. The OTLP endpoint is `OTEL_EXPORTER_OTLP_ENDPOINT`.
+    """
+    kind = os.getenv("TRACE_EXPORTER", "jsonl").lower()
+    if kind == "none":
+        return None
+    if kind == "otlp":
+        return OTLPExporter(os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"))
+    return JsonlExporter(os.getenv("TRACE_FILE") or os.path.join(tempfile.gettempdir(), "llm_traces.jsonl"))
+
+
+_exporter = load_exporter()
+
+
+def set_exporter(exporter):
+    """Replace the exporter; any object with an `export(spans)` method will do, or None to drop traces."""
+    global _exporter
+    _exporter = exporter
+
+
+def export(spans):
+    """Hand a finished trace to the exporter. Export failures never reach the traced code."""
+    if _exporter is None:
+        return
+    try:
+        _exporter.export(spans)
+    except Exception:
+        pass
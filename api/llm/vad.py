@@ -0,0 +1,198 @@
+import asyncio
+import bisect
+import os
+import subprocess
+
+import numpy as np
+
+from .audio import TRANSCODE_FORMATS, TRANSCODE_SAMPLE_RATE, FFmpegError, ffmpeg_slot, run_ffmpeg
+
+VAD_FRAME_SECONDS = 0.03
+# A frame is speech when it is this many dB above the recording's noise floor.
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "12"))
+# Silences shorter than this are kept; longer ones are cut down to the padding.
+VAD_MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", "1.0"))
+VAD_PADDING_SECONDS = float(os.getenv("VAD_PADDING_SECONDS", "0.25"))
+# Recordings that would shrink by less than this fraction are sent unchanged.
+VAD_MIN_SAVING = float(os.getenv("VAD_MIN_SAVING", "0.05"))
+# Frames quieter than this never count as speech, however low the noise floor.
+SPEECH_FLOOR_DB = -55.0
+
+
+class OffsetMap:
+    def __init__(self, intervals, original_duration):
+        """
+        Map times in trimmed audio back to the original recording.
+
+        Parameters:
+        - intervals (list): The (start, end) spans of the original, in seconds, that were kept, in order.
+        - original_duration (float): Length of the original recording in seconds.
+        """
+        self.intervals = intervals
+        self.original_duration = original_duration
+        self._trimmed_starts = []
+        position = 0.0
+        for start, end in intervals:
+            self._trimmed_starts.append(position)
+            position += end - start
+        self.trimmed_duration = position
+
+    @property
+    def seconds_saved(self):
+        return self.original_duration - self.trimmed_duration
+
+    @property
+    def trimmed_ratio(self):
+        """Fraction of the original recording that was cut."""
+        return self.seconds_saved / self.original_duration if self.original_duration else 0.0
+
+    def to_original(self, seconds):
+        """Return the time in the original recording of a time in the trimmed audio."""
+        if not self.intervals:
+            return seconds
+        index = max(0, bisect.bisect_right(self._trimmed_starts, seconds) - 1)
+        return self.intervals[index][0] + seconds - self._trimmed_starts[index]
+
+    def remap(self, items):
+        """Return copies of segment or word dicts with "start" and "end" moved to the original timeline."""
+        return [dict(item, start=self.to_original(item["start"]), end=self.to_original(item["end"])) for item in items]
+
+
+class VadStats:
+    def __init__(self):
+        """Totals for `trim_silence`, shown in `GET /stats`."""
+        self.files = 0
+        self.original_seconds = 0.0
+        self.trimmed_seconds = 0.0
+
+    def record(self, offsets):
+        self.files += 1
+        self.original_seconds += offsets.original_duration
+        self.trimmed_seconds += offsets.seconds_saved
+
+    def snapshot(self):
+        """Return the totals and the overall trimmed ratio as a dict."""
+        return {
+            "files": self.files,
+            "original_seconds": self.original_seconds,
+            "trimmed_seconds": self.trimmed_seconds,
+            "trimmed_ratio": self.trimmed_seconds / self.original_seconds if self.original_seconds else 0.0,
+        }
+
+
+vad_stats = VadStats()
+
+
+async def trim_silence(path, codec="flac", output_path=None):
+    """
+    Cut long silences out of a recording with an energy-based voice activity detector.
+
+    The audio is decoded to 16 kHz mono PCM by ffmpeg and read in blocks, so
+    only one level per 30 ms frame is kept in memory. Frames well above the
+    recording's noise floor are speech. Silences longer than
+    VAD_MIN_SILENCE_SECONDS are cut, keeping VAD_PADDING_SECONDS of them on
+    each side of the speech. If that would save less than VAD_MIN_SAVING of
+    the recording, or no speech is found, it is left as it is.
+
+    Parameters:
+    - path (str): The recording.
+    - codec (str): Encoding of the trimmed file, "flac" or "opus".
+    - output_path (str, optional): Where to write the result. Defaults to the input's path with "-voiced" and the codec's extension.
+
+    Returns:
+    - tuple: (path, OffsetMap). The path is the input's when nothing was trimmed.
+    """
+    async with ffmpeg_slot():
+        levels = await asyncio.to_thread(frame_levels, path)
+    original_duration = len(levels) * VAD_FRAME_SECONDS
+    intervals = speech_intervals(levels)
+    offsets = OffsetMap(intervals, original_duration)
+    if not intervals or offsets.trimmed_ratio < VAD_MIN_SAVING:
+        offsets = OffsetMap([(0.0, original_duration)], original_duration)
+        vad_stats.record(offsets)
+        return path, offsets
+
+    extension, codec_args = TRANSCODE_FORMATS[codec]
+    output_path = output_path or f"{os.path.splitext(path)[0]}-voiced{extension}"
+    selection = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in intervals)
+    await run_ffmpeg(
+        "-v", "error", "-y", "-i", path, "-map", "0:a:0", "-vn",
+        "-af", f"asetnsamples=n=160,aselect='{selection}',asetpts=N/SR/TB",
+        "-ac", "1", "-ar", str(TRANSCODE_SAMPLE_RATE), *codec_args, output_path,
+    )
+    vad_stats.record(offsets)
+    return output_path, offsets
+
+
+def frame_levels(path, block_seconds=10):
+    """
+    Return the level of every 30 ms frame of a recording in dBFS.
+
+    Runs ffmpeg synchronously; call it from a worker thread.
+    """
+    frame = int(TRANSCODE_SAMPLE_RATE * VAD_FRAME_SECONDS)
+    block_bytes = frame * int(block_seconds / VAD_FRAME_SECONDS) * 2
+    try:
+        process = subprocess.Popen(
+            ["ffmpeg", "-hide_banner", "-v", "error", "-i", path, "-map", "0:a:0",
+             "-ac", "1", "-ar", str(TRANSCODE_SAMPLE_RATE), "-f", "s16le", "-"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        raise FFmpegError("ffmpeg is not installed")
+    levels = []
+    with process:
+        while True:
+            block = process.stdout.read(block_bytes)
+            if not block:
+                break
+            samples = np.frombuffer(block[:len(block) - len(block) % 2], dtype=np.int16).astype(np.float32) / 32768.0
+            usable = len(samples) - len(samples) % frame
+            if usable == 0:
+                break
+            power = np.mean(np.square(samples[:usable].reshape(-1, frame)), axis=1)
+            levels.append(10 * np.log10(power + 1e-10))
+        stderr = process.stderr.read().decode(errors="replace")
+    if process.returncode != 0:
+        raise FFmpegError(f"ffmpeg failed: {stderr.strip().splitlines()[-1] if stderr.strip() else process.returncode}")
+    return np.concatenate(levels) if levels else np.zeros(0, dtype=np.float32)
+
+
+def speech_intervals(levels, threshold_db=VAD_THRESHOLD_DB, min_silence=VAD_MIN_SILENCE_SECONDS, padding=VAD_PADDING_SECONDS):
+    """
+    Return the (start, end) spans, in seconds, to keep from a recording's frame levels.
+
+    Parameters:
+    - levels (numpy.ndarray): Level of each 30 ms frame in dBFS, from `frame_levels`.
+    - threshold_db (float): How far above the noise floor (10th percentile level) speech is.
+    - min_silence (float): Shortest silence that is cut.
+    - padding (float): Silence kept next to speech.
+
+    Returns:
+    - list: Spans in order, not overlapping.
+    """
+    if len(levels) == 0:
+        return []
+    duration = len(levels) * VAD_FRAME_SECONDS
+    noise_floor = float(np.percentile(levels, 10))
+    speech = levels > max(noise_floor + threshold_db, SPEECH_FLOOR_DB)
+    if not speech.any():
+        return []
+    # Edges of runs of speech frames: starts where speech begins, ends where it stops.
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) * VAD_FRAME_SECONDS
+    ends = np.flatnonzero(edges == -1) * VAD_FRAME_SECONDS
+    intervals = []
+    for start, end in zip(starts, ends):
+        start, end = float(max(0.0, start - padding)), float(min(duration, end + padding))
+        gap = start - intervals[-1][1] if intervals else None
+        if gap is not None and (gap <= 0 or gap < min_silence - 2 * padding):
+            intervals[-1] = (intervals[-1][0], end)
+        else:
+            intervals.append((start, end))
+    # Short silences at either end are kept, like those between words.
+    if intervals[0][0] < min_silence:
+        intervals[0] = (0.0, intervals[0][1])
+    if duration - intervals[-1][1] < min_silence:
+        intervals[-1] = (intervals[-1][0], duration)
+    return intervals
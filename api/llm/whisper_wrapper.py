@@ -1,6 +1,9 @@
-import openai
 import os
-from typing import Optional, List
+from contextlib import contextmanager
+from .clients import get_client
+from .ratelimit import rate_limited
+from .resilience import resilient
+from typing import BinaryIO, List, Optional, Union
 
 class WhisperWrapper:
     def __init__(self, api_key=None, model="whisper-1"):
@@ -15,49 +18,105 @@ class WhisperWrapper:
         self.model = model
         if not self.api_key:
             raise ValueError("API key must be provided either as a parameter or set in the environment variables.")
-        openai.api_key = self.api_key
+        self.client = get_client("openai", self.api_key)
+        self.async_client = get_client("openai", self.api_key, asynchronous=True)
 
+    @resilient("openai")
+    @rate_limited("openai")
     def transcribe(self, 
-                   audio_file: str, 
+                   audio_file: Union[str, BinaryIO], 
                    language: Optional[str] = None, 
                    prompt: Optional[str] = None,
                    response_format: str = "json",
                    temperature: float = 0,
-                   timestamp_granularities: Optional[List[str]] = None):
+                   timestamp_granularities: Optional[List[str]] = None,
+                   filename: Optional[str] = None):
         """
         Transcribe the given audio file using the Whisper model.
 
         Parameters:
-        - audio_file (str): Path to the audio file to transcribe.
+        - audio_file (str or file): Path to the audio file to transcribe, or an open binary file, which is rewound and streamed to the provider rather than read into memory.
         - language (str, optional): The language of the input audio in ISO-639-1 format.
         - prompt (str, optional): An optional text to guide the model's style or continue a previous audio segment.
         - response_format (str, optional): The format of the transcript output. Default is "json".
         - temperature (float, optional): The sampling temperature, between 0 and 1. Default is 0.
         - timestamp_granularities (List[str], optional): The timestamp granularities to populate for this transcription.
+        - filename (str, optional): Name sent with a file object, so the provider can tell the format. Defaults to the path's file name.
 
         Returns:
         - Transcribed text or JSON object, depending on the response_format.
         """
-        client = openai.OpenAI()
-        
-        with open(audio_file, "rb") as audio:
-            params = {
-                "model": self.model,
-                "file": audio,
-                "response_format": response_format,
-                "temperature": temperature
-            }
-            
-            if language:
-                params["language"] = language
-            if prompt:
-                params["prompt"] = prompt
-            if timestamp_granularities:
-                params["timestamp_granularities"] = timestamp_granularities
-
-            response = client.audio.transcriptions.create(**params)
-        
+        with _opened(audio_file) as audio:
+            params = self._params((_filename(audio_file, filename), audio), language, prompt,
+                                  response_format, temperature, timestamp_granularities)
+            response = self.client.audio.transcriptions.create(**params)
+
+        return self._format(response, response_format)
+
+    @resilient("openai")
+    @rate_limited("openai")
+    async def atranscribe(self,
+                          audio_file: Union[str, BinaryIO],
+                          language: Optional[str] = None,
+                          prompt: Optional[str] = None,
+                          response_format: str = "json",
+                          temperature: float = 0,
+                          timestamp_granularities: Optional[List[str]] = None,
+                          filename: Optional[str] = None):
+        """
+        Asynchronously transcribe the given audio file using the Whisper model.
+
+        Same parameters and return value as `transcribe`; the file is streamed
+        in chunks by the async OpenAI client.
+        """
+        with _opened(audio_file) as audio:
+            params = self._params((_filename(audio_file, filename), audio), language, prompt,
+                                  response_format, temperature, timestamp_granularities)
+            response = await self.async_client.audio.transcriptions.create(**params)
+
+        return self._format(response, response_format)
+
+    def _params(self, file, language, prompt, response_format, temperature, timestamp_granularities):
+        """Build the keyword arguments for a transcription request."""
+        params = {
+            "model": self.model,
+            "file": file,
+            "response_format": response_format,
+            "temperature": temperature
+        }
+
+        if language:
+            params["language"] = language
+        if prompt:
+            params["prompt"] = prompt
+        if timestamp_granularities:
+            params["timestamp_granularities"] = timestamp_granularities
+        return params
+
+    @staticmethod
+    def _format(response, response_format):
+        """Return the transcription payload in the requested format."""
         if response_format == "json" or response_format == "verbose_json":
             return response.json()
         else:
-            return response.text
\ No newline at end of file
+            return response.text
+
+
+@contextmanager
+def _opened(audio_file):
+    """Yield a binary file at its start: paths are opened and closed, file objects are rewound and left open."""
+    if isinstance(audio_file, (str, os.PathLike)):
+        with open(audio_file, "rb") as f:
+            yield f
+    else:
+        audio_file.seek(0)
+        yield audio_file
+
+
+def _filename(audio_file, filename=None):
+    """Return the file name to send with an upload."""
+    if filename:
+        return os.path.basename(filename)
+    if isinstance(audio_file, (str, os.PathLike)):
+        return os.path.basename(audio_file)
+    return "audio"
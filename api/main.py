@@ -1,6 +1,7 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, BackgroundTasks
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, BackgroundTasks, Header, Depends, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError
+from typing import Optional, List, Literal
 import uvicorn
 from llm.openai_llm import OpenAIWrapper
 from llm.groq_llm import GroqWrapper
@@ -8,21 +9,176 @@ from llm.whisper_wrapper import WhisperWrapper
 from llm.groq_stt_wrapper import GroqSTTWrapper
 from llm.anthropic_llm import AnthropicWrapper
 from llm.replicate_wrapper import ReplicateWrapper
+from llm.local_replicate import LocalReplicateWrapper
+from llm.image_jobs import ImageJobRegistry
+from llm.job_queue import JobQueue, QueueClosedError
+from llm.clients import aclose_clients
+from llm.cache import ResponseCache, make_key
+from llm.singleflight import SingleFlight, wrapper_flight, uncoalesced
+from llm.hedging import HedgePolicy, hedged_call, hedged_stream
+from llm.resilience import CircuitOpenError, breaker_states, fallback_for, health_states, is_timeout, is_transient, retry_after, status_code_of
+from llm.ratelimit import get_limiter, estimate_text_tokens
+from llm.router import TEXT_WRAPPERS, get_router
+from llm.registry import provider_configured
+from llm.cascade import AcceptanceCheck, arun_cascade, cascade_stats, exceeds_context
+from llm.deadlines import DEADLINE_CANCEL, DeadlineExceeded, cancellation_stats, deadline_scope
+from llm.audio import transcode_for_speech, transcode_stats
+from llm.images import IMAGE_PACK_LIMITS, PACK_MAX_TOKENS, image_stats, packed_prompt, split_packed
+from llm.vad import trim_silence as trim_audio_silence, vad_stats
+from llm.long_audio import RESPONSE_FORMATS as LONG_AUDIO_FORMATS, astream_long_transcription, atranscribe_long
+from metrics import MetricsMiddleware, register_stats
+from profiling import ProfilingMiddleware, profiler
+from uploads import ImageTooLargeError, UploadLimitMiddleware, read_zip_member, upload_digest, upload_path, zip_images
+from PIL import UnidentifiedImageError
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 #from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import asyncio
+import hmac
+import json
+import math
 import os
-import tempfile
+import time
+import zipfile
 
 #load_dotenv()
-app = FastAPI()
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "100"))
+# Deadline for text generation requests that set none, in seconds; unset means none.
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT")) if os.getenv("REQUEST_TIMEOUT") else None
+# How often a waiting request checks whether its client has gone.
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+# Cheap model tried first in cascade mode unless the request names one.
+CASCADE_PROVIDER = os.getenv("CASCADE_PROVIDER", "groq")
+CASCADE_MODEL = os.getenv("CASCADE_MODEL", "llama3-70b-8192")
+# Uploads larger than this are transcribed in chunks unless the request says otherwise;
+# the speech-to-text APIs reject files over 25 MB.
+LONG_AUDIO_THRESHOLD_BYTES = int(os.getenv("LONG_AUDIO_THRESHOLD_BYTES", str(24 * 1024 * 1024)))
+# Piece length for /transcribe-audio/stream; short pieces bring the first text sooner.
+TRANSCRIBE_STREAM_CHUNK_SECONDS = float(os.getenv("TRANSCRIBE_STREAM_CHUNK_SECONDS", "60"))
+# Default re-encoding of uploads before transcription: "opus", "flac" or "none".
+TRANSCRIBE_PREPROCESS = os.getenv("TRANSCRIBE_PREPROCESS", "none")
+# Cut long silences out of uploads before transcription unless the request says otherwise.
+TRANSCRIBE_TRIM_SILENCE = os.getenv("TRANSCRIBE_TRIM_SILENCE", "0") == "1"
+# "local" swaps Replicate for an in-process stand-in, for development and load tests.
+REPLICATE_BACKEND = os.getenv("REPLICATE_BACKEND", "replicate")
+# Background jobs: SQLite file for their state, jobs run at once, how long results
+# are kept, and how long shutdown waits for running jobs before requeueing them.
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "86400"))
+JOB_DRAIN_SECONDS = float(os.getenv("JOB_DRAIN_SECONDS", "30"))
+
+# Per-provider caps on concurrent batch calls, e.g. OPENAI_MAX_CONCURRENCY=16.
+PROVIDER_CONCURRENCY = {
+    provider: int(os.getenv(f"{provider.upper()}_MAX_CONCURRENCY", "8"))
+    for provider in TEXT_WRAPPERS
+}
+_provider_semaphores = {}
+
+# Cache of generated text keyed by provider, model, system instructions, prompt,
+# temperature and max_tokens. Set RESPONSE_CACHE_DB to a file path to keep a
+# SQLite tier that survives restarts.
+response_cache = ResponseCache(
+    namespace="generate-text",
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    stale_ttl=float(os.getenv("RESPONSE_CACHE_STALE_TTL", "86400")),
+    db_path=os.getenv("RESPONSE_CACHE_DB"),
+    db_max_bytes=int(os.getenv("RESPONSE_CACHE_DB_MAX_BYTES", str(512 * 1024 * 1024))),
+)
+# Transcriptions and image descriptions, keyed by a hash of the uploaded file plus
+# provider, model and parameters. MEDIA_CACHE_DB (default RESPONSE_CACHE_DB) adds a disk tier.
+MEDIA_CACHE_SETTINGS = dict(
+    max_entries=int(os.getenv("MEDIA_CACHE_MAX_ENTRIES", "1024")),
+    max_bytes=int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("MEDIA_CACHE_TTL", str(30 * 86400))),
+    stale_ttl=0,
+    db_path=os.getenv("MEDIA_CACHE_DB") or os.getenv("RESPONSE_CACHE_DB"),
+    db_max_bytes=int(os.getenv("MEDIA_CACHE_DB_MAX_BYTES", str(512 * 1024 * 1024))),
+)
+transcription_cache = ResponseCache(namespace="transcribe-audio", **MEDIA_CACHE_SETTINGS)
+image_cache = ResponseCache(namespace="image-to-text", **MEDIA_CACHE_SETTINGS)
+# Finished text-to-image URLs by prompt, aspect ratio and model. Replicate deletes
+# outputs an hour after a prediction, so entries must expire before that.
+text_to_image_cache = ResponseCache(
+    namespace="text-to-image",
+    **dict(MEDIA_CACHE_SETTINGS, ttl=float(os.getenv("TEXT_TO_IMAGE_CACHE_TTL", "3000"))),
+)
+# While a provider has failed within this many seconds, stale cache entries are
+# served immediately and refreshed in the background.
+PROVIDER_ERROR_WINDOW = float(os.getenv("PROVIDER_ERROR_WINDOW", "30"))
+_provider_failures = {}
+_background_tasks = set()
+# Coalesces identical cache-filling generations that are in flight at the same time.
+generation_flight = SingleFlight()
+# Delays and budget for opt-in hedged requests (HEDGE_PERCENTILE, HEDGE_DEFAULT_DELAY, HEDGE_MAX_RATIO).
+hedge_policy = HedgePolicy()
+
+
+@lru_cache(maxsize=256)
+def get_wrapper(wrapper_class, **kwargs):
+    """
+    Return a shared wrapper instance for the given class and constructor arguments.
+
+    Wrappers hold no per-request state in the API (the system prompt is part of the
+    cache key), and their SDK clients come from the process-wide pool, so one
+    instance per configuration is reused across requests.
+    """
+    return wrapper_class(**kwargs)
+
+
+def replicate_wrapper():
+    """Return the shared text-to-image wrapper: Replicate, or the local stand-in when REPLICATE_BACKEND=local."""
+    return get_wrapper(LocalReplicateWrapper if REPLICATE_BACKEND == "local" else ReplicateWrapper)
+
+
+# Text-to-image tasks, polled upstream by one background task however often clients ask.
+image_jobs = ImageJobRegistry(replicate_wrapper, text_to_image_cache)
+# Long generations run here instead of holding a connection open; see `POST /jobs`.
+job_queue = JobQueue(JOB_QUEUE_DB, workers=JOB_WORKERS, ttl=JOB_RESULT_TTL, describe_error=lambda e: job_error(e))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Picks up jobs queued before the last shutdown.
+    job_queue.start()
+    yield
+    await job_queue.drain(JOB_DRAIN_SECONDS)
+    await image_jobs.aclose()
+    await aclose_clients()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(UploadLimitMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 class GenerateTextRequest(BaseModel):
-    provider: str = Field(..., description="The text generation service provider, e.g., 'groq', 'anthropic' or 'openai'.")
-    model: str = Field(..., description="The model identifier, specifying which language model to use for text generation. gpt4, llama3-8b-8192, llama3-70b-8192")
+    provider: str = Field(..., description="The text generation service provider, e.g., 'groq', 'anthropic' or 'openai'. 'auto' lets the router pick the provider and model.")
+    model: Optional[str] = Field(None, description="The model identifier, specifying which language model to use for text generation. gpt4, llama3-8b-8192, llama3-70b-8192. Required unless provider is 'auto'.")
     prompt: str = Field(..., description="The input prompt to the language model based on which the text is generated.")
     temperature: float = Field(0.5, description="Controls the randomness of the output. Lower values make it more deterministic.")
     return_prompt: bool = Field(False, description="A boolean flag to specify whether to return the original prompt with the generated text.")
     max_tokens: Optional[int] = Field(4000, description="The maximum number of tokens to generate. Default is 4000.")
     system_instructions: str = Field("You are working for PropertyGuru", description="Instructions that define the context or constraints under which the model operates. Typically used to create agents or give personality.")
+    hedge: bool = Field(False, description="Send a duplicate request if this one is slower than usual, and use whichever answers first.")
+    hedge_provider: Optional[str] = Field(None, description="Provider for the hedged duplicate. Defaults to `provider`.")
+    hedge_model: Optional[str] = Field(None, description="Model for the hedged duplicate. Defaults to `model`.")
+    cache: Optional[Literal["bypass", "refresh"]] = Field(None, description="Response cache control. 'bypass' skips the cache entirely; 'refresh' ignores any cached entry and stores the new result.")
+    tier: Literal["fast", "quality"] = Field("quality", description="With provider 'auto': prefer the fastest adequate model or the best one.")
+    latency_slo: Optional[float] = Field(None, description="With provider 'auto': target seconds for the response. Models expected to be slower are only used if no other is healthy.")
+    cascade: bool = Field(False, description="Try the cheap cascade model first and only call `provider`/`model` if its answer fails the acceptance check.")
+    cascade_provider: Optional[str] = Field(None, description="Provider of the cheap cascade model. Defaults to CASCADE_PROVIDER ('groq').")
+    cascade_model: Optional[str] = Field(None, description="The cheap cascade model. Defaults to CASCADE_MODEL ('llama3-70b-8192').")
+    min_length: int = Field(0, description="Cascade acceptance check: minimum characters in the cheap answer.")
+    required_sections: List[str] = Field([], description="Cascade acceptance check: Markdown headings the cheap answer must contain.")
+    reject_refusals: bool = Field(True, description="Cascade acceptance check: reject cheap answers that are refusals.")
+    timeout: Optional[float] = Field(None, gt=0, description="Seconds the request may take in all, including retries, hedges and fallbacks. Provider calls still running then are cancelled and the request fails with 504. The X-Request-Timeout header does the same; the shorter one applies.")
+    # Set by `route`: the next-best (provider, model) for a routed request.
+    _alternate: Optional[tuple] = PrivateAttr(None)
 
 
 class GenerateTextResponse(BaseModel):
@@ -30,12 +186,53 @@ class GenerateTextResponse(BaseModel):
     input_token: int = Field(0, description="The number of tokens in the input prompt. Defaults to 0 if not provided.")
     output_token: int = Field(0, description="The number of tokens generated by the AI model as output.")
     prompt_returned: Optional[str] = Field(None, description="The original prompt returned along with the output text, if requested.")
+    cached: bool = Field(False, description="Whether the text was served from the response cache. Cached responses consume no tokens.")
+    stale: bool = Field(False, description="Whether the cached text was past its TTL, served because the provider is failing.")
+    hedged: bool = Field(False, description="Whether the text came from the hedged duplicate request.")
+    fallback: Optional[str] = Field(None, description="The 'provider:model' that served the request because the requested model was unavailable.")
+    routed_to: Optional[str] = Field(None, description="The 'provider:model' the router chose for provider 'auto'.")
+    escalated: Optional[bool] = Field(None, description="In cascade mode, whether the cheap answer was rejected and the requested model answered.")
+    rejected_reasons: Optional[List[str]] = Field(None, description="In cascade mode, why the cheap answer was rejected.")
+
+class BatchGenerateTextRequest(BaseModel):
+    items: List[GenerateTextRequest] = Field(..., description="The generation requests to run. Results are returned in the same order.")
+
+class BatchGenerateTextItem(BaseModel):
+    status_code: int = Field(..., description="HTTP-style status of this item: 200 on success, otherwise the error status.")
+    result: Optional[GenerateTextResponse] = Field(None, description="The generation result, if the item succeeded.")
+    error: Optional[str] = Field(None, description="Error message, if the item failed.")
+
+class BatchGenerateTextResponse(BaseModel):
+    results: List[BatchGenerateTextItem] = Field(..., description="One entry per requested item, in request order.")
+
+class ProfileRequest(BaseModel):
+    requests: Optional[int] = Field(None, ge=1, description="Profile until this many requests have completed.")
+    seconds: Optional[float] = Field(None, gt=0, description="Profile for this many seconds. Sessions never run longer than PROFILE_MAX_SECONDS.")
+    interval_ms: float = Field(5.0, ge=1, description="Milliseconds between stack samples.")
+    path_prefix: Optional[str] = Field(None, description="Only count requests whose path starts with this, e.g. '/transcribe-audio'.")
+    include_idle: bool = Field(False, description="Keep samples of threads that are only waiting.")
 
 class TranscribeAudioResponse(BaseModel):
     transcription: str = Field(..., description="The transcribed text or JSON object from the audio file.")
+    trimmed_ratio: Optional[float] = Field(None, description="With trim_silence: the fraction of the recording cut as silence.")
+    seconds_saved: Optional[float] = Field(None, description="With trim_silence: seconds of silence not sent to the provider.")
+    cached: bool = Field(False, description="Whether the transcription was served from the cache of earlier uploads of the same file.")
 
 class ImageToTextResponse(BaseModel):
     description: str = Field(..., description="The text description generated from the image.")
+    cached: bool = Field(False, description="Whether the description was served from the cache of earlier uploads of the same image.")
+
+class BatchImageToTextItem(BaseModel):
+    index: int = Field(..., description="Position of the image in the batch: uploads in order, with each zip archive's images in archive order.")
+    filename: Optional[str] = Field(None, description="The uploaded file name; for zip members, the archive name and the member path.")
+    status_code: int = Field(..., description="HTTP-style status of this item: 200 on success, otherwise the error status.")
+    description: Optional[str] = Field(None, description="The text description generated from the image, if the item succeeded.")
+    error: Optional[str] = Field(None, description="Error message, if the item failed.")
+    cached: bool = Field(False, description="Whether the description was served from the image cache.")
+    packed: bool = Field(False, description="Whether the image was described together with others in one request.")
+
+class BatchImageToTextResponse(BaseModel):
+    results: List[BatchImageToTextItem] = Field(..., description="One entry per image, in batch order.")
 
 class TextToImageRequest(BaseModel):
     prompt: str = Field(..., description="The text description of the image to generate.")
@@ -44,48 +241,675 @@ class TextToImageRequest(BaseModel):
 
 class TextToImageResponse(BaseModel):
     task_id: str = Field(..., description="The ID of the image generation task.")
+    cached: bool = Field(False, description="Whether the image was served from the cache of earlier identical requests; the task has then already succeeded.")
 
 class TextToImageStatusResponse(BaseModel):
     status: str = Field(..., description="The status of the image generation task.")
     image_url: Optional[str] = Field(None, description="The URL of the generated image, if available.")
     error: Optional[str] = Field(None, description="Error message, if any.")
 
+class JobRequest(BaseModel):
+    kind: str = Field(..., description="What to run: 'generate-text' or 'generate-text/batch'.")
+    request: dict = Field(..., description="The request body the matching endpoint takes.")
+    priority: Literal["high", "normal", "low"] = Field("normal", description="Higher-priority jobs start first; jobs of equal priority start in submission order.")
 
-@app.post("/generate-text", response_model=GenerateTextResponse)
-async def generate_text(request: GenerateTextRequest):
-    try:
-        if request.provider == "openai":
-            client = OpenAIWrapper(model=request.model, system_prompt=request.system_instructions)
-            generated_text, input_tokens, output_tokens = client.generate_text(
-                prompt=request.prompt,
-                max_tokens=request.max_tokens,
-                temperature=request.temperature,
+class JobResponse(BaseModel):
+    job_id: str = Field(..., description="The ID of the job.")
+    kind: str = Field(..., description="What the job runs.")
+    priority: str = Field(..., description="The job's priority.")
+    status: str = Field(..., description="One of 'queued', 'running', 'succeeded', 'failed' or 'canceled'.")
+    created_at: float = Field(..., description="Submission time, in seconds since the epoch.")
+    started_at: Optional[float] = Field(None, description="When the job last started running.")
+    finished_at: Optional[float] = Field(None, description="When the job finished.")
+    result: Optional[dict] = Field(None, description="The response the matching endpoint would have returned, once the job has succeeded.")
+    status_code: Optional[int] = Field(None, description="HTTP-style status of the finished job: 200 on success, otherwise the error status.")
+    error: Optional[str] = Field(None, description="Error message, if the job failed.")
+
+
+def generation_cache_key(request: GenerateTextRequest):
+    """Return the response cache key for a generation request."""
+    cascade = None
+    if request.cascade:
+        cascade = {
+            "model": cascade_target(request),
+            "min_length": request.min_length,
+            "required_sections": request.required_sections,
+            "reject_refusals": request.reject_refusals,
+        }
+    return make_key(
+        provider=request.provider,
+        model=request.model,
+        system_instructions=request.system_instructions,
+        prompt=request.prompt,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens,
+        cascade=cascade,
+    )
+
+
+def cascade_target(request: GenerateTextRequest):
+    """Return the (provider, model) of the cheap model a cascade request tries first."""
+    return (request.cascade_provider or CASCADE_PROVIDER, request.cascade_model or CASCADE_MODEL)
+
+
+def provider_recently_failed(provider):
+    """Whether the provider has raised an error within PROVIDER_ERROR_WINDOW seconds."""
+    failed_at = _provider_failures.get(provider)
+    return failed_at is not None and time.monotonic() - failed_at < PROVIDER_ERROR_WINDOW
+
+
+def spawn(coro):
+    """Run a coroutine in the background, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def text_wrapper(provider, model, system_instructions):
+    """Return the shared text wrapper for a provider, model and system prompt."""
+    return get_wrapper(TEXT_WRAPPERS[provider], model=model, system_prompt=system_instructions)
+
+
+def hedge_wrapper(request: GenerateTextRequest):
+    """Return the wrapper a hedged duplicate of the request is sent to."""
+    return text_wrapper(
+        request.hedge_provider or request.provider,
+        request.hedge_model or request.model,
+        request.system_instructions,
+    )
+
+
+def route(request: GenerateTextRequest) -> GenerateTextRequest:
+    """
+    Resolve provider 'auto' to the provider and model the router ranks best.
+
+    Returns a copy of the request naming the chosen provider and model, or the
+    request itself when it already names them.
+    """
+    if request.provider != "auto":
+        if not request.model:
+            raise HTTPException(status_code=400, detail="A model is required unless provider is 'auto'.")
+        return request
+    ranked = get_router().rank(
+        tier=request.tier,
+        latency_slo=request.latency_slo,
+        min_context=estimate_text_tokens({"prompt": request.prompt, "max_tokens": request.max_tokens}),
+    )
+    if not ranked:
+        raise HTTPException(status_code=503, detail=f"No configured model can serve a '{request.tier}' text request of this size.")
+    provider, model = ranked[0]
+    routed = request.model_copy(update={"provider": provider, "model": model})
+    routed._alternate = ranked[1] if len(ranked) > 1 else None
+    return routed
+
+
+def fallback_model(request: GenerateTextRequest):
+    """Return the (provider, model) to use if the request's model is unavailable, or None."""
+    return fallback_for(request.provider, request.model) or request._alternate
+
+
+def validate_providers(request: GenerateTextRequest):
+    """Reject requests naming an unknown provider."""
+    providers = [request.provider, request.hedge_provider]
+    if request.cascade:
+        providers.append(cascade_target(request)[0])
+    if any(provider and provider not in TEXT_WRAPPERS for provider in providers):
+        raise HTTPException(status_code=400, detail="Invalid provider. Choose 'openai', 'groq', or 'anthropic'.")
+
+
+def upstream_error(e, prefix="Server error"):
+    """
+    Translate a provider failure into the HTTPException returned to the client.
+
+    Open circuits become 503, upstream rate limits 429, timeouts 504 and other
+    upstream outages 502; anything else stays a 500.
+    """
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, DeadlineExceeded):
+        return HTTPException(status_code=504, detail=f"{prefix}: {str(e)}")
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail=f"{prefix}: {str(e)}", headers={"Retry-After": str(math.ceil(e.retry_after))})
+    status = status_code_of(e)
+    if status == 429:
+        delay = retry_after(e)
+        headers = {"Retry-After": str(math.ceil(delay))} if delay is not None else None
+        return HTTPException(status_code=429, detail=f"{prefix}: upstream rate limit: {str(e)}", headers=headers)
+    if is_timeout(e):
+        return HTTPException(status_code=504, detail=f"{prefix}: upstream timeout: {str(e)}")
+    if is_transient(e):
+        return HTTPException(status_code=502, detail=f"{prefix}: upstream unavailable: {str(e)}")
+    return HTTPException(status_code=500, detail=f"{prefix}: {str(e)}")
+
+
+def unavailable(e):
+    """Whether an error means the model is unhealthy, so a configured fallback should be tried."""
+    return isinstance(e, CircuitOpenError) or is_transient(e)
+
+
+async def call_cascade(request: GenerateTextRequest) -> GenerateTextResponse:
+    """
+    Answer with the cheap cascade model if its answer passes the acceptance check,
+    otherwise with the requested model.
+    """
+    provider, model = cascade_target(request)
+    check = AcceptanceCheck(request.min_length, request.required_sections, request.reject_refusals)
+    cheap = request.model_copy(update={"provider": provider, "model": model, "cascade": False, "hedge": False})
+    cheap._alternate = None
+    quality = request.model_copy(update={"cascade": False})
+    router = get_router()
+    quality_latency = router.expected_latency(request.provider, request.model) if (request.provider, request.model) in router.models else None
+    if exceeds_context(router.models.get((provider, model)), request.prompt, request.max_tokens):
+        # The cheap model cannot take this request at all.
+        cascade_stats.escalated(["context_window"], 0.0)
+        result, reasons = await call_provider(quality), ["context_window"]
+    else:
+        result, reasons = await arun_cascade(
+            lambda: call_provider(cheap),
+            lambda: call_provider(quality),
+            lambda result: check(result.generated_text),
+            quality_latency,
+        )
+    result.escalated = bool(reasons)
+    result.rejected_reasons = reasons or None
+    return result
+
+
+async def call_provider(request: GenerateTextRequest) -> GenerateTextResponse:
+    """
+    Call the provider wrapper for a request and record failures for the cache.
+
+    Hedges if asked. If the model is unavailable and `LLM_FALLBACKS` names a
+    fallback for it, or the router ranked a second model for it, that model
+    answers instead. Cascade requests go through `call_cascade`.
+    """
+    if request.cascade:
+        return await call_cascade(request)
+    def generate(client):
+        return client.agenerate_text(
+            prompt=request.prompt,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+        )
+
+    client = text_wrapper(request.provider, request.model, request.system_instructions)
+    hedged = False
+    fallback = None
+    try:
+        if request.hedge:
+            backup = hedge_wrapper(request)
+            (generated_text, input_tokens, output_tokens), hedged = await hedged_call(
+                lambda: generate(client),
+                # The duplicate must not coalesce onto the call it is hedging.
+                lambda: uncoalesced(lambda: generate(backup)),
+                ("response", request.provider, request.model),
+                hedge_policy,
             )
-        elif request.provider == "groq":
-            client = GroqWrapper(model=request.model, system_prompt=request.system_instructions)
-        elif request.provider == "anthropic":
-            client = AnthropicWrapper(model=request.model, system_prompt=request.system_instructions)
         else:
-            raise HTTPException(status_code=400, detail="Invalid provider. Choose 'openai', 'groq', or 'anthropic'.")
-            generated_text, input_tokens, output_tokens = client.generate_text(
-                prompt=request.prompt,
-                max_tokens=request.max_tokens,
-                temperature=request.temperature,
-            )
-        result = GenerateTextResponse(
-            generated_text=generated_text,
-            input_token=input_tokens,
-            output_token=output_tokens
-        )
-        if request.return_prompt:
-            result.prompt_returned = request.prompt
+            generated_text, input_tokens, output_tokens = await generate(client)
+    except Exception as e:
+        _provider_failures[request.provider] = time.monotonic()
+        fallback = fallback_model(request)
+        if fallback is None or not unavailable(e):
+            raise
+        generated_text, input_tokens, output_tokens = await generate(text_wrapper(*fallback, request.system_instructions))
+    else:
+        _provider_failures.pop(request.provider, None)
+    return GenerateTextResponse(
+        generated_text=generated_text,
+        input_token=input_tokens,
+        output_token=output_tokens,
+        hedged=hedged,
+        fallback=":".join(fallback) if fallback else None,
+    )
 
-        return result
+
+async def fill_cache(request: GenerateTextRequest, key):
+    """Generate a fresh result and store it in the response cache."""
+    result = await call_provider(request)
+    if not result.fallback:
+        await response_cache.aset(key, {"generated_text": result.generated_text})
+    return result
+
+
+async def revalidate(request: GenerateTextRequest, key):
+    """Background refresh of a stale cache entry; failures leave the stale entry in place."""
+    try:
+        await generation_flight.ado(key, lambda: fill_cache(request, key))
+    except Exception:
+        pass
+
+
+async def run_generation(request: GenerateTextRequest, routed: Optional[GenerateTextRequest] = None) -> GenerateTextResponse:
+    """
+    Run one text generation request, serving it from the response cache where possible.
+
+    `routed` is the request after `route`, if the caller has already routed it.
+    """
+    if routed is None:
+        routed = route(request)
+    routed_to = f"{routed.provider}:{routed.model}" if routed is not request else None
+    request = routed
+    validate_providers(request)
+    if request.cache == "bypass":
+        result = await call_provider(request)
+    else:
+        key = generation_cache_key(request)
+        hit = None
+        if request.cache != "refresh":
+            hit = await response_cache.aget(key, allow_stale=provider_recently_failed(request.provider))
+        if hit is not None:
+            value, is_stale = hit
+            if is_stale:
+                spawn(revalidate(request, key))
+            result = GenerateTextResponse(generated_text=value["generated_text"], cached=True, stale=is_stale)
+        else:
+            try:
+                result = await generation_flight.ado(key, lambda: fill_cache(request, key))
+                # Coalesced callers share one result object; give each its own copy.
+                result = result.model_copy()
+            except Exception:
+                # Stale-if-error: fall back to an expired entry rather than failing.
+                hit = await response_cache.aget(key, allow_stale=True)
+                if hit is None:
+                    raise
+                result = GenerateTextResponse(generated_text=hit[0]["generated_text"], cached=True, stale=hit[1])
+    if request.return_prompt:
+        result.prompt_returned = request.prompt
+    result.routed_to = routed_to
+
+    return result
+
+
+@app.post("/generate-text", response_model=GenerateTextResponse)
+async def generate_text(request: GenerateTextRequest, http_request: Request, x_request_timeout: Optional[float] = Header(None)):
+    """
+    Generate text with the requested provider and model.
+
+    With a `timeout` field or `X-Request-Timeout` header, provider calls still
+    running at the deadline are cancelled and the request fails with 504. If
+    the client disconnects first, the provider call is cancelled too, so no
+    more output is generated for nobody.
+    """
+    try:
+        return await run_until_disconnected(http_request, run_generation(request), request_timeout(request, x_request_timeout))
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
-    
+        raise upstream_error(e)
+
+
+def request_timeout(request, header=None):
+    """Return the seconds a request may take: the shortest of its `timeout`, the X-Request-Timeout header and REQUEST_TIMEOUT."""
+    limits = [value for value in (getattr(request, "timeout", None), header, REQUEST_TIMEOUT) if value]
+    return min(limits) if limits else None
+
+
+async def with_deadline(timeout, awaitable):
+    with deadline_scope(timeout):
+        return await awaitable
+
+
+async def run_until_disconnected(http_request, awaitable, timeout=None):
+    """
+    Run a request's work in its own task, cancelling it if the client disconnects or the deadline passes.
+
+    Cancelling the task cancels the provider calls it is waiting on, closing
+    their HTTP requests. Calls shared with other requests through coalescing
+    keep running for them.
+
+    Parameters:
+    - http_request (Request): The incoming request, checked for a disconnect every DISCONNECT_POLL_SECONDS.
+    - awaitable: The work; it runs inside `deadline_scope(timeout)`.
+    - timeout (float, optional): Seconds allowed.
+
+    Raises:
+    - DeadlineExceeded: If the deadline passed first.
+    - HTTPException: 499 if the client disconnected.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    task = asyncio.ensure_future(with_deadline(timeout, awaitable))
+    expired = False
+    try:
+        while True:
+            wait = DISCONNECT_POLL_SECONDS if deadline is None else min(DISCONNECT_POLL_SECONDS, deadline - time.monotonic())
+            done, _ = await asyncio.wait({task}, timeout=max(0.0, wait))
+            if done:
+                return task.result()
+            if deadline is not None and time.monotonic() >= deadline:
+                expired = True
+                raise DeadlineExceeded(f"Request deadline of {timeout:g}s exceeded")
+            if await http_request.is_disconnected():
+                cancellation_stats.record_disconnect()
+                raise HTTPException(status_code=499, detail="Client closed request.")
+    finally:
+        if not task.done():
+            # The message lets the provider calls cut short count as deadline hits.
+            task.cancel(DEADLINE_CANCEL if expired else None)
+            await asyncio.gather(task, return_exceptions=True)
+
+
+async def relay_until_disconnected(http_request, events, timeout=None):
+    """
+    Relay a response stream, cancelling it as soon as the client disconnects.
+
+    The stream is read by its own task, which `timeout` applies to, so a
+    disconnect is noticed even while waiting on the provider. The relay ends
+    when that task does; nothing is put on the queue once it stops, so a
+    cancelled producer never waits on a reader that has gone.
+    """
+    queue = asyncio.Queue(maxsize=1)
+
+    async def pump():
+        try:
+            with deadline_scope(timeout):
+                async for event in events:
+                    await queue.put(event)
+        finally:
+            await events.aclose()
+
+    producer = asyncio.ensure_future(pump())
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, producer}, timeout=DISCONNECT_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+                continue
+            getter.cancel()
+            if producer in done:
+                while not queue.empty():
+                    yield queue.get_nowait()
+                # Raise the stream's error, if it failed.
+                producer.result()
+                return
+            if await http_request.is_disconnected():
+                cancellation_stats.record_disconnect()
+                return
+    finally:
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+
+def provider_semaphore(provider):
+    """Return the semaphore that caps concurrent batch calls to one provider."""
+    semaphore = _provider_semaphores.get(provider)
+    if semaphore is None:
+        semaphore = _provider_semaphores[provider] = asyncio.Semaphore(PROVIDER_CONCURRENCY.get(provider, 4))
+    return semaphore
+
+
+async def run_batch_item(request: GenerateTextRequest) -> BatchGenerateTextItem:
+    """Run one batch item under its provider's concurrency cap and its own `timeout`, capturing any error."""
+    try:
+        routed = route(request)
+        with deadline_scope(request.timeout):
+            async with provider_semaphore(routed.provider):
+                return BatchGenerateTextItem(status_code=200, result=await run_generation(request, routed))
+    except Exception as e:
+        error = upstream_error(e)
+        return BatchGenerateTextItem(status_code=error.status_code, error=error.detail)
+
+
+@app.post("/generate-text/batch", response_model=BatchGenerateTextResponse)
+async def generate_text_batch(request: BatchGenerateTextRequest, http_request: Request = None, x_request_timeout: Optional[float] = Header(None)):
+    """
+    Generate text for several requests concurrently.
+
+    Items run in parallel, at most `<PROVIDER>_MAX_CONCURRENCY` at a time per provider
+    across all in-flight batches. Results come back in request order; a failing item
+    carries its own `status_code` and `error` and does not fail the batch.
+    Each item's `timeout` applies to it; `X-Request-Timeout` to the whole batch.
+    """
+    if len(request.items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch too large. At most {MAX_BATCH_SIZE} items are allowed.")
+
+    async def run_items():
+        # Started inside the batch's deadline scope, so every item sees the batch deadline too.
+        return await asyncio.gather(*(run_batch_item(item) for item in request.items))
+
+    timeout = request_timeout(request, x_request_timeout)
+    if http_request is None:
+        # Run as a background job: nobody to disconnect.
+        with deadline_scope(timeout):
+            results = await run_items()
+    else:
+        try:
+            results = await run_until_disconnected(http_request, run_items(), timeout)
+        except DeadlineExceeded as e:
+            raise upstream_error(e)
+    return BatchGenerateTextResponse(results=results)
+
+def collect_stats():
+    """Return the counters shown by `GET /stats` and exported by `/metrics`."""
+    limiter = get_limiter()
+    return {
+        "response_cache": dict(response_cache.stats),
+        "transcription_cache": dict(transcription_cache.stats),
+        "image_cache": dict(image_cache.stats),
+        "text_to_image_cache": dict(text_to_image_cache.stats),
+        "text_to_image": image_jobs.snapshot(),
+        "jobs": job_queue.snapshot(),
+        "coalescing": {
+            "generate_text": {**generation_flight.stats, "in_flight": generation_flight.in_flight},
+            "wrappers": {**wrapper_flight.stats, "in_flight": wrapper_flight.in_flight},
+        },
+        "rate_limiter": dict(limiter.stats) if limiter else None,
+        "hedging": dict(hedge_policy.stats),
+        "circuit_breakers": breaker_states(),
+        "model_health": health_states(),
+        "cascade": cascade_stats.snapshot(),
+        "transcoding": transcode_stats.snapshot(),
+        "silence_trimming": vad_stats.snapshot(),
+        "image_normalization": image_stats.snapshot(),
+        "cancellation": dict(cancellation_stats.stats),
+    }
+
+
+register_stats(collect_stats)
+
+
+@app.get("/stats")
+async def get_stats():
+    """Return response cache, request coalescing and rate limiter counters."""
+    return collect_stats()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow the request only if it carries the `ADMIN_TOKEN`; admin routes are hidden when no token is configured."""
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, token):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def start_profile(request: ProfileRequest):
+    """
+    Start a sampling profile of the whole process.
+
+    It covers the next `requests` requests (optionally only those under `path_prefix`),
+    or `seconds`. Fetch the result from `GET /admin/profile/collapsed` once the
+    state in `GET /admin/profile` is "done".
+    """
+    if request.requests is None and request.seconds is None:
+        raise HTTPException(status_code=400, detail="Give the number of requests or the seconds to profile.")
+    if not profiler.start(request.requests, request.seconds, request.interval_ms / 1000.0, request.path_prefix, request.include_idle):
+        raise HTTPException(status_code=409, detail="A profiling session is already running.")
+    return profiler.status()
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile_status():
+    """Return the state of the current or last profiling session."""
+    return profiler.status()
+
+
+@app.get("/admin/profile/collapsed", dependencies=[Depends(require_admin)])
+async def get_profile_collapsed():
+    """Return the profile in collapsed-stack format, for flamegraph.pl or speedscope."""
+    return PlainTextResponse(profiler.collapsed())
+
+
+@app.delete("/admin/profile", dependencies=[Depends(require_admin)])
+async def stop_profile():
+    """Stop the running profiling session early."""
+    await asyncio.to_thread(profiler.stop)
+    return profiler.status()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Return all metrics in the Prometheus text exposition format."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/models")
+async def list_models():
+    """
+    List the registered models with the router's current view of each.
+
+    Every entry has the registry's context window, prices and capabilities, plus
+    `expected_latency` (seconds), `healthy`, and whether its provider is configured.
+    """
+    router = get_router()
+    models = []
+    for (provider, model), spec in router.models.items():
+        entry = {"provider": provider, "model": model, **spec, "configured": provider_configured(provider)}
+        if provider in TEXT_WRAPPERS:
+            entry["expected_latency"] = router.expected_latency(provider, model)
+            entry["healthy"] = router.healthy(provider, model)
+        models.append(entry)
+    return {"models": models}
+
+
+def sse_event(event, data):
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_generation(request, routed_to=None):
+    """Relay a wrapper's text stream as server-sent events, ending with a usage summary."""
+    def open_stream(client):
+        return client.astream_text(
+            prompt=request.prompt,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+        )
+
+    async def with_fallback(events):
+        # Switch to the configured fallback model if the stream fails before its first event.
+        started = False
+        try:
+            async for event in events:
+                started = True
+                yield event
+        except Exception as e:
+            fallback = fallback_model(request)
+            if started or fallback is None or not unavailable(e):
+                raise
+            yield {"type": "fallback", "provider": fallback[0], "model": fallback[1]}
+            async for event in open_stream(text_wrapper(*fallback, request.system_instructions)):
+                yield event
+
+    start = time.perf_counter()
+    time_to_first_token = None
+    input_tokens = output_tokens = 0
+    if routed_to:
+        provider, model = routed_to.split(":", 1)
+        yield sse_event("route", {"provider": provider, "model": model})
+    try:
+        client = text_wrapper(request.provider, request.model, request.system_instructions)
+        if request.hedge:
+            backup = hedge_wrapper(request)
+            events = hedged_stream(
+                lambda: open_stream(client),
+                lambda: open_stream(backup),
+                ("first_token", request.provider, request.model),
+                hedge_policy,
+            )
+        else:
+            events = open_stream(client)
+        async for event in with_fallback(events):
+            if event["type"] == "fallback":
+                yield sse_event("fallback", {"provider": event["provider"], "model": event["model"]})
+            elif event["type"] == "hedge":
+                yield sse_event("hedge", {
+                    "provider": request.hedge_provider or request.provider,
+                    "model": request.hedge_model or request.model,
+                })
+            elif event["type"] == "delta":
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start
+                yield sse_event("delta", {"text": event["text"]})
+            elif event["type"] == "usage":
+                input_tokens, output_tokens = event["input_tokens"], event["output_tokens"]
+    except Exception as e:
+        error = upstream_error(e)
+        yield sse_event("error", {"status_code": error.status_code, "detail": error.detail})
+        return
+    done = {
+        "input_token": input_tokens,
+        "output_token": output_tokens,
+        "time_to_first_token": time_to_first_token,
+        "total_time": time.perf_counter() - start,
+    }
+    if request.return_prompt:
+        done["prompt_returned"] = request.prompt
+    yield sse_event("done", done)
+
+
+@app.post("/generate-text/stream")
+async def generate_text_stream(request: GenerateTextRequest, http_request: Request, x_request_timeout: Optional[float] = Header(None)):
+    """
+    Stream generated text as server-sent events.
+
+    Emits `delta` events with `{"text": ...}` as tokens arrive, then a single `done`
+    event carrying `input_token`, `output_token`, `time_to_first_token` and `total_time`
+    (seconds). A failure after streaming has started is reported as an `error` event.
+    With `hedge`, a `hedge` event is sent first if the duplicate request won the race;
+    a `fallback` event is sent first if a configured fallback model took over.
+    With provider 'auto', a `route` event naming the chosen provider and model comes first.
+    At the `timeout` deadline the provider stream is cancelled and an `error` event
+    with status 504 ends the response; a client disconnect cancels it as well.
+    """
+    routed = route(request)
+    validate_providers(routed)
+    if request.cascade:
+        raise HTTPException(status_code=400, detail="Cascade mode needs the whole answer before it can be checked, so it is not available for streaming.")
+    return StreamingResponse(
+        relay_until_disconnected(
+            http_request,
+            stream_generation(routed, f"{routed.provider}:{routed.model}" if routed is not request else None),
+            request_timeout(request, x_request_timeout),
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+SUPPORTED_AUDIO_FORMATS = ["flac", "mp3", "mp4", "mpeg", "mpga", "m4a", "ogg", "wav", "webm"]
+
+
+def audio_extension(audio_file):
+    """Return the upload's file extension, or raise 400 if it is not a supported audio format."""
+    file_extension = os.path.splitext(audio_file.filename)[1][1:].lower()
+    if file_extension not in SUPPORTED_AUDIO_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file format. Supported formats are: {', '.join(SUPPORTED_AUDIO_FORMATS)}")
+    return file_extension
+
+
+def transcription_wrapper(provider):
+    """Return the shared speech-to-text wrapper for a provider, or raise 400 for an unknown one."""
+    if provider == "openai":
+        return get_wrapper(WhisperWrapper)
+    if provider == "groq":
+        return get_wrapper(GroqSTTWrapper)
+    raise HTTPException(status_code=400, detail="Invalid provider. Choose either 'openai' or 'groq'.")
+
+
 @app.post("/transcribe-audio", response_model=TranscribeAudioResponse)
 async def transcribe_audio(
     audio_file: UploadFile = File(...),
@@ -94,23 +918,15 @@ async def transcribe_audio(
     prompt: Optional[str] = Form(None, description="An optional text to guide the model's style or continue a previous audio segment."),
     response_format: str = Form("json", description="The format of the transcript output."),
     temperature: float = Form(0.0, description="The sampling temperature, between 0 and 1."),
-    timestamp_granularities: Optional[List[str]] = Query(None, description="The timestamp granularities to populate for this transcription (OpenAI only).")
+    timestamp_granularities: Optional[List[str]] = Query(None, description="The timestamp granularities to populate for this transcription (OpenAI only)."),
+    long_audio: Optional[bool] = Form(None, description="Split the recording on silences and transcribe the pieces in parallel. Defaults to on for uploads over LONG_AUDIO_THRESHOLD_BYTES."),
+    preprocess: Optional[Literal["opus", "flac", "none"]] = Form(None, description="Re-encode the upload as 16 kHz mono Opus or FLAC before sending it to the provider. Defaults to TRANSCRIBE_PREPROCESS."),
+    trim_silence: Optional[bool] = Form(None, description="Cut long silences before transcription; timestamps still refer to the original recording. Defaults to TRANSCRIBE_TRIM_SILENCE."),
+    cache: Optional[Literal["bypass", "refresh"]] = Form(None, description="Cache control. 'bypass' skips the cache entirely; 'refresh' ignores any cached entry and stores the new result.")
 ):
     try:
-        # Check if the provider is valid
-        if provider not in ["openai", "groq"]:
-            raise HTTPException(status_code=400, detail="Invalid provider. Choose either 'openai' or 'groq'.")
-
-        # Check if the file is in a supported format
-        supported_formats = ["flac", "mp3", "mp4", "mpeg", "mpga", "m4a", "ogg", "wav", "webm"]
-        file_extension = os.path.splitext(audio_file.filename)[1][1:].lower()
-        if file_extension not in supported_formats:
-            raise HTTPException(status_code=400, detail=f"Unsupported file format. Supported formats are: {', '.join(supported_formats)}")
-
-        # Save the uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_audio:
-            temp_audio.write(audio_file.file.read())
-            temp_audio_path = temp_audio.name
+        transcription_client = transcription_wrapper(provider)
+        file_extension = audio_extension(audio_file)
 
         # Prepare common parameters
         common_params = {
@@ -119,33 +935,176 @@ async def transcribe_audio(
             "response_format": response_format,
             "temperature": temperature
         }
+        if provider == "openai" and timestamp_granularities:
+            common_params["timestamp_granularities"] = timestamp_granularities
 
-        # Initialize the appropriate wrapper and transcribe based on the provider
-        if provider == "openai":
-            transcription_client = WhisperWrapper()
-            if timestamp_granularities:
-                common_params["timestamp_granularities"] = timestamp_granularities
-        else:  # provider == "groq"
-            transcription_client = GroqSTTWrapper()
+        if long_audio is None:
+            long_audio = (audio_file.size or 0) > LONG_AUDIO_THRESHOLD_BYTES
+        trim_silence = TRANSCRIBE_TRIM_SILENCE if trim_silence is None else trim_silence
+        if (long_audio or trim_silence) and response_format not in LONG_AUDIO_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported response format for long audio or silence trimming. Supported formats are: {', '.join(LONG_AUDIO_FORMATS)}")
+        preprocess = preprocess or TRANSCRIBE_PREPROCESS
 
-        # Transcribe the audio
-        transcription = transcription_client.transcribe(temp_audio_path, **common_params)
+        key = None
+        if cache != "bypass":
+            key = make_key(
+                content=await upload_digest(audio_file),
+                provider=provider,
+                model=transcription_client.model,
+                long_audio=long_audio,
+                preprocess=preprocess,
+                trim_silence=trim_silence,
+                **common_params,
+            )
+            hit = await transcription_cache.aget(key) if cache != "refresh" else None
+            if hit is not None:
+                return TranscribeAudioResponse(**hit[0], cached=True)
 
-        # Delete the temporary file
-        os.unlink(temp_audio_path)
+        offsets = None
+        if long_audio or trim_silence or preprocess != "none":
+            # ffmpeg needs a file on disk; the transcoded copy and any chunks are written next to it
+            async with upload_path(audio_file, suffix=f".{file_extension}") as audio_path:
+                audio_path, offsets = await prepare_audio(audio_path, preprocess, trim_silence)
+                if long_audio or trim_silence:
+                    # The chunked path maps timestamps back through the offsets; short recordings are one chunk.
+                    transcription = await atranscribe_long(transcription_client, audio_path, offsets=offsets, **common_params)
+                else:
+                    transcription = await transcription_client.atranscribe(audio_path, **common_params)
+        else:
+            # Stream the upload to the provider straight from the spooled request file
+            transcription = await transcription_client.atranscribe(audio_file.file, filename=audio_file.filename, **common_params)
 
-        return TranscribeAudioResponse(transcription=transcription)
+        result = TranscribeAudioResponse(transcription=transcription)
+        if offsets is not None:
+            result.trimmed_ratio, result.seconds_saved = offsets.trimmed_ratio, offsets.seconds_saved
+        if key is not None:
+            await transcription_cache.aset(key, result.model_dump(exclude={"cached"}))
+        return result
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Transcription error: {str(e)}")
+        raise upstream_error(e, "Transcription error")
+    finally:
+        await audio_file.close()
+
+
+async def prepare_audio(audio_path, preprocess, trim):
+    """
+    Run the optional pre-processing stages on an uploaded recording.
+
+    Returns:
+    - tuple: (path to transcribe, OffsetMap or None). The offsets are set when silences were trimmed.
+    """
+    if preprocess != "none":
+        audio_path = await transcode_for_speech(audio_path, preprocess)
+    if not trim:
+        return audio_path, None
+    return await trim_audio_silence(audio_path, codec=preprocess if preprocess != "none" else "flac")
+
+
+def ndjson_event(event, data):
+    """Format one newline-delimited JSON record, tagged with its event type."""
+    return json.dumps({"type": event, **data}) + "\n"
+
+
+async def stream_transcription(audio_file, file_extension, client, format_event, chunk_seconds, preprocess, trim, params):
+    """Transcribe an upload chunk by chunk, relaying each chunk's segments as soon as it and the ones before it are done."""
+    start = time.perf_counter()
+    time_to_first_segment = None
+    offsets = None
+    texts = []
+    language = None
+    duration = 0.0
+    segment_index = 0
+    try:
+        async with upload_path(audio_file, suffix=f".{file_extension}") as audio_path:
+            audio_path, offsets = await prepare_audio(audio_path, preprocess, trim)
+            async for piece in astream_long_transcription(client, audio_path, chunk_seconds=chunk_seconds, offsets=offsets, **params):
+                segments = piece["segments"] or [{"start": piece["start"], "end": piece["end"], "text": piece["text"]}]
+                for segment in segments:
+                    if not segment["text"].strip():
+                        continue
+                    if time_to_first_segment is None:
+                        time_to_first_segment = time.perf_counter() - start
+                    event = {"index": segment_index, "start": segment["start"], "end": segment["end"], "text": segment["text"].strip()}
+                    if piece.get("words"):
+                        event["words"] = [word for word in piece["words"] if segment["start"] <= word["start"] < segment["end"]]
+                    segment_index += 1
+                    yield format_event("segment", event)
+                texts.append(piece["text"])
+                language = language or piece.get("language")
+                duration = piece["end"]
+    except Exception as e:
+        error = upstream_error(e, "Transcription error")
+        yield format_event("error", {"status_code": error.status_code, "detail": error.detail})
+        return
+    finally:
+        await audio_file.close()
+    done = {
+        "text": " ".join(text for text in texts if text),
+        "language": language,
+        "duration": duration,
+        "time_to_first_segment": time_to_first_segment,
+        "total_time": time.perf_counter() - start,
+    }
+    if offsets is not None:
+        done["trimmed_ratio"], done["seconds_saved"] = offsets.trimmed_ratio, offsets.seconds_saved
+    yield format_event("done", done)
+
+
+@app.post("/transcribe-audio/stream")
+async def transcribe_audio_stream(
+    audio_file: UploadFile = File(...),
+    provider: str = Form(..., description="The provider to use for transcription. Either 'openai' or 'groq'."),
+    language: Optional[str] = Form(None, description="The language of the input audio."),
+    prompt: Optional[str] = Form(None, description="An optional text to guide the model's style."),
+    temperature: float = Form(0.0, description="The sampling temperature, between 0 and 1."),
+    timestamp_granularities: Optional[List[str]] = Query(None, description="Add 'word' to include word timestamps in each segment (OpenAI only)."),
+    stream_format: Literal["sse", "ndjson"] = Form("sse", description="Server-sent events or newline-delimited JSON."),
+    chunk_seconds: Optional[float] = Form(None, description="Length of the pieces transcribed in parallel. Shorter pieces give the first text sooner. Defaults to TRANSCRIBE_STREAM_CHUNK_SECONDS."),
+    preprocess: Optional[Literal["opus", "flac", "none"]] = Form(None, description="Re-encode the upload as 16 kHz mono Opus or FLAC before sending it to the provider. Defaults to TRANSCRIBE_PREPROCESS."),
+    trim_silence: Optional[bool] = Form(None, description="Cut long silences before transcription; timestamps still refer to the original recording. Defaults to TRANSCRIBE_TRIM_SILENCE."),
+):
+    """
+    Stream a transcript as it is produced.
+
+    The recording is transcribed in pieces as in long-audio mode. Each piece's
+    segments are sent, in order, as soon as the piece and those before it are
+    done: `segment` events with `index`, `start`, `end` (seconds into the
+    recording) and `text`, plus `words` when word timestamps were asked for. A
+    final `done` event carries the whole `text`, `language`, `duration`,
+    `time_to_first_segment` and `total_time`. A failure after streaming has
+    started is reported as an `error` event.
+
+    With `stream_format=ndjson` every line is a JSON object whose `type` is the event name.
+    """
+    try:
+        client = transcription_wrapper(provider)
+        file_extension = audio_extension(audio_file)
+    except HTTPException:
+        await audio_file.close()
+        raise
+    params = {"language": language, "prompt": prompt, "temperature": temperature}
+    if provider == "openai" and timestamp_granularities:
+        params["timestamp_granularities"] = timestamp_granularities
+    if stream_format == "ndjson":
+        format_event, media_type = ndjson_event, "application/x-ndjson"
+    else:
+        format_event, media_type = sse_event, "text/event-stream"
+    return StreamingResponse(
+        stream_transcription(audio_file, file_extension, client, format_event, chunk_seconds or TRANSCRIBE_STREAM_CHUNK_SECONDS,
+                             preprocess or TRANSCRIBE_PREPROCESS, TRANSCRIBE_TRIM_SILENCE if trim_silence is None else trim_silence, params),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/image-to-text", response_model=ImageToTextResponse)
 async def image_to_text(
     image_file: UploadFile = File(...),
     provider: str = Form(..., description="The provider to use for image-to-text conversion. Either 'openai' or 'anthropic'."),
     prompt: str = Form("Describe this image in detail.", description="The prompt to guide the model's description."),
-    max_tokens: int = Form(1000, description="The maximum number of tokens to generate.")
+    max_tokens: int = Form(1000, description="The maximum number of tokens to generate."),
+    cache: Optional[Literal["bypass", "refresh"]] = Form(None, description="Cache control. 'bypass' skips the cache entirely; 'refresh' ignores any cached entry and stores the new result.")
 ):
     try:
         # Check if the provider is valid
@@ -156,66 +1115,343 @@ async def image_to_text(
         if not image_file.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="Uploaded file is not an image.")
 
-        # Save the uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_image:
-            temp_image.write(image_file.file.read())
-            temp_image_path = temp_image.name
-
         # Initialize the appropriate wrapper based on the provider
         if provider == "openai":
-            client = OpenAIWrapper()
+            client = get_wrapper(OpenAIWrapper)
         else:  # provider == "anthropic"
-            client = AnthropicWrapper()
+            client = get_wrapper(AnthropicWrapper)
+
+        key = None
+        if cache != "bypass":
+            key = make_key(
+                content=await upload_digest(image_file),
+                provider=provider,
+                model=client.model,
+                prompt=prompt,
+                max_tokens=max_tokens,
+            )
+            hit = await image_cache.aget(key) if cache != "refresh" else None
+            if hit is not None:
+                return ImageToTextResponse(**hit[0], cached=True)
 
         # Convert image to text
-        description = client.image_to_text(
-            image_path=temp_image_path,
+        description = await client.aimage_to_text(
+            image_path=image_file.file,
             prompt=prompt,
             max_tokens=max_tokens
         )
 
-        # Delete the temporary file
-        os.unlink(temp_image_path)
-
+        if key is not None:
+            await image_cache.aset(key, {"description": description})
         return ImageToTextResponse(description=description)
     except HTTPException as e:
         raise e
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Uploaded file is not a readable image.")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Image-to-text conversion error: {str(e)}")
+        raise upstream_error(e, "Image-to-text conversion error")
+    finally:
+        await image_file.close()
+
+
+def batch_image_error(index, filename, e):
+    """Turn a failure on one image of a batch into its result entry."""
+    if isinstance(e, UnidentifiedImageError):
+        error = HTTPException(status_code=400, detail="Uploaded file is not a readable image.")
+    elif isinstance(e, ImageTooLargeError):
+        error = HTTPException(status_code=413, detail=f"Image too large: {str(e)}")
+    else:
+        error = upstream_error(e, "Image-to-text conversion error")
+    return BatchImageToTextItem(index=index, filename=filename, status_code=error.status_code, error=error.detail)
+
+
+async def describe_image_pack(client, provider, pack, prompt, max_tokens, cache, results):
+    """
+    Describe a pack of batch images under the provider's concurrency cap, putting each image's result on `results`.
+
+    Cached images are answered from the cache. If more than one is left they are
+    sent in one request and the answer is split per image; when that request
+    fails or its answer cannot be split, each image is described on its own.
+    """
+    async with provider_semaphore(provider):
+        pending = []
+        for index, filename, source in pack:
+            try:
+                image = await asyncio.to_thread(read_zip_member, *source) if isinstance(source, tuple) else source
+                key = None
+                if cache != "bypass":
+                    key = make_key(
+                        content=await upload_digest(image),
+                        provider=provider,
+                        model=client.model,
+                        prompt=prompt,
+                        max_tokens=max_tokens,
+                    )
+                    hit = await image_cache.aget(key) if cache != "refresh" else None
+                    if hit is not None:
+                        results.put_nowait(BatchImageToTextItem(index=index, filename=filename, status_code=200, cached=True, **hit[0]))
+                        continue
+                pending.append((index, filename, image, key))
+            except Exception as e:
+                results.put_nowait(batch_image_error(index, filename, e))
+
+        descriptions = None
+        if len(pending) > 1:
+            try:
+                answer = await client.aimages_to_text(
+                    image_paths=[image for _, _, image, _ in pending],
+                    prompt=packed_prompt(prompt, len(pending)),
+                    max_tokens=min(max_tokens * len(pending), PACK_MAX_TOKENS),
+                )
+                descriptions = split_packed(answer, len(pending))
+            except Exception:
+                pass
+            image_stats.record_pack(len(pending), descriptions is not None)
+
+        for position, (index, filename, image, key) in enumerate(pending):
+            try:
+                if descriptions is not None:
+                    # Packed answers come from a different prompt, so they are not cached.
+                    results.put_nowait(BatchImageToTextItem(index=index, filename=filename, status_code=200, description=descriptions[position], packed=True))
+                    continue
+                description = await client.aimage_to_text(image_path=image, prompt=prompt, max_tokens=max_tokens)
+                if key is not None:
+                    await image_cache.aset(key, {"description": description})
+                results.put_nowait(BatchImageToTextItem(index=index, filename=filename, status_code=200, description=description))
+            except Exception as e:
+                results.put_nowait(batch_image_error(index, filename, e))
+
+
+async def describe_images(client, provider, images, uploads, archives, images_per_request, prompt, max_tokens, cache):
+    """Describe a batch of images concurrently, yielding each result as soon as it is ready, then close the uploads."""
+    results = asyncio.Queue()
+    packs = [images[start:start + images_per_request] for start in range(0, len(images), images_per_request)]
+    tasks = [asyncio.ensure_future(describe_image_pack(client, provider, pack, prompt, max_tokens, cache, results)) for pack in packs]
+    try:
+        for _ in images:
+            yield await results.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for archive in archives:
+            archive.close()
+        for upload in uploads:
+            await upload.close()
+
+
+async def stream_image_batch(results, format_event):
+    """Relay batch results as `result` events in completion order, then a `done` summary."""
+    start = time.perf_counter()
+    count = failed = 0
+    try:
+        async for item in results:
+            count += 1
+            failed += item.status_code != 200
+            yield format_event("result", item.model_dump())
+    finally:
+        await results.aclose()
+    yield format_event("done", {"count": count, "failed": failed, "total_time": time.perf_counter() - start})
+
+
+async def batch_images(image_files, archives):
+    """
+    List the images of a batch upload as (index, filename, source) triples.
+
+    The source is the upload's file, or an (archive, member) pair for images in
+    a zip archive, which are only decompressed when their turn comes. Opened
+    archives are appended to `archives` for the caller to close.
+    """
+    images = []
+    for upload in image_files:
+        if upload.content_type in ("application/zip", "application/x-zip-compressed") or (upload.filename or "").lower().endswith(".zip"):
+            try:
+                archive, members = await asyncio.to_thread(zip_images, upload.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"{upload.filename} is not a valid zip archive.")
+            archives.append(archive)
+            images.extend((f"{upload.filename}/{member.filename}", (archive, member)) for member in members)
+        elif (upload.content_type or "").startswith("image/"):
+            images.append((upload.filename, upload.file))
+        else:
+            raise HTTPException(status_code=400, detail=f"{upload.filename} is not an image or a zip archive.")
+        if len(images) > MAX_BATCH_SIZE:
+            raise HTTPException(status_code=400, detail=f"Batch too large. At most {MAX_BATCH_SIZE} images are allowed.")
+    if not images:
+        raise HTTPException(status_code=400, detail="No images found in the upload.")
+    return [(index, filename, source) for index, (filename, source) in enumerate(images)]
+
+
+@app.post("/image-to-text/batch", response_model=BatchImageToTextResponse)
+async def image_to_text_batch(
+    image_files: List[UploadFile] = File(..., description="Images, zip archives of images, or both."),
+    provider: str = Form(..., description="The provider to use for image-to-text conversion. Either 'openai' or 'anthropic'."),
+    prompt: str = Form("Describe this image in detail.", description="The prompt to guide the model's description of each image."),
+    max_tokens: int = Form(1000, description="The maximum number of tokens to generate per image."),
+    images_per_request: int = Form(1, ge=1, description="Describe up to this many images in one request. Capped per provider by IMAGE_PACK_LIMITS."),
+    stream_format: Optional[Literal["sse", "ndjson"]] = Form(None, description="Stream each result as soon as it is ready, as server-sent events or newline-delimited JSON, instead of returning all of them in order."),
+    cache: Optional[Literal["bypass", "refresh"]] = Form(None, description="Cache control. 'bypass' skips the cache entirely; 'refresh' ignores any cached entry and stores the new result.")
+):
+    """
+    Describe many images with one call.
+
+    Send several `image_files`, zip archives of images, or both; up to
+    MAX_BATCH_SIZE images in all. They are described concurrently, sharing the
+    provider's concurrency cap (`<PROVIDER>_MAX_CONCURRENCY`) with the other
+    batch endpoints. With `images_per_request` above 1, that many images are
+    sent in one multimodal request and the answer is split per image; fewer
+    requests cost less per-request overhead, but each answer tends to be
+    shorter. Images the answer cannot be split for are described one by one.
+
+    Without `stream_format` the results come back together in batch order. With
+    it, each result is sent as a `result` event as soon as it is ready, in
+    completion order with its `index`, followed by a `done` event with `count`,
+    `failed` and `total_time`. A failing image carries its own `status_code`
+    and `error` and does not fail the batch.
+    """
+    archives = []
+    try:
+        if provider not in ["openai", "anthropic"]:
+            raise HTTPException(status_code=400, detail="Invalid provider. Choose either 'openai' or 'anthropic'.")
+        client = get_wrapper(OpenAIWrapper) if provider == "openai" else get_wrapper(AnthropicWrapper)
+        images = await batch_images(image_files, archives)
+    except BaseException:
+        for archive in archives:
+            archive.close()
+        for upload in image_files:
+            await upload.close()
+        raise
+
+    results = describe_images(client, provider, images, image_files, archives,
+                              min(images_per_request, IMAGE_PACK_LIMITS[provider]), prompt, max_tokens, cache)
+    if stream_format is None:
+        try:
+            items = [item async for item in results]
+        finally:
+            await results.aclose()
+        return BatchImageToTextResponse(results=sorted(items, key=lambda item: item.index))
+    if stream_format == "ndjson":
+        format_event, media_type = ndjson_event, "application/x-ndjson"
+    else:
+        format_event, media_type = sse_event, "text/event-stream"
+    return StreamingResponse(
+        stream_image_batch(results, format_event),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/text-to-image", response_model=TextToImageResponse)
 async def text_to_image(request: TextToImageRequest, background_tasks: BackgroundTasks):
+    """
+    Start generating an image and return its task ID without waiting.
+
+    A request identical to one that finished recently is answered from the cache,
+    and one identical to a running task gets that task's ID.
+    """
     try:
-        replicate_client = ReplicateWrapper()
-        
-        # Start the image generation task
-        prediction = replicate_client.text_to_image(
-            prompt=request.prompt,
-            aspect_ratio=request.aspect_ratio,
-            model=request.model
-        )
-        
-        # Return the task ID immediately
-        return TextToImageResponse(task_id=prediction.id)
+        job, cached = await image_jobs.submit(request.prompt, request.aspect_ratio, request.model)
+        return TextToImageResponse(task_id=job.task_id, cached=cached)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Text-to-image generation error: {str(e)}")
+        raise upstream_error(e, "Text-to-image generation error")
 
 @app.get("/text-to-image/{task_id}", response_model=TextToImageStatusResponse)
-async def get_text_to_image_status(task_id: str):
-    try:
-        replicate_client = ReplicateWrapper()
-        status = replicate_client.get_prediction_status(task_id)
-        
-        response = TextToImageStatusResponse(status=status["status"])
-        if status["status"] == "succeeded":
-            response.image_url = status["output"][0] if status["output"] else None
-        elif status["status"] == "failed":
-            response.error = status["error"]
-        
-        return response
+async def get_text_to_image_status(task_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    """
+    Return a text-to-image task's status from the local job registry.
+
+    Reads never call the provider; the registry's poller keeps the state
+    current. Each response carries an `ETag`; send it back in `If-None-Match`
+    to get `304 Not Modified` until the status changes.
+    """
+    try:
+        job = image_jobs.get(task_id) or await image_jobs.adopt(task_id)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error checking text-to-image status: {str(e)}")
+        raise upstream_error(e, "Error checking text-to-image status")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown text-to-image task.")
+
+    headers = {"ETag": job.etag, "Cache-Control": "no-cache"}
+    if if_none_match and job.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return TextToImageStatusResponse(status=job.status, image_url=job.image_url, error=job.error)
+
+
+def job_error(e):
+    """Map a failed job's exception to (status_code, message), as its endpoint would have answered."""
+    error = upstream_error(e)
+    return error.status_code, str(error.detail)
+
+
+async def run_generation_job(request: GenerateTextRequest):
+    with deadline_scope(request.timeout):
+        return (await run_generation(request)).model_dump()
+
+
+async def run_batch_job(request: BatchGenerateTextRequest):
+    return (await generate_text_batch(request, None, None)).model_dump()
+
+
+job_queue.register("generate-text", GenerateTextRequest, run_generation_job)
+job_queue.register("generate-text/batch", BatchGenerateTextRequest, run_batch_job)
+
+
+def job_response(job):
+    return JobResponse(job_id=job["id"], **{name: value for name, value in job.items() if name not in ("id", "version")})
+
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Queue a long-running request and return its job ID at once.
+
+    The job runs on a bounded worker pool (JOB_WORKERS per process), highest
+    priority first. Poll `GET /jobs/{job_id}` or follow `GET /jobs/{job_id}/stream`
+    for its status; the result is the response the matching endpoint would
+    have returned, and is kept for JOB_RESULT_TTL seconds after the job finishes.
+    """
+    if request.kind not in job_queue.kinds:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind. Choose one of: {', '.join(job_queue.kinds)}.")
+    try:
+        job = await job_queue.submit(request.kind, request.request, request.priority)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    except QueueClosedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(JOB_DRAIN_SECONDS))})
+    return job_response(job)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    job = await job_queue.aget(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job_response(job)
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, stream_format: Literal["sse", "ndjson"] = Query("sse", description="Server-sent events or newline-delimited JSON.")):
+    """
+    Follow a job until it finishes.
+
+    A `status` event is sent with the job's current state and again on every
+    change; the last one has the finished job with its `result` or `error`.
+    """
+    if await job_queue.aget(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    format_event, media_type = (ndjson_event, "application/x-ndjson") if stream_format == "ndjson" else (sse_event, "text/event-stream")
+
+    async def events():
+        async for job in job_queue.watch(job_id):
+            yield format_event("status", job_response(job).model_dump())
+
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """Cancel a queued job, or one running in this process. Finished jobs are left as they are."""
+    job = await job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job_response(job)
 
 
 
@@ -0,0 +1,147 @@
+import time
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response.",
+    ["method", "route", "status"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled.",
+)
+REQUEST_SIZE = Histogram(
+    "http_request_size_bytes",
+    "Size of request bodies, including uploaded files.",
+    ["route"],
+    buckets=(1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8),
+)
+REQUEST_ERRORS = Counter(
+    "http_request_errors_total",
+    "Responses with a 4xx or 5xx status.",
+    ["method", "route", "status"],
+)
+
+
+class MetricsMiddleware:
+    def __init__(self, app, skip_paths=("/metrics",)):
+        """
+        ASGI middleware recording request latency, in-flight requests, body sizes and error statuses.
+
+        It is a plain ASGI wrapper rather than a BaseHTTPMiddleware, so streamed
+        responses pass through untouched and are timed until their last byte.
+        Requests are labelled with the route template, e.g. "/text-to-image/{task_id}".
+
+        Parameters:
+        - app: The ASGI application to wrap.
+        - skip_paths (tuple): Paths not to record, such as the scrape endpoint itself.
+        """
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        size = 0
+        status = 500
+
+        async def counting_receive():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request":
+                size += len(message.get("body", b""))
+            return message
+
+        async def recording_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, counting_receive, recording_send)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], route, status).observe(time.perf_counter() - started)
+            if size:
+                REQUEST_SIZE.labels(route).observe(size)
+            if status >= 400:
+                REQUEST_ERRORS.labels(scope["method"], route, status).inc()
+
+
+class StatsCollector:
+    def __init__(self, snapshot):
+        """
+        Expose the service's `/stats` counters as Prometheus gauges, read at scrape time.
+
+        Every numeric value becomes a gauge named after its path, e.g.
+        `llm_stats_response_cache_hits`. The response cache hit ratio and the circuit
+        breaker states (0 closed, 1 half open, 2 open) and the per-model latency and
+        error-rate averages get gauges of their own, labelled by model.
+
+        Parameters:
+        - snapshot (callable): Returns the same dictionary as `GET /stats`.
+        """
+        self.snapshot = snapshot
+
+    def collect(self):
+        stats = self.snapshot()
+        labelled = ("circuit_breakers", "model_health")
+        yield from self._gauges("llm_stats", {name: value for name, value in stats.items() if name not in labelled})
+        cache = stats.get("response_cache", {})
+        lookups = cache.get("hits", 0) + cache.get("stale_hits", 0) + cache.get("misses", 0)
+        ratio = GaugeMetricFamily("llm_response_cache_hit_ratio", "Fraction of response cache lookups served from the cache.")
+        ratio.add_metric([], (cache.get("hits", 0) + cache.get("stale_hits", 0)) / lookups if lookups else 0.0)
+        yield ratio
+        breakers = GaugeMetricFamily("llm_circuit_breaker_state", "Circuit breaker state: 0 closed, 1 half open, 2 open.", labels=["model"])
+        for model, state in stats.get("circuit_breakers", {}).items():
+            breakers.add_metric([model], {"closed": 0, "half_open": 1, "open": 2}[state])
+        yield breakers
+        latency = GaugeMetricFamily("llm_model_latency_ewma_seconds", "Moving average of a model's call latency, as used by the router.", labels=["model"])
+        errors = GaugeMetricFamily("llm_model_error_rate_ewma", "Moving average of a model's transient error rate, as used by the router.", labels=["model"])
+        for model, health in stats.get("model_health", {}).items():
+            if health["latency"] is not None:
+                latency.add_metric([model], health["latency"])
+            errors.add_metric([model], health["error_rate"])
+        yield latency
+        yield errors
+
+    def _gauges(self, prefix, values):
+        for name, value in values.items():
+            metric = f"{prefix}_{name}".replace("-", "_").replace(":", "_").replace(".", "_")
+            if isinstance(value, dict):
+                yield from self._gauges(metric, value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauge = GaugeMetricFamily(metric, f"Value of {metric[len('llm_stats_'):]} in GET /stats.")
+                gauge.add_metric([], value)
+                yield gauge
+
+
+_stats_collector = None
+
+
+def register_stats(snapshot):
+    """
+    Expose `snapshot` as Prometheus gauges through a `StatsCollector` in the default registry.
+
+    Registering again, e.g. when a reloader or the tests import main.py a second
+    time, points the existing collector at the new snapshot instead of adding a
+    duplicate, which prometheus_client would reject.
+
+    Parameters:
+    - snapshot (callable): Returns the same dictionary as `GET /stats`.
+    """
+    global _stats_collector
+    if _stats_collector is None:
+        _stats_collector = StatsCollector(snapshot)
+        REGISTRY.register(_stats_collector)
+    else:
+        _stats_collector.snapshot = snapshot
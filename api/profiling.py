@@ -0,0 +1,170 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Leaf frames of threads that are parked rather than working; left out of profiles
+# unless idle samples are asked for.
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+
+
+class SamplingProfiler:
+    def __init__(self):
+        """
+        Initialize a statistical profiler that samples every thread's stack on demand.
+
+        While a session runs, a background thread records the stack of every other
+        thread each `interval` seconds. That covers the event loop and the worker
+        threads used for file and SDK calls. The result is in the collapsed-stack
+        format ("frame;frame;frame count" per line) read by flamegraph.pl, speedscope
+        and similar tools. When no session is running nothing is sampled, and the
+        middleware only checks `active`.
+        """
+        self.active = False
+        self.started = None
+        self.finished = None
+        self.interval = None
+        self.path_prefix = None
+        self.remaining_requests = None
+        self.requests_profiled = 0
+        self.include_idle = False
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, requests=None, seconds=None, interval=0.005, path_prefix=None, include_idle=False):
+        """
+        Start a profiling session, replacing the previous result.
+
+        The session ends after `requests` matching requests have completed, after
+        `seconds`, or after `PROFILE_MAX_SECONDS`, whichever comes first.
+
+        Parameters:
+        - requests (int, optional): Number of matching requests to profile.
+        - seconds (float, optional): Length of the profiling window.
+        - interval (float): Seconds between samples.
+        - path_prefix (str, optional): Only count requests whose path starts with this, e.g. "/transcribe-audio".
+        - include_idle (bool): Keep samples of threads that are only waiting.
+
+        Returns:
+        - bool: False if a session is already running.
+        """
+        with self._lock:
+            if self.active:
+                return False
+            self.samples = Counter()
+            self.interval = interval
+            self.path_prefix = path_prefix
+            self.remaining_requests = requests
+            self.requests_profiled = 0
+            self.include_idle = include_idle
+            self.started = time.time()
+            self.finished = None
+            self._stop.clear()
+            duration = min(seconds or PROFILE_MAX_SECONDS, PROFILE_MAX_SECONDS)
+            self._thread = threading.Thread(target=self._run, args=(duration,), name="sampling-profiler", daemon=True)
+            self.active = True
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """End the running session, if any."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def request_finished(self, path):
+        """Count a completed request; ends a request-count session once enough have been seen."""
+        if path.startswith("/admin/") or (self.path_prefix and not path.startswith(self.path_prefix)):
+            return
+        with self._lock:
+            self.requests_profiled += 1
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+                if self.remaining_requests <= 0:
+                    self._stop.set()
+
+    def status(self):
+        """Return the session's state and counters as a dict."""
+        return {
+            "state": "running" if self.active else ("done" if self.finished else "idle"),
+            "started": self.started,
+            "finished": self.finished,
+            "interval": self.interval,
+            "path_prefix": self.path_prefix,
+            "requests_profiled": self.requests_profiled,
+            "remaining_requests": self.remaining_requests,
+            "samples": sum(self.samples.values()),
+        }
+
+    def collapsed(self):
+        """Return the samples in collapsed-stack format, heaviest stacks first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def _run(self, duration):
+        own = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + duration
+        try:
+            while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own:
+                        continue
+                    stack = self._stack(frame)
+                    if stack is None:
+                        continue
+                    if thread_id not in names:
+                        names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    thread_name = names.get(thread_id, str(thread_id))
+                    # Worker threads are numbered; merge them so their stacks add up.
+                    thread_name = thread_name.split("_")[0].rstrip("0123456789-")
+                    self.samples[f"{thread_name};{stack}"] += 1
+        finally:
+            self.active = False
+            self.finished = time.time()
+
+    def _stack(self, frame):
+        leaf = frame.f_code
+        if not self.include_idle and (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+            return None
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+
+profiler = SamplingProfiler()
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiler=profiler):
+        """
+        ASGI middleware counting completed requests for request-count profiling sessions.
+
+        Parameters:
+        - app: The ASGI application to wrap.
+        - profiler (SamplingProfiler): The profiler to report to.
+        """
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.active or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.request_finished(scope["path"])
@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+# Tests import the app the way it runs: from the api/ directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py builds its provider clients at import time; no request reaches a provider in these tests.
+for name in ("OPENAI_API_KEY", "GROQ_API_KEY", "ANTHROPIC_API_KEY", "REPLICATE_API_TOKEN"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("RATE_LIMIT_DB", os.path.join(tempfile.mkdtemp(), "rate_limits.sqlite"))
+os.environ.setdefault("JOB_QUEUE_DB", ":memory:")
+
+
+class Clock:
+    """A settable stand-in for time.time / time.monotonic."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from llm import cache as cache_module
+from llm.cache import ResponseCache, make_key
+from conftest import Clock
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock)
+    return clock
+
+
+def test_make_key_ignores_field_order():
+    assert make_key(a=1, b="x") == make_key(b="x", a=1)
+    assert make_key(a=1) != make_key(a=2)
+
+
+def test_fresh_then_stale_then_gone(clock):
+    cache = ResponseCache(ttl=10, stale_ttl=20)
+    cache.set("k", {"v": 1})
+    assert cache.get("k") == ({"v": 1}, False)
+
+    clock.advance(15)
+    assert cache.get("k") is None
+    assert cache.get("k", allow_stale=True) == ({"v": 1}, True)
+
+    clock.advance(20)
+    assert cache.get("k", allow_stale=True) is None
+    assert cache.stats == {"hits": 1, "stale_hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_memory_tier_evicts_least_recently_used(clock):
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == (1, False)
+    assert cache.stats["evictions"] == 1
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path, clock):
+    db = str(tmp_path / "cache.sqlite")
+    ResponseCache(namespace="n", db_path=db).set("k", "value")
+    assert ResponseCache(namespace="n", db_path=db).get("k") == ("value", False)
+    assert ResponseCache(namespace="other", db_path=db).get("k") is None
+
+
+def test_disk_tier_expired_rows_are_deleted(tmp_path, clock):
+    db = str(tmp_path / "cache.sqlite")
+    ResponseCache(db_path=db, ttl=10, stale_ttl=0).set("k", "value")
+    clock.advance(11)
+    cache = ResponseCache(db_path=db, ttl=10, stale_ttl=0)
+    assert cache.get("k") is None
+    assert cache._db_bytes == 0
+    assert cache._disk_size() == 0
+
+
+def test_disk_tier_keeps_running_size_and_evicts(tmp_path, clock):
+    cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite"), max_entries=1, db_max_bytes=25)
+    cache.set("a", "x" * 8)
+    clock.advance(1)
+    cache.set("a", "y" * 8)
+    assert cache._db_bytes == cache._disk_size() == 10
+    clock.advance(1)
+    cache.set("b", "z" * 8)
+    clock.advance(1)
+    cache.set("c", "w" * 8)
+    assert cache._db_bytes == cache._disk_size() == 20
+    assert cache.get("a") is None
+    assert cache.get("c") == ("w" * 8, False)
+
+
+def test_async_access_matches_sync(tmp_path, clock):
+    db = str(tmp_path / "cache.sqlite")
+
+    async def run():
+        await ResponseCache(db_path=db, ttl=10, stale_ttl=10).aset("k", [1, 2])
+        cache = ResponseCache(db_path=db, ttl=10, stale_ttl=10)
+        first = await cache.aget("k")
+        clock.advance(15)
+        return first, await cache.aget("k"), await cache.aget("k", allow_stale=True)
+
+    assert asyncio.run(run()) == (([1, 2], False), None, ([1, 2], True))
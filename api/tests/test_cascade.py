@@ -0,0 +1,60 @@
+import pytest
+
+from llm import cascade
+from llm.cascade import AcceptanceCheck, CascadeModel, exceeds_context
+
+
+class FakeModel:
+    def __init__(self, text):
+        self.text = text
+        self.system_prompt = None
+        self.prompts = []
+
+    def generate_text(self, prompt, max_tokens=4000, temperature=0.5, **kwargs):
+        self.prompts.append(prompt)
+        return self.text, len(prompt) // 4, len(self.text) // 4
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    # `run_cascade` binds the shared counters as a default, so reset them in place.
+    cascade.cascade_stats.__init__()
+    return cascade.cascade_stats
+
+
+def test_acceptance_check_reasons():
+    check = AcceptanceCheck(min_chars=20, required_sections=["Goals"])
+    assert check("# Goals\nShip the thing by Friday.") == []
+    assert check("# Goals\nShip it.") == ["too_short"]
+    assert check("I'm sorry, but I can't help with that request.") == ["missing_section:Goals", "refusal"]
+
+
+def test_short_reply_is_accepted_without_a_length_floor(fresh_stats):
+    cheap, quality = FakeModel("Sounds good!"), FakeModel("A longer answer.")
+    model = CascadeModel(cheap, quality, check=AcceptanceCheck(min_chars=0))
+    assert model.generate_text("Any ideas?")[0] == "Sounds good!"
+    assert not model.escalated and quality.prompts == []
+    assert fresh_stats.stats["accepted"] == 1
+
+
+def test_prompt_too_long_for_the_cheap_model_skips_it(fresh_stats):
+    cheap, quality = FakeModel("cheap"), FakeModel("quality")
+    model = CascadeModel(cheap, quality, cheap_spec={"context_window": 8192})
+    model.system_prompt = "Be brief."
+    text, _, _ = model.generate_text("history " * 4000, max_tokens=1000)
+    assert text == "quality" and model.escalated
+    assert cheap.prompts == [] and quality.system_prompt == "Be brief."
+    assert fresh_stats.reasons == {"context_window": 1}
+
+
+def test_quality_latency_of_none_is_allowed(fresh_stats):
+    model = CascadeModel(FakeModel("fine"), FakeModel("unused"), quality_latency=lambda: None)
+    assert model.generate_text("hi")[0] == "fine"
+    assert fresh_stats.stats["latency_saved"] == 0.0
+
+
+def test_exceeds_context():
+    spec = {"context_window": 100}
+    assert not exceeds_context(None, "x" * 10_000, 10)
+    assert not exceeds_context(spec, "x" * 200, 40)
+    assert exceeds_context(spec, "x" * 200, 60)
@@ -0,0 +1,223 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from llm import deadlines
+
+
+class FakeRequest:
+    """Stands in for a Starlette request; the client goes away `after` seconds from now."""
+
+    def __init__(self, after=None, on_check=None):
+        self.gone_at = None if after is None else time.monotonic() + after
+        self.on_check = on_check
+        self.checks = 0
+
+    async def is_disconnected(self):
+        self.checks += 1
+        if self.on_check is not None:
+            await self.on_check()
+        return self.gone_at is not None and time.monotonic() >= self.gone_at
+
+
+@pytest.fixture
+def fresh_stats(monkeypatch):
+    stats = deadlines.CancellationStats()
+    monkeypatch.setattr(deadlines, "cancellation_stats", stats)
+    monkeypatch.setattr(main, "cancellation_stats", stats)
+    monkeypatch.setattr(main, "DISCONNECT_POLL_SECONDS", 0.01)
+    return stats
+
+
+def test_nested_scopes_keep_the_sooner_deadline():
+    assert deadlines.remaining() is None
+    with deadlines.deadline_scope(10):
+        with deadlines.deadline_scope(60):
+            assert 9 < deadlines.remaining() <= 10
+        with deadlines.deadline_scope(1):
+            assert 0 < deadlines.remaining() <= 1
+        with deadlines.deadline_scope(None):
+            assert 9 < deadlines.remaining() <= 10
+    assert deadlines.remaining() is None
+
+
+def test_bounded_raises_when_the_deadline_passes():
+    async def run():
+        with deadlines.deadline_scope(0.02):
+            await deadlines.bounded(asyncio.sleep(1))
+
+    with pytest.raises(deadlines.DeadlineExceeded):
+        asyncio.run(run())
+
+
+def test_bounded_does_not_start_a_call_past_the_deadline():
+    started = []
+
+    async def call():
+        started.append(1)
+
+    async def run():
+        with deadlines.deadline_scope(-1):
+            await deadlines.bounded(call())
+
+    with pytest.raises(deadlines.DeadlineExceeded):
+        asyncio.run(run())
+    assert started == []
+
+
+def test_cancel_reason():
+    assert deadlines.cancel_reason(asyncio.CancelledError(deadlines.DEADLINE_CANCEL)) == "deadline"
+    assert deadlines.cancel_reason(asyncio.CancelledError()) == "cancelled"
+    with deadlines.deadline_scope(-1):
+        assert deadlines.cancel_reason(asyncio.CancelledError()) == "deadline"
+
+
+def test_disconnect_cancels_the_work(fresh_stats):
+    reasons = []
+
+    async def work():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError as e:
+            reasons.append(deadlines.cancel_reason(e))
+            raise
+
+    async def run():
+        await main.run_until_disconnected(FakeRequest(after=0.03), work(), 5)
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(run())
+    assert raised.value.status_code == 499
+    assert reasons == ["cancelled"]
+    assert fresh_stats.stats["disconnects"] == 1
+
+
+def test_deadline_cancels_the_work(fresh_stats):
+    reasons = []
+
+    async def work():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError as e:
+            reasons.append(deadlines.cancel_reason(e))
+            raise
+
+    async def run():
+        await main.run_until_disconnected(FakeRequest(), work(), 0.03)
+
+    with pytest.raises(deadlines.DeadlineExceeded):
+        asyncio.run(run())
+    assert reasons == ["deadline"]
+    assert fresh_stats.stats["disconnects"] == 0
+
+
+def test_work_runs_under_the_request_deadline(fresh_stats):
+    async def work():
+        return deadlines.remaining()
+
+    left = asyncio.run(main.run_until_disconnected(FakeRequest(), work(), 5))
+    assert 0 < left <= 5
+
+
+def test_relay_passes_events_through_and_raises_stream_errors(fresh_stats):
+    async def events():
+        yield 1
+        yield 2
+        raise ValueError("upstream failed")
+
+    async def run():
+        received = []
+        with pytest.raises(ValueError):
+            async for event in main.relay_until_disconnected(FakeRequest(), events()):
+                received.append(event)
+        return received
+
+    assert asyncio.run(run()) == [1, 2]
+
+
+def test_relay_stops_when_the_client_disconnects_with_an_event_pending(fresh_stats):
+    closed = []
+
+    async def run():
+        go = asyncio.Event()
+
+        async def events():
+            # Each event is produced while the relay is checking for a disconnect,
+            # so the queue is full when it finds the client gone.
+            try:
+                for i in range(100):
+                    await go.wait()
+                    go.clear()
+                    yield i
+            finally:
+                closed.append(True)
+
+        async def check():
+            go.set()
+            await asyncio.sleep(0.01)
+
+        request = FakeRequest(after=0.05, on_check=check)
+        received = []
+        async for event in main.relay_until_disconnected(request, events()):
+            received.append(event)
+        return received
+
+    received = asyncio.run(asyncio.wait_for(run(), 2))
+    assert received
+    assert closed == [True]
+    assert fresh_stats.stats["disconnects"] == 1
+
+
+def test_batch_items_get_the_batch_deadline(monkeypatch, fresh_stats):
+    seen = []
+
+    async def run_generation(request, routed=None):
+        seen.append(deadlines.remaining())
+        return main.GenerateTextResponse(generated_text=request.prompt)
+
+    monkeypatch.setattr(main, "run_generation", run_generation)
+    item = {"provider": "openai", "model": "gpt-4o-mini"}
+    batch = main.BatchGenerateTextRequest(items=[
+        main.GenerateTextRequest(prompt="a", **item),
+        main.GenerateTextRequest(prompt="b", timeout=60, **item),
+    ])
+
+    response = asyncio.run(main.generate_text_batch(batch, FakeRequest(), x_request_timeout=5))
+    assert [result.status_code for result in response.results] == [200, 200]
+    assert len(seen) == 2
+    assert all(0 < left <= 5 for left in seen)
+
+
+def test_batch_deadline_fails_slow_items(monkeypatch, fresh_stats):
+    async def run_generation(request, routed=None):
+        await deadlines.bounded(asyncio.sleep(1))
+
+    monkeypatch.setattr(main, "run_generation", run_generation)
+    batch = main.BatchGenerateTextRequest(items=[main.GenerateTextRequest(provider="openai", model="gpt-4o-mini", prompt="a")])
+
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(main.generate_text_batch(batch, FakeRequest(), x_request_timeout=0.05))
+    assert raised.value.status_code == 504
+    assert time.monotonic() - started < 0.5
+
+
+def test_batch_header_cannot_extend_the_server_limit(monkeypatch, fresh_stats):
+    seen = []
+
+    async def run_generation(request, routed=None):
+        seen.append(deadlines.remaining())
+        return main.GenerateTextResponse(generated_text=request.prompt)
+
+    monkeypatch.setattr(main, "run_generation", run_generation)
+    monkeypatch.setattr(main, "REQUEST_TIMEOUT", 2.0)
+    batch = main.BatchGenerateTextRequest(items=[main.GenerateTextRequest(provider="openai", model="gpt-4o-mini", prompt="a")])
+
+    asyncio.run(main.generate_text_batch(batch, FakeRequest(), x_request_timeout=60))
+    # Run as a job, with no request to watch, the batch still has a deadline.
+    asyncio.run(main.run_batch_job(batch))
+    assert len(seen) == 2
+    assert all(0 < left <= 2 for left in seen)
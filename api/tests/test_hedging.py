@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from llm.hedging import HedgePolicy, hedged_call, hedged_stream
+
+
+def policy(delay=0.02):
+    return HedgePolicy(default_delay=delay, max_ratio=1.0)
+
+
+def call(seconds, result):
+    async def run():
+        await asyncio.sleep(seconds)
+        return result
+    return run
+
+
+def stream(first_delay, texts, tasks, input_tokens=10, fail=False):
+    async def run():
+        tasks.add(asyncio.current_task())
+        await asyncio.sleep(first_delay)
+        if fail:
+            raise RuntimeError("upstream failed")
+        for text in texts:
+            tasks.add(asyncio.current_task())
+            yield {"type": "delta", "text": text}
+            await asyncio.sleep(0)
+        tasks.add(asyncio.current_task())
+        yield {"type": "usage", "input_tokens": input_tokens, "output_tokens": len(texts)}
+    return run
+
+
+def test_fast_call_is_not_hedged():
+    hedging = policy()
+    result = asyncio.run(hedged_call(call(0, ("a", 10, 5)), call(0, ("b", 10, 5)), "k", hedging))
+    assert result == (("a", 10, 5), False)
+    assert hedging.stats["hedged"] == 0
+
+
+def test_slow_call_is_hedged_and_loser_waste_counted():
+    hedging = policy()
+    result = asyncio.run(hedged_call(call(0.5, ("a", 10, 5)), call(0.05, ("b", 10, 100)), "k", hedging))
+    assert result == (("b", 10, 100), True)
+    assert hedging.stats["hedge_wins"] == 1
+    assert hedging.stats["wasted_input_tokens"] == 10
+    # The primary ran longer than the winning backup, so it is taken to have produced as much.
+    assert hedging.stats["wasted_output_tokens"] == 100
+
+
+def collect(events):
+    async def run():
+        consumer = asyncio.current_task()
+        return consumer, [event async for event in events]
+    return asyncio.run(run())
+
+
+def test_stream_primary_runs_in_the_callers_task():
+    hedging = policy(delay=1)
+    primary_tasks = set()
+    consumer, events = collect(hedged_stream(stream(0, ["a", "b"], primary_tasks), stream(0, ["x"], set()), "k", hedging))
+    assert [event.get("text") for event in events] == ["a", "b", None]
+    assert primary_tasks == {consumer}
+    assert hedging.stats["hedged"] == 0
+
+
+def test_stream_backup_wins_and_runs_in_one_task():
+    hedging = policy()
+    primary_tasks, backup_tasks = set(), set()
+    consumer, events = collect(hedged_stream(
+        stream(0.5, ["a"], primary_tasks), stream(0.05, ["xxxxxxxx", "y"], backup_tasks, input_tokens=7), "k", hedging,
+    ))
+    assert [event["type"] for event in events] == ["hedge", "delta", "delta", "usage"]
+    assert primary_tasks == {consumer}
+    assert len(backup_tasks) == 1 and consumer not in backup_tasks
+    assert hedging.stats["hedge_wins"] == 1
+    assert hedging.stats["wasted_input_tokens"] == 7
+
+
+def test_stream_primary_wins_after_hedge():
+    hedging = policy(delay=0.01)
+
+    async def primary():
+        await asyncio.sleep(0.05)
+        yield {"type": "delta", "text": "a"}
+        yield {"type": "usage", "input_tokens": 10, "output_tokens": 1}
+
+    _, events = collect(hedged_stream(primary, stream(1, ["late"], set()), "k", hedging))
+    assert [event["type"] for event in events] == ["delta", "usage"]
+    assert hedging.stats["hedged"] == 1 and hedging.stats["hedge_wins"] == 0
+    assert hedging.stats["wasted_input_tokens"] == 10
+
+
+def test_stream_failed_primary_falls_back_to_running_backup():
+    hedging = policy()
+    _, events = collect(hedged_stream(stream(0.03, [], set(), fail=True), stream(0.1, ["x"], set()), "k", hedging))
+    assert [event["type"] for event in events] == ["hedge", "delta", "usage"]
+
+
+def test_stream_failed_primary_without_hedge_raises():
+    hedging = policy(delay=1)
+    with pytest.raises(RuntimeError):
+        collect(hedged_stream(stream(0, [], set(), fail=True), stream(0, ["x"], set()), "k", hedging))
@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from llm import image_jobs, replicate_wrapper
+from llm.cache import ResponseCache
+from llm.image_jobs import ImageJobRegistry
+from llm.local_replicate import LocalReplicateWrapper
+
+SECONDS = 0.3
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(replicate_wrapper, "POLL_MIN_INTERVAL", 0.02)
+    monkeypatch.setattr(replicate_wrapper, "POLL_MAX_INTERVAL", 0.05)
+    monkeypatch.setattr(image_jobs, "POLL_MIN_INTERVAL", 0.02)
+
+
+@pytest.fixture
+def local():
+    return LocalReplicateWrapper(seconds=SECONDS)
+
+
+def registry(wrapper):
+    return ImageJobRegistry(lambda: wrapper, ResponseCache(namespace="text-to-image"))
+
+
+async def run_jobs(jobs, count, reads_per_job):
+    """Submit `count` jobs and read each `reads_per_job` times while they run."""
+    submitted = [await jobs.submit(f"prompt {number}", "1:1", "model") for number in range(count)]
+    interval = SECONDS * 1.5 / reads_per_job
+    for _ in range(reads_per_job):
+        for job, _ in submitted:
+            jobs.get(job.task_id)
+        await asyncio.sleep(interval)
+    while any(not jobs.get(job.task_id).done for job, _ in submitted):
+        await asyncio.sleep(0.01)
+    await jobs.aclose()
+    return [jobs.get(job.task_id) for job, _ in submitted]
+
+
+def test_upstream_polls_follow_jobs_not_client_reads():
+    polls = {}
+    for reads in (5, 100):
+        wrapper = LocalReplicateWrapper(seconds=SECONDS)
+        finished = asyncio.run(run_jobs(registry(wrapper), 3, reads))
+        assert all(job.status == "succeeded" and job.image_url.startswith("data:image/png") for job in finished)
+        polls[reads] = wrapper.calls["get"]
+    # Twenty times the client reads, about the same upstream polls.
+    assert polls[100] <= polls[5] * 1.5 + 3
+
+    wrapper = LocalReplicateWrapper(seconds=SECONDS)
+    asyncio.run(run_jobs(registry(wrapper), 6, 5))
+    assert wrapper.calls["get"] >= polls[5] * 1.5
+
+
+def test_failed_prediction_is_reported(local):
+    async def run():
+        jobs = registry(local)
+        job, _ = await jobs.submit("please fail", "1:1", "model")
+        while not job.done:
+            await asyncio.sleep(0.01)
+        await jobs.aclose()
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == "failed" and job.error == "Simulated failure"
+
+
+def test_identical_requests_coalesce_then_hit_the_cache(local):
+    async def run():
+        jobs = registry(local)
+        (first, cached_first), (second, cached_second) = await asyncio.gather(
+            jobs.submit("a cat", "1:1", "model"), jobs.submit("a cat", "1:1", "model"),
+        )
+        assert first is second and not cached_first and not cached_second
+        while not first.done:
+            await asyncio.sleep(0.01)
+        third, cached_third = await jobs.submit("a cat", "1:1", "model")
+        await jobs.aclose()
+        return jobs, first, third, cached_third
+
+    jobs, first, third, cached = asyncio.run(run())
+    assert cached and third.task_id.startswith("cached-")
+    assert third.status == "succeeded" and third.image_url == first.image_url
+    assert local.calls["create"] == 1
+    assert jobs.stats["coalesced"] == 1 and jobs.stats["cache_hits"] == 1
+
+
+def test_status_endpoint_answers_304_until_the_status_changes(monkeypatch, local):
+    monkeypatch.setattr(main, "image_jobs", registry(local))
+    with TestClient(main.app) as client:
+        task_id = client.post("/text-to-image", json={"prompt": "a dog", "aspect_ratio": "1:1"}).json()["task_id"]
+        first = client.get(f"/text-to-image/{task_id}")
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+        unchanged = client.get(f"/text-to-image/{task_id}", headers={"If-None-Match": etag})
+        assert unchanged.status_code == 304 and unchanged.headers["etag"] == etag
+
+        deadline = time.monotonic() + 5
+        while client.get(f"/text-to-image/{task_id}", headers={"If-None-Match": etag}).status_code == 304:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+        finished = client.get(f"/text-to-image/{task_id}")
+        if finished.json()["status"] != "succeeded":
+            time.sleep(SECONDS)
+            finished = client.get(f"/text-to-image/{task_id}")
+        assert finished.json()["status"] == "succeeded"
+        assert finished.headers["etag"] != etag
+        assert client.get("/text-to-image/unknown-task").status_code == 404
+
+
+def test_failed_start_is_raised_to_every_waiter_and_not_kept(local):
+    class Flaky(LocalReplicateWrapper):
+        failures = 1
+
+        async def astart_text_to_image(self, **kwargs):
+            if self.failures:
+                self.failures -= 1
+                await asyncio.sleep(0)
+                raise RuntimeError("upstream down")
+            return await super().astart_text_to_image(**kwargs)
+
+    wrapper = Flaky(seconds=SECONDS)
+
+    async def run():
+        jobs = registry(wrapper)
+        results = await asyncio.gather(
+            jobs.submit("a bird", "1:1", "model"), jobs.submit("a bird", "1:1", "model"), return_exceptions=True,
+        )
+        job, _ = await jobs.submit("a bird", "1:1", "model")
+        await jobs.aclose()
+        return results, job
+
+    results, job = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert job.status == "starting"
+    assert wrapper.calls["create"] == 1
+
+
+def test_unknown_task_ids_are_not_looked_up_again(monkeypatch, local):
+    async def run():
+        jobs = registry(local)
+        first = await jobs.adopt("made-up")
+        again = [await jobs.adopt("made-up") for _ in range(5)]
+        monkeypatch.setattr(image_jobs, "UNKNOWN_TASK_TTL", 0)
+        jobs._unknown.clear()
+        await jobs.adopt("made-up")
+        await jobs.adopt("made-up")
+        return jobs, first, again
+
+    jobs, first, again = asyncio.run(run())
+    assert first is None and again == [None] * 5
+    # Five lookups answered locally; with no TTL, each lookup reaches the provider.
+    assert jobs.stats["unknown_hits"] == 5
+    assert local.calls["get"] == 3
@@ -0,0 +1,89 @@
+import base64
+import io
+
+import pytest
+from PIL import Image, features
+
+from llm import images
+from llm.images import prepare_image
+
+REENCODED = "image/webp" if features.check("webp") else "image/jpeg"
+
+
+def encode(picture, fmt, **options):
+    buffer = io.BytesIO()
+    picture.save(buffer, fmt, **options)
+    buffer.seek(0)
+    return buffer
+
+
+def gradient(width, height):
+    picture = Image.linear_gradient("L").resize((width, height))
+    return Image.merge("RGB", (picture, picture.transpose(Image.Transpose.FLIP_LEFT_RIGHT), picture))
+
+
+def decode(data):
+    return Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    stats = images.ImageStats()
+    monkeypatch.setattr(images, "image_stats", stats)
+    return stats
+
+
+def test_small_supported_image_is_sent_untouched(fresh_stats):
+    source = encode(gradient(64, 48), "PNG")
+    data, media_type = prepare_image(source, "openai")
+    assert media_type == "image/png"
+    assert base64.b64decode(data) == source.getvalue()
+    assert fresh_stats.resized == 0 and fresh_stats.input_bytes == fresh_stats.output_bytes
+
+
+def test_format_is_detected_from_the_content(tmp_path):
+    path = tmp_path / "photo.png"
+    path.write_bytes(encode(gradient(64, 48), "JPEG").getvalue())
+    assert prepare_image(str(path), "anthropic")[1] == "image/jpeg"
+
+
+def test_unsupported_format_is_reencoded():
+    data, media_type = prepare_image(encode(gradient(64, 48), "BMP"), "anthropic")
+    assert media_type == REENCODED
+    assert decode(data).size == (64, 48)
+
+
+@pytest.mark.parametrize("provider, size", [("openai", (2048, 512)), ("anthropic", (1568, 392))])
+def test_large_image_is_scaled_to_the_provider_limits(provider, size, fresh_stats):
+    data, media_type = prepare_image(encode(gradient(4000, 1000), "PNG"), provider)
+    assert media_type == REENCODED
+    assert decode(data).size == size
+    assert fresh_stats.resized == 1
+
+
+def test_exif_orientation_is_applied_before_scaling():
+    exif = Image.Exif()
+    # 6: the camera was turned; the stored landscape pixels display as portrait.
+    exif[0x0112] = 6
+    source = encode(gradient(3000, 1000), "JPEG", exif=exif.tobytes())
+    data, _ = prepare_image(source, "anthropic")
+    assert decode(data).size == (523, 1568)
+
+
+def test_reencoding_is_kept_only_when_it_saves_enough(monkeypatch):
+    monkeypatch.setattr(images, "PASSTHROUGH_BYTES", 0)
+    # A smooth image stored losslessly shrinks a lot when re-encoded.
+    png = encode(gradient(600, 400), "PNG")
+    data, media_type = prepare_image(png, "anthropic")
+    assert media_type == REENCODED and len(base64.b64decode(data)) < len(png.getvalue()) * 0.8
+    # A noisy, heavily compressed JPEG does not, and is sent as it is.
+    jpeg = encode(Image.effect_noise((600, 400), 64).convert("RGB"), "JPEG", quality=10)
+    data, media_type = prepare_image(jpeg, "anthropic")
+    assert media_type == "image/jpeg" and base64.b64decode(data) == jpeg.getvalue()
+
+
+def test_open_file_is_rewound():
+    source = encode(gradient(32, 32), "PNG")
+    source.seek(10)
+    data, _ = prepare_image(source, "openai")
+    assert base64.b64decode(data) == source.getvalue()
@@ -0,0 +1,211 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+from pydantic import BaseModel
+
+from llm import job_queue
+from llm.job_queue import JobQueue, QueueClosedError
+from conftest import Clock
+
+
+class Payload(BaseModel):
+    name: str
+    seconds: float = 0.0
+
+
+def make_queue(path, handler=None, workers=1):
+    async def run(payload):
+        await asyncio.sleep(payload.seconds)
+        if payload.name == "boom":
+            raise RuntimeError("boom")
+        return {"name": payload.name}
+
+    queue = JobQueue(str(path), workers=workers, ttl=60)
+    queue.register("echo", Payload, handler or run)
+    return queue
+
+
+async def wait_finished(queue, job_id):
+    async for job in queue.watch(job_id, poll=0.05):
+        pass
+    return job
+
+
+def test_claims_follow_priority_then_age(tmp_path):
+    async def run():
+        # No workers: the test claims by hand.
+        queue = make_queue(tmp_path / "jobs.db", workers=0)
+        ids = {}
+        for name, priority in [("low", "low"), ("normal", "normal"), ("high1", "high"), ("high2", "high")]:
+            ids[name] = (await queue.submit("echo", {"name": name}, priority))["id"]
+        return queue, ids
+
+    queue, ids = asyncio.run(run())
+    claimed = [queue._claim()[0] for _ in range(4)]
+    assert claimed == [ids["high1"], ids["high2"], ids["normal"], ids["low"]]
+    assert queue._claim() is None
+    assert queue.get(ids["low"])["status"] == "running"
+
+
+def test_jobs_run_and_failures_are_recorded(tmp_path):
+    async def run():
+        queue = make_queue(tmp_path / "jobs.db", workers=2)
+        queue.start()
+        ok = await queue.submit("echo", {"name": "fine"})
+        bad = await queue.submit("echo", {"name": "boom"})
+        results = await wait_finished(queue, ok["id"]), await wait_finished(queue, bad["id"])
+        await queue.drain(1)
+        return queue, results
+
+    queue, (ok, bad) = asyncio.run(run())
+    assert ok["status"] == "succeeded" and ok["result"] == {"name": "fine"} and ok["status_code"] == 200
+    assert bad["status"] == "failed" and bad["status_code"] == 500 and bad["error"] == "boom"
+    assert queue.snapshot()["succeeded"] == 1 and queue.snapshot()["failed"] == 1
+
+
+def test_submit_validates_and_refuses_while_draining(tmp_path):
+    async def run():
+        queue = make_queue(tmp_path / "jobs.db")
+        with pytest.raises(KeyError):
+            await queue.submit("unknown", {})
+        with pytest.raises(Exception):
+            await queue.submit("echo", {"seconds": 1})
+        await queue.drain(0)
+        with pytest.raises(QueueClosedError):
+            await queue.submit("echo", {"name": "late"})
+
+    asyncio.run(run())
+
+
+def test_cancel_queued_and_running_jobs(tmp_path):
+    async def run():
+        queue = make_queue(tmp_path / "jobs.db")
+        queue.start()
+        running = await queue.submit("echo", {"name": "slow", "seconds": 5})
+        queued = await queue.submit("echo", {"name": "next", "seconds": 5})
+        while queue.get(running["id"])["status"] != "running":
+            await asyncio.sleep(0.01)
+        states = (await queue.cancel(queued["id"]))["status"], (await queue.cancel(running["id"]))["status"]
+        await queue.drain(0)
+        return queue, states
+
+    queue, states = asyncio.run(run())
+    assert states == ("canceled", "canceled")
+    assert queue.stats["canceled"] == 2
+
+
+def test_drain_requeues_running_jobs_for_the_next_start(tmp_path):
+    path = tmp_path / "jobs.db"
+
+    async def first_process():
+        queue = make_queue(path)
+        queue.start()
+        job = await queue.submit("echo", {"name": "long", "seconds": 5})
+        while queue.get(job["id"])["status"] != "running":
+            await asyncio.sleep(0.01)
+        await queue.drain(0.05)
+        return queue, job["id"]
+
+    queue, job_id = asyncio.run(first_process())
+    assert queue.get(job_id)["status"] == "queued"
+    assert queue.stats["requeued"] == 1
+
+    async def second_process():
+        async def quick(payload):
+            return {"name": payload.name, "again": True}
+
+        queue = make_queue(path, handler=quick)
+        queue.start()
+        job = await wait_finished(queue, job_id)
+        await queue.drain(0)
+        return job
+
+    job = asyncio.run(second_process())
+    assert job["status"] == "succeeded" and job["result"] == {"name": "long", "again": True}
+
+
+def test_expired_lease_is_reclaimed_and_old_owner_cannot_finish(tmp_path, monkeypatch):
+    clock = Clock(1_000_000.0)
+    monkeypatch.setattr(job_queue.time, "time", clock)
+
+    async def submit(queue):
+        return (await queue.submit("echo", {"name": "abandoned"}))["id"]
+
+    # No workers: the test claims by hand.
+    queue = make_queue(tmp_path / "jobs.db", workers=0)
+    job_id = asyncio.run(submit(queue))
+    assert queue._claim()[0] == job_id
+    # Another worker sees nothing to do while the lease holds.
+    assert queue._claim() is None
+
+    clock.advance(job_queue.JOB_LEASE_SECONDS + 1)
+    monkeypatch.setattr(job_queue, "_OWNER", "another-process")
+    assert queue._claim()[0] == job_id
+    assert queue.stats["recovered"] == 1
+
+    # The first claimant finishing late must not overwrite the new owner's run.
+    monkeypatch.setattr(job_queue, "_OWNER", "first-process")
+    queue._finish(job_id, "succeeded", result="{}", status_code=200)
+    assert queue.get(job_id)["status"] == "running"
+
+
+def test_finished_jobs_expire(tmp_path, monkeypatch):
+    clock = Clock(2_000_000.0)
+    monkeypatch.setattr(job_queue.time, "time", clock)
+
+    async def run():
+        queue = make_queue(tmp_path / "jobs.db", workers=0)
+        job = await queue.submit("echo", {"name": "x"})
+        await queue.cancel(job["id"])
+        return queue, job["id"]
+
+    queue, job_id = asyncio.run(run())
+    assert queue.get(job_id)["status"] == "canceled"
+    clock.advance(61)
+    assert queue.get(job_id) is None
+
+
+def test_another_process_holding_the_write_lock_does_not_block_the_loop(tmp_path):
+    path = tmp_path / "jobs.db"
+
+    async def run():
+        queue = make_queue(path, workers=0)
+        job = await queue.submit("echo", {"name": "waiting"})
+        other = sqlite3.connect(str(path), isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            queue.workers = 1
+            queue.start()
+            # The worker's claim waits for the lock in a thread; the loop carries on.
+            started = time.monotonic()
+            for _ in range(20):
+                await asyncio.sleep(0.01)
+            stalled = time.monotonic() - started
+            status = (await queue.aget(job["id"]))["status"]
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+        finished = await wait_finished(queue, job["id"])
+        await queue.drain(0)
+        return stalled, status, finished["status"]
+
+    stalled, status, finished = asyncio.run(run())
+    assert stalled < 1
+    assert status == "queued"
+    assert finished == "succeeded"
+
+
+def test_idle_workers_do_not_take_the_write_lock(tmp_path):
+    queue = make_queue(tmp_path / "jobs.db")
+    queue.get("missing")
+    other = sqlite3.connect(str(tmp_path / "jobs.db"), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        assert queue._claim() is None
+        assert time.monotonic() - started < 1
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import math
+
+import pytest
+
+from llm import long_audio
+from llm.audio import chunk_seconds_for_size, parse_silences, plan_chunks
+from llm.vad import OffsetMap
+
+MB = 1024 * 1024
+
+
+def test_plan_chunks_cuts_in_the_middle_of_silences():
+    chunks = plan_chunks(250, [(90, 92), (180, 190)], target=100, overlap=2)
+    assert [chunk["cut"] for chunk in chunks] == [0.0, 91.0, 185.0]
+    assert chunks[1] == {"start": 89.0, "cut": 91.0, "end": 185.0}
+    assert chunks[-1]["end"] == 250
+
+
+def test_plan_chunks_cuts_hard_without_a_usable_silence():
+    chunks = plan_chunks(250, [(10, 12)], target=100, overlap=0)
+    assert [(chunk["start"], chunk["end"]) for chunk in chunks] == [(0.0, 100.0), (100.0, 200.0), (200.0, 250)]
+
+
+def test_plan_chunks_short_recording_is_one_chunk():
+    assert plan_chunks(30, [], target=100) == [{"start": 0.0, "cut": 0.0, "end": 30}]
+
+
+def test_parse_silences_handles_a_trailing_silence():
+    output = "silence_start: -0.01\nsilence_end: 1.5 | silence_duration: 1.5\nsilence_start: 9"
+    assert parse_silences(output) == [(0.0, 1.5), (9.0, None)]
+
+
+def test_chunk_seconds_for_size():
+    assert chunk_seconds_for_size(10 * MB, 600, 24 * MB) == math.inf
+    # 48 kHz stereo 16-bit WAV: 192 kB a second, so about 112 s fits in 24 MB with the margin.
+    seconds = chunk_seconds_for_size(192000 * 3600, 3600, 24 * MB, overlap=2)
+    assert 100 < seconds < 24 * MB / 192000
+    assert seconds * 192000 + 2 * 192000 <= 24 * MB
+
+
+def test_offset_map_restores_original_times():
+    offsets = OffsetMap([(0, 10), (20, 30), (50, 60)], original_duration=70)
+    assert offsets.trimmed_duration == 30
+    assert offsets.seconds_saved == 40
+    assert offsets.trimmed_ratio == pytest.approx(40 / 70)
+    assert [offsets.to_original(t) for t in (0, 5, 10, 15, 25, 30)] == [0, 5, 20, 25, 55, 60]
+    assert offsets.remap([{"start": 9, "end": 11, "text": "x"}]) == [{"start": 9, "end": 21, "text": "x"}]
+    assert OffsetMap([], 5).to_original(3) == 3
+
+
+class FakeSTT:
+    def __init__(self):
+        self.sizes = []
+
+    async def atranscribe(self, path, response_format="verbose_json", **params):
+        with open(path, "rb") as f:
+            size = len(f.read())
+        self.sizes.append(size)
+        return json.dumps({"text": f"chunk of {size}", "segments": [{"start": 0.0, "end": 1.0, "text": f" chunk of {size}"}]})
+
+
+@pytest.fixture
+def ffmpeg(monkeypatch, tmp_path):
+    """Stand in for ffprobe/ffmpeg: a recording of `duration` seconds whose chunks are sliced by byte rate."""
+    state = {"duration": 3600.0, "transcoded": 0}
+
+    async def probe_duration(path):
+        return state["duration"]
+
+    async def detect_silences(path):
+        return []
+
+    async def extract_chunk(path, start, end, output_path):
+        with open(path, "rb") as source:
+            data = source.read()
+        rate = len(data) / state["duration"]
+        with open(output_path, "wb") as out:
+            out.write(data[int(start * rate):int(end * rate)] * state.get("burst", 1))
+        return output_path
+
+    async def transcode_for_speech(path):
+        state["transcoded"] += 1
+        output = path + ".ogg"
+        with open(output, "wb") as out:
+            out.write(b"o" * 1000)
+        return output
+
+    for name, fake in [("probe_duration", probe_duration), ("detect_silences", detect_silences),
+                       ("extract_chunk", extract_chunk), ("transcode_for_speech", transcode_for_speech)]:
+        monkeypatch.setattr(long_audio, name, fake)
+    monkeypatch.setattr(long_audio, "LONG_AUDIO_MAX_CHUNK_BYTES", 100_000)
+    return state
+
+
+def recording(tmp_path, size):
+    path = tmp_path / "talk.wav"
+    path.write_bytes(b"a" * size)
+    return str(path)
+
+
+def test_chunks_stay_under_the_size_limit(tmp_path, ffmpeg):
+    stt = FakeSTT()
+    pieces = asyncio.run(_collect(stt, recording(tmp_path, 1_000_000)))
+    assert len(pieces) > 10
+    assert max(stt.sizes) <= 100_000
+    assert ffmpeg["transcoded"] == 0
+
+
+def test_short_small_recording_is_sent_whole(tmp_path, ffmpeg):
+    ffmpeg["duration"] = 300.0
+    stt = FakeSTT()
+    pieces = asyncio.run(_collect(stt, recording(tmp_path, 50_000)))
+    assert len(pieces) == 1 and stt.sizes == [50_000]
+
+
+def test_oversized_chunk_is_re_encoded(tmp_path, ffmpeg):
+    ffmpeg["burst"] = 2
+    stt = FakeSTT()
+    asyncio.run(_collect(stt, recording(tmp_path, 1_000_000)))
+    assert max(stt.sizes) <= 100_000
+    assert stt.sizes.count(1000) == ffmpeg["transcoded"] > 0
+    assert list(tmp_path.glob("long-audio-*")) == []
+
+
+async def _collect(stt, path):
+    return [piece async for piece in long_audio.astream_long_transcription(stt, path, overlap=0)]
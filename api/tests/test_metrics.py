@@ -0,0 +1,13 @@
+import importlib
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_main_can_be_imported_again():
+    reloaded = importlib.reload(main)
+    response = TestClient(reloaded.app).get("/metrics")
+    assert response.status_code == 200
+    assert "llm_stats_response_cache_hits" in response.text
+    assert response.text.count("# TYPE llm_response_cache_hit_ratio gauge") == 1
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from llm import ratelimit
+from llm.ratelimit import RateLimiter, rate_limited
+from conftest import Clock
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def limiter(tmp_path, monkeypatch, clock):
+    for name in ("RPM", "TPM"):
+        monkeypatch.delenv(f"RATE_LIMIT_OPENAI_{name}", raising=False)
+    return RateLimiter(str(tmp_path / "limits.sqlite"))
+
+
+def bucket(limiter, model="m"):
+    with limiter._connect() as db:
+        return db.execute("SELECT rpm, tpm, requests, tokens FROM buckets WHERE bucket = ?", (f"openai:{model}",)).fetchone()
+
+
+def test_unlimited_bucket_skips_the_database(limiter, monkeypatch):
+    assert limiter.acquire("openai", "m", 500) == 0
+    calls = []
+    monkeypatch.setattr(limiter, "_try_acquire", lambda *args: calls.append(args))
+    assert limiter.acquire("openai", "m", 500) == 0
+    assert calls == []
+    assert limiter.stats["acquired"] == 2
+
+
+def test_configured_limits_drain_and_refill(limiter, monkeypatch, clock):
+    monkeypatch.setenv("RATE_LIMIT_OPENAI_RPM", "60")
+    monkeypatch.setenv("RATE_LIMIT_OPENAI_TPM", "1000")
+    assert limiter._try_acquire("openai", "m", 600) == (0.0, 600)
+    wait, taken = limiter._try_acquire("openai", "m", 600)
+    assert (wait, taken) == (pytest.approx(12.0), 0)
+    clock.advance(12)
+    assert limiter._try_acquire("openai", "m", 600) == (0.0, 600)
+    assert bucket(limiter)[2] == pytest.approx(59.0)
+
+
+def test_call_larger_than_the_budget_waits_for_a_full_bucket(limiter, monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_OPENAI_TPM", "1000")
+    assert limiter._try_acquire("openai", "m", 5000) == (0.0, 1000)
+
+
+def test_headers_set_limits_and_429_empties_the_bucket(limiter):
+    headers = {"x-ratelimit-limit-requests": "100", "x-ratelimit-limit-tokens": "2000", "x-ratelimit-remaining-tokens": "1500"}
+    limiter.acquire("openai", "m")
+    assert limiter._known_unlimited("openai", "m")
+    limiter.update_from_headers("openai", "m", headers)
+    assert not limiter._known_unlimited("openai", "m")
+    assert bucket(limiter) == (100, 2000, 100, 1500)
+    limiter.update_from_headers("openai", "m", {}, status_code=429)
+    assert bucket(limiter)[2:] == (0, 0)
+
+
+def test_parse_headers_ignores_unknown_providers_and_bad_values():
+    assert RateLimiter.parse_headers("replicate", {"x-ratelimit-limit-tokens": "5"}) == {}
+    assert RateLimiter.parse_headers("openai", {"x-ratelimit-limit-tokens": "lots"}) == {}
+
+
+def test_refund_returns_unused_tokens_up_to_the_limit(limiter, monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_OPENAI_TPM", "1000")
+    limiter.acquire("openai", "m", 800)
+    limiter.refund("openai", "m", 700)
+    assert bucket(limiter)[3] == pytest.approx(900)
+    limiter.refund("openai", "m", 700)
+    assert bucket(limiter)[3] == pytest.approx(1000)
+
+
+def test_decorator_refunds_from_reported_usage(limiter, monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_OPENAI_TPM", "10000")
+    monkeypatch.setattr(ratelimit, "get_limiter", lambda: limiter)
+
+    class Wrapper:
+        model = "m"
+
+        @rate_limited("openai", cost=ratelimit.estimate_text_tokens)
+        async def agenerate_text(self, prompt, max_tokens=4000):
+            return "text", 10, 90
+
+        @rate_limited("openai", cost=ratelimit.estimate_text_tokens)
+        async def astream_text(self, prompt, max_tokens=4000):
+            yield {"type": "delta", "text": "text"}
+            yield {"type": "usage", "input_tokens": 10, "output_tokens": 190}
+
+    async def run():
+        await Wrapper().agenerate_text("x" * 40)
+        return [item async for item in Wrapper().astream_text("x" * 40)]
+
+    asyncio.run(run())
+    assert limiter.stats["refunded_tokens"] == (4010 - 100) + (4010 - 200)
+    assert bucket(limiter)[3] == pytest.approx(10000 - 300)
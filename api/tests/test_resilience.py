@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from llm import deadlines, resilience
+from llm.resilience import CircuitBreaker, CircuitOpenError, get_breaker, resilient
+from conftest import Clock
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setitem(resilience.RETRY_SETTINGS, "base_delay", 0.001)
+    monkeypatch.setitem(resilience.RETRY_SETTINGS, "max_attempts", 3)
+
+
+class Wrapper:
+    def __init__(self, model, outcomes):
+        self.model = model
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def next(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    @resilient("test")
+    def generate_text(self, prompt):
+        return self.next()
+
+    @resilient("test")
+    async def agenerate_text(self, prompt):
+        return self.next()
+
+
+def test_breaker_opens_then_lets_one_trial_through(clock):
+    breaker = CircuitBreaker("test", "m", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert not breaker.healthy
+
+    clock.advance(30)
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = CircuitBreaker("test", "m", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.advance(30)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_transient_errors_are_retried():
+    wrapper = Wrapper("retry", [StatusError(503), StatusError(429), ("text", 1, 2)])
+    assert wrapper.generate_text("hi") == ("text", 1, 2)
+    assert wrapper.calls == 3
+    assert get_breaker("test", "retry").failures == 0
+
+
+def test_retries_give_up_after_max_attempts():
+    wrapper = Wrapper("exhausted", [StatusError(500)] * 3)
+    with pytest.raises(StatusError):
+        asyncio.run(wrapper.agenerate_text("hi"))
+    assert wrapper.calls == 3
+    assert get_breaker("test", "exhausted").failures == 3
+
+
+def test_client_errors_are_not_retried_and_leave_the_breaker_alone():
+    breaker = get_breaker("test", "client")
+    wrapper = Wrapper("client", [StatusError(500), StatusError(500), StatusError(400)])
+    with pytest.raises(StatusError) as raised:
+        wrapper.generate_text("hi")
+    assert raised.value.status_code == 400
+    assert breaker.failures == 2
+
+    wrapper = Wrapper("client", [StatusError(400)])
+    with pytest.raises(StatusError):
+        wrapper.generate_text("hi")
+    assert wrapper.calls == 1
+    assert breaker.failures == 2
+
+
+def test_open_breaker_fails_fast():
+    breaker = get_breaker("test", "open")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    wrapper = Wrapper("open", [("text", 1, 1)])
+    with pytest.raises(CircuitOpenError):
+        wrapper.generate_text("hi")
+    assert wrapper.calls == 0
+
+
+def test_no_retry_past_the_deadline(monkeypatch):
+    monkeypatch.setitem(resilience.RETRY_SETTINGS, "base_delay", 10)
+    monkeypatch.setattr(resilience, "retry_after", lambda error: 10)
+    wrapper = Wrapper("deadline", [StatusError(503), ("text", 1, 1)])
+
+    async def run():
+        with deadlines.deadline_scope(1):
+            return await wrapper.agenerate_text("hi")
+
+    with pytest.raises(StatusError):
+        asyncio.run(run())
+    assert wrapper.calls == 1
+
+
+def test_deadline_cancels_a_slow_call_without_tripping_the_breaker():
+    class Slow:
+        model = "slow"
+
+        @resilient("test")
+        async def agenerate_text(self, prompt, max_tokens=100):
+            await asyncio.sleep(1)
+
+    async def run():
+        with deadlines.deadline_scope(0.05):
+            await Slow().agenerate_text("hi")
+
+    before = dict(deadlines.cancellation_stats.stats)
+    with pytest.raises(deadlines.DeadlineExceeded):
+        asyncio.run(run())
+    assert deadlines.cancellation_stats.stats["deadline_exceeded"] == before["deadline_exceeded"] + 1
+    assert get_breaker("test", "slow").failures == 0
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from llm import deadlines, tracing
+from llm.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    runs = []
+
+    async def fetch():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*(flight.ado("k", fetch) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["value"] * 5
+    assert len(runs) == 1
+    assert flight.stats == {"calls": 5, "coalesced": 4}
+    assert flight.in_flight == 0
+
+
+def test_shared_call_runs_outside_the_first_callers_context():
+    flight = SingleFlight()
+    seen = {}
+
+    async def fetch():
+        seen["remaining"] = deadlines.remaining()
+        seen["span"] = tracing._current_span.get()
+        await asyncio.sleep(0.2)
+        return "value"
+
+    async def impatient():
+        tracing._current_span.set(tracing.Span("request"))
+        with deadlines.deadline_scope(0.05):
+            return await flight.ado("k", fetch)
+
+    async def run():
+        first = asyncio.ensure_future(impatient())
+        await asyncio.sleep(0)
+        return await asyncio.gather(first, flight.ado("k", fetch), return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert isinstance(first, deadlines.DeadlineExceeded)
+    assert second == "value"
+    assert seen == {"remaining": None, "span": None}
+
+
+def test_call_is_cancelled_once_every_caller_gives_up():
+    flight = SingleFlight()
+    cancelled = []
+
+    async def fetch():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError as e:
+            cancelled.append(deadlines.cancel_reason(e))
+            raise
+
+    async def caller():
+        with deadlines.deadline_scope(0.05):
+            await flight.ado("k", fetch)
+
+    async def run():
+        results = await asyncio.gather(caller(), caller(), return_exceptions=True)
+        await asyncio.sleep(0)
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, deadlines.DeadlineExceeded) for result in results)
+    assert cancelled == ["deadline"]
+
+
+def test_sync_calls_raise_the_leaders_error():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("k", fail)
+    assert flight.in_flight == 0
@@ -0,0 +1,138 @@
+import asyncio
+import io
+import zipfile
+
+import pytest
+
+import main
+from uploads import ImageTooLargeError, UploadLimitMiddleware, read_zip_member, zip_images
+
+
+def archive(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def test_zip_images_lists_only_images():
+    source = archive({"a.png": b"x", "notes.txt": b"x", "__MACOSX/._a.png": b"x", ".hidden.jpg": b"x", "dir/b.JPG": b"x"})
+    opened, members = zip_images(source)
+    assert [member.filename for member in members] == ["a.png", "dir/b.JPG"]
+    opened.close()
+
+
+def test_read_zip_member_enforces_the_limit():
+    opened, members = zip_images(archive({"big.png": b"x" * 100, "small.png": b"x" * 10}))
+    with pytest.raises(ImageTooLargeError):
+        read_zip_member(opened, members[0], limit=50)
+    assert read_zip_member(opened, members[1], limit=50).read() == b"x" * 10
+    opened.close()
+
+
+def test_batch_image_error_maps_only_size_errors_to_413():
+    assert main.batch_image_error(0, "a.png", ImageTooLargeError("a.png is too big")).status_code == 413
+    other = main.batch_image_error(1, "b.png", ValueError("OPENAI_API_KEY is not set"))
+    assert other.status_code != 413
+    assert "too large" not in other.error
+
+
+def asgi_call(app, path="/upload", headers=(), chunks=(b"",)):
+    """Drive an ASGI app with a request body sent in `chunks`; return (messages sent, chunks the app received)."""
+    scope = {"type": "http", "method": "POST", "path": path, "headers": list(headers)}
+    pending = [{"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1} for index, chunk in enumerate(chunks)]
+    sent, received = [], []
+
+    async def receive():
+        received.append(True)
+        return pending.pop(0) if pending else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent, received
+
+
+def reading_app(fail_after_disconnect=False, start_first=False, fail_before=False):
+    """An app that reads the whole body, then answers 200 with the byte count."""
+    async def app(scope, receive, send):
+        if start_first:
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+        if fail_before:
+            raise RuntimeError("app failed")
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                if fail_after_disconnect:
+                    raise RuntimeError("client went away")
+                break
+            size += len(message["body"])
+            if not message.get("more_body"):
+                break
+        if not start_first:
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": str(size).encode()})
+
+    return app
+
+
+def statuses(sent):
+    return [message["status"] for message in sent if message["type"] == "http.response.start"]
+
+
+def test_declared_length_over_the_limit_is_rejected_unread():
+    called = []
+
+    async def app(scope, receive, send):
+        called.append(True)
+
+    middleware = UploadLimitMiddleware(app, {"/upload": 10})
+    sent, received = asgi_call(middleware, headers=[(b"content-length", b"11")], chunks=(b"x" * 11,))
+    assert statuses(sent) == [413]
+    assert b"limit is 10 bytes" in sent[1]["body"]
+    assert called == [] and received == []
+
+
+def test_streamed_body_over_the_limit_is_rejected_mid_stream():
+    middleware = UploadLimitMiddleware(reading_app(), {"/upload": 10})
+    sent, received = asgi_call(middleware, chunks=(b"x" * 6, b"x" * 6, b"x" * 6))
+    assert statuses(sent) == [413]
+    # The third chunk is never read.
+    assert len(received) == 2
+    assert len(sent) == 2
+
+
+def test_body_under_the_limit_passes():
+    middleware = UploadLimitMiddleware(reading_app(), {"/upload": 10})
+    sent, _ = asgi_call(middleware, headers=[(b"content-length", b"10")], chunks=(b"x" * 5, b"x" * 5))
+    assert statuses(sent) == [200] and sent[-1]["body"] == b"10"
+
+
+def test_no_second_response_start_once_the_response_has_started():
+    middleware = UploadLimitMiddleware(reading_app(start_first=True), {"/upload": 10})
+    sent, _ = asgi_call(middleware, chunks=(b"x" * 6, b"x" * 6))
+    assert statuses(sent) == [200]
+    # The app's body after the rejection is dropped.
+    assert [message["type"] for message in sent] == ["http.response.start"]
+
+
+def test_app_errors_after_the_rejection_are_swallowed():
+    middleware = UploadLimitMiddleware(reading_app(fail_after_disconnect=True), {"/upload": 10})
+    sent, _ = asgi_call(middleware, chunks=(b"x" * 11,))
+    assert statuses(sent) == [413]
+
+
+def test_app_errors_before_the_rejection_are_raised():
+    middleware = UploadLimitMiddleware(reading_app(fail_before=True), {"/upload": 10})
+    with pytest.raises(RuntimeError, match="app failed"):
+        asgi_call(middleware, chunks=(b"x" * 5,))
+
+
+def test_paths_without_a_limit_pass_through():
+    middleware = UploadLimitMiddleware(reading_app(), {"/upload": 10})
+    sent, _ = asgi_call(middleware, path="/generate-text", headers=[(b"content-length", b"100")], chunks=(b"x" * 100,))
+    assert statuses(sent) == [200] and sent[-1]["body"] == b"100"
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from llm.vad import VAD_FRAME_SECONDS, OffsetMap, speech_intervals
+
+SILENCE, SPEECH = -60.0, -20.0
+
+
+def levels(*runs):
+    """Frame levels from (level, seconds) runs."""
+    return np.concatenate([np.full(round(seconds / VAD_FRAME_SECONDS), level) for level, seconds in runs])
+
+
+def approx(intervals):
+    return [pytest.approx(interval) for interval in intervals]
+
+
+def test_speech_runs_are_padded_and_long_silences_cut():
+    recording = levels((SILENCE, 3), (SPEECH, 1.5), (SILENCE, 3), (SPEECH, 1.5), (SILENCE, 3))
+    assert speech_intervals(recording, min_silence=1.0, padding=0.25) == approx([(2.75, 4.75), (7.25, 9.25)])
+
+
+@pytest.mark.parametrize("gap, merged", [(0.3, True), (0.9, True), (1.2, False)])
+def test_silences_shorter_than_the_minimum_are_kept(gap, merged):
+    recording = levels((SILENCE, 3), (SPEECH, 1.2), (SILENCE, gap), (SPEECH, 1.2), (SILENCE, 3))
+    intervals = speech_intervals(recording, min_silence=1.0, padding=0.25)
+    second_end = 3 + 1.2 + gap + 1.2 + 0.25
+    if merged:
+        assert intervals == approx([(2.75, second_end)])
+    else:
+        assert intervals == approx([(2.75, 4.45), (4.2 + gap - 0.25, second_end)])
+
+
+def test_short_silences_at_the_edges_are_kept():
+    recording = levels((SILENCE, 0.6), (SPEECH, 2.1), (SILENCE, 3), (SPEECH, 2.1), (SILENCE, 0.6))
+    duration = len(recording) * VAD_FRAME_SECONDS
+    intervals = speech_intervals(recording, min_silence=1.0, padding=0.25)
+    assert intervals == approx([(0.0, 2.95), (5.45, duration)])
+
+
+def test_no_speech_keeps_nothing():
+    assert speech_intervals(np.array([])) == []
+    assert speech_intervals(levels((SILENCE, 5))) == []
+    # Frames below the absolute floor are not speech, even well above a very low noise floor.
+    assert speech_intervals(levels((-80.0, 5), (-58.0, 1))) == []
+
+
+def test_offset_map_totals():
+    offsets = OffsetMap([(2.0, 4.0), (10.0, 13.0)], 20.0)
+    assert offsets.trimmed_duration == 5.0
+    assert offsets.seconds_saved == 15.0
+    assert offsets.trimmed_ratio == 0.75
+    assert OffsetMap([], 0.0).trimmed_ratio == 0.0
+
+
+@pytest.mark.parametrize("trimmed, original", [
+    (0.0, 2.0),
+    (1.5, 3.5),
+    # A time on the boundary belongs to the interval that starts there.
+    (2.0, 10.0),
+    (2.5, 10.5),
+    (5.0, 13.0),
+])
+def test_to_original(trimmed, original):
+    offsets = OffsetMap([(2.0, 4.0), (10.0, 13.0)], 20.0)
+    assert offsets.to_original(trimmed) == pytest.approx(original)
+
+
+def test_to_original_without_intervals_is_the_identity():
+    assert OffsetMap([], 10.0).to_original(3.2) == 3.2
+
+
+def test_remap_round_trips_times_in_kept_spans():
+    recording = levels((SILENCE, 3), (SPEECH, 1.5), (SILENCE, 3), (SPEECH, 1.5), (SILENCE, 3))
+    intervals = speech_intervals(recording)
+    offsets = OffsetMap(intervals, len(recording) * VAD_FRAME_SECONDS)
+    originals = [start + (end - start) * fraction for start, end in intervals for fraction in (0.1, 0.5, 0.9)]
+
+    def to_trimmed(seconds):
+        position = 0.0
+        for start, end in intervals:
+            if start <= seconds <= end:
+                return position + seconds - start
+            position += end - start
+        raise AssertionError(seconds)
+
+    segments = [{"start": to_trimmed(t), "end": to_trimmed(t), "text": f"s{index}"} for index, t in enumerate(originals)]
+    remapped = offsets.remap(segments)
+    assert [segment["start"] for segment in remapped] == approx(originals)
+    assert [segment["text"] for segment in remapped] == [segment["text"] for segment in segments]
+    # The input is left as it was.
+    assert segments[0]["start"] == pytest.approx(to_trimmed(originals[0]))
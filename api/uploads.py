@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from contextlib import asynccontextmanager
+
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# Largest request body accepted per route prefix, in bytes. The first matching
+# prefix wins, so longer prefixes come first.
+UPLOAD_LIMITS = {
+    "/transcribe-audio": int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", str(200 * 1024 * 1024))),
+    "/image-to-text/batch": int(os.getenv("MAX_IMAGE_BATCH_UPLOAD_BYTES", str(200 * 1024 * 1024))),
+    "/image-to-text": MAX_IMAGE_UPLOAD_BYTES,
+}
+# Members of uploaded zip archives treated as images; everything else is skipped.
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".tif", ".tiff")
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an image in an uploaded archive is over the per-image size limit."""
+
+
+class UploadLimitMiddleware:
+    def __init__(self, app, limits=UPLOAD_LIMITS):
+        """
+        ASGI middleware rejecting upload bodies over a size limit with 413.
+
+        A declared `Content-Length` over the limit is rejected before anything is
+        read. Otherwise bytes are counted as they arrive. Once the limit is passed,
+        the 413 is sent and the application sees the client disconnect. Multipart
+        parsing then stops, and no more of the body is spooled to disk.
+
+        Parameters:
+        - app: The ASGI application to wrap.
+        - limits (dict): Maps path prefixes to their maximum body size in bytes.
+        """
+        self.app = app
+        self.limits = limits
+
+    def limit_for(self, path):
+        """Return the body size limit for a path, or None if it has none."""
+        for prefix, limit in self.limits.items():
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limit_for(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            await self._reject(send, limit)
+            return
+        size = 0
+        started = rejected = False
+
+        async def limited_receive():
+            nonlocal size, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                size += len(message.get("body", b""))
+                if size > limit:
+                    rejected = True
+                    if not started:
+                        await self._reject(send, limit)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+
+    @staticmethod
+    async def _reject(send, limit):
+        body = json.dumps({"detail": f"Upload too large: the limit is {limit} bytes."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+@asynccontextmanager
+async def upload_path(upload, suffix=""):
+    """
+    Copy an upload to a named temporary file, for tools that need a path, such as ffmpeg.
+
+    The copy is made in chunks in a worker thread. The file is removed when the
+    block exits, whether or not it raised.
+
+    Parameters:
+    - upload (UploadFile): The uploaded file.
+    - suffix (str): File name suffix, e.g. ".mp3", so tools can tell the format.
+
+    Yields:
+    - str: The path of the copy.
+    """
+    directory = tempfile.mkdtemp(prefix="upload-")
+    path = os.path.join(directory, f"upload{suffix}")
+    try:
+        await asyncio.to_thread(_copy, upload.file, path)
+        yield path
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+async def upload_digest(upload):
+    """
+    Return the SHA-256 hex digest of an upload's contents.
+
+    The spooled file is read in 1 MB chunks in a worker thread, so large uploads
+    are never held in memory and the event loop is not blocked.
+
+    Parameters:
+    - upload (UploadFile or file): The uploaded file, or an open binary file.
+    """
+    return await asyncio.to_thread(_digest, getattr(upload, "file", upload))
+
+
+def zip_images(source):
+    """
+    Open an uploaded zip archive and list the images in it.
+
+    Only the central directory is read; members are decompressed one at a time
+    by `read_zip_member`. Directories, hidden files and macOS resource forks are
+    skipped, as are members whose extension is not in IMAGE_EXTENSIONS.
+
+    Parameters:
+    - source (file): The archive, as an open seekable binary file.
+
+    Returns:
+    - tuple: (ZipFile, list of ZipInfo in archive order). The caller closes the ZipFile.
+
+    Raises:
+    - zipfile.BadZipFile: If the upload is not a zip archive.
+    """
+    source.seek(0)
+    archive = zipfile.ZipFile(source)
+    members = [
+        member for member in archive.infolist()
+        if not member.is_dir()
+        and not member.filename.startswith("__MACOSX/")
+        and not os.path.basename(member.filename).startswith(".")
+        and os.path.splitext(member.filename)[1].lower() in IMAGE_EXTENSIONS
+    ]
+    return archive, members
+
+
+def read_zip_member(archive, member, limit=MAX_IMAGE_UPLOAD_BYTES):
+    """
+    Decompress one archive member into memory.
+
+    At most `limit` bytes are inflated whatever size the archive declares, so a
+    crafted archive cannot expand without bound. Blocking; call it from a worker thread.
+
+    Returns:
+    - io.BytesIO: The member's contents.
+
+    Raises:
+    - ImageTooLargeError: If the member is larger than `limit`.
+    """
+    with archive.open(member) as f:
+        data = f.read(limit + 1)
+    if len(data) > limit:
+        raise ImageTooLargeError(f"{member.filename} is larger than {limit} bytes")
+    return io.BytesIO(data)
+
+
+def _digest(source):
+    source.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(1024 * 1024), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def _copy(source, path):
+    source.seek(0)
+    with open(path, "wb") as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
@@ -13,7 +13,7 @@ from features.tracking import tracking_plan
 from features.gtm import gtm_planner
 from features.ab_test import abc_test_significance
 from features.test_duration import ab_test_duration_calculator
-from utils.models import build_models
+from utils.models import build_models, build_cascade_model
 from utils.data_loading import load_prompts
 from storage.supabase_client import create_client
 import os
@@ -35,7 +35,7 @@ def main():
 
     This function performs the following tasks:
     1. Loads system prompts from a JSON file.
-    2. Builds language models (Claude and GPT-4) using the utility function `build_models`.
+    2. Builds the quality and fast language models, routed across providers, using the utility function `build_models`.
     3. Sets up system prompts for various tasks such as PRD creation, brainstorming, tracking plans, GTM plans, and A/B testing.
     4. Authenticates the user using Supabase.
     5. Displays a sidebar menu for the user to select a task.
@@ -53,7 +53,11 @@ def main():
     """
    
     prompts = load_prompts()
-    claude_llm, gpt4_llm = build_models()
+    quality_llm, fast_llm = build_models()
+    # First drafts try Groq's llama3-70b before the quality model. Chat replies
+    # are short, so brainstorming only escalates refusals and errors.
+    cascade_llm = build_cascade_model()
+    brainstorm_llm = build_cascade_model(min_chars=0)
     system_prompt_prd_experimental = prompts['system_prompt_prd_experimental']
     system_prompt_director = prompts['system_prompt_director']
     system_prompt_brainstorm = prompts['system_prompt_brainstorm']
@@ -90,37 +94,37 @@ def main():
             create_prd(
                 system_prompt_prd_experimental,
                 system_prompt_director,
-                claude_llm,
-                gpt4_llm,
+                quality_llm,
+                fast_llm,
                 supabase
             )
         elif option == "Improve PRD":
             improve_prd(
                 system_prompt_prd_experimental,
                 system_prompt_director,
-                claude_llm,
+                quality_llm,
                 supabase
             )
         elif option == "Brainstorm Features":
-            brainstorm_features(system_prompt_brainstorm, gpt4_llm, supabase)
+            brainstorm_features(system_prompt_brainstorm, brainstorm_llm, supabase)
         elif option == "Tracking Plan":
             tracking_plan(
                 system_prompt_tracking,
                 user_prompt_tracking,
                 system_prompt_directorDA,
-                claude_llm,
-                gpt4_llm,
+                quality_llm,
+                fast_llm,
                 supabase
             )
         elif option == "Create GTM Plan":
             gtm_planner(
                 system_prompt_GTM,
                 system_prompt_GTM_critique,
-                gpt4_llm,
-                claude_llm
+                cascade_llm,
+                quality_llm
             )
         elif option == "A/B Test Significance":
-            abc_test_significance(claude_llm, system_prompt_ab_test)
+            abc_test_significance(quality_llm, system_prompt_ab_test)
         elif option == "A/B Test Duration Calculator":
             ab_test_duration_calculator()
         elif option == "View History":
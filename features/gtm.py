@@ -1,6 +1,8 @@
 import streamlit as st
 from storage.supabase_client import create_record, read_records
 from utils.data_loading import create_data_prd
+from utils.tracing import show_timing_panel
+from api.llm.tracing import span
 import os
 
 def gtm_planner(system_prompt_GTM, system_prompt_GTM_critique, fast_llm_model, llm_model):
@@ -28,10 +30,12 @@ def gtm_planner(system_prompt_GTM, system_prompt_GTM_critique, fast_llm_model, l
             with st.spinner('Generating Plan...'):
                 try:
                     user_prompt = f"Generate the Go To Market Plan for: \n ## Product Requirements Document \n {prd_text} \n ## Other Details \n {other_details} \n RESPOND in Markdown Only."
-                    fast_llm_model.system_prompt = system_prompt_GTM
-                    response, input_tokens, output_tokens = fast_llm_model.generate_text(
-                        prompt=user_prompt, temperature=0.4
-                    )
+                    with span("gtm_plan") as trace:
+                        with span("draft"):
+                            fast_llm_model.system_prompt = system_prompt_GTM
+                            response, input_tokens, output_tokens = fast_llm_model.generate_text(
+                                prompt=user_prompt, temperature=0.4
+                            )
                     st.markdown(response, unsafe_allow_html=True)
                     st.session_state['history'].append({'role': 'user', 'content': response})
                     # Download button for the plan
@@ -41,6 +45,7 @@ def gtm_planner(system_prompt_GTM, system_prompt_GTM_critique, fast_llm_model, l
                         file_name="gtm_plan.md",
                         mime="text/markdown"
                     )
+                    show_timing_panel(trace)
                 except Exception as e:
                     st.error(f"Failed to generate GTM plan. Please try again later. Error: {str(e)}")
     pass
\ No newline at end of file
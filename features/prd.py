@@ -1,6 +1,8 @@
 import streamlit as st
 from storage.supabase_client import create_record, read_records
 from utils.data_loading import create_data_prd
+from utils.tracing import show_timing_panel
+from api.llm.tracing import span
 import os
 
 prd_table = os.environ.get('SUPABASE_TABLE')
@@ -31,32 +33,36 @@ def create_prd(system_prompt_prd, system_prompt_director, llm_model, fast_llm_mo
         else:
             with st.spinner(status_message):
                 try:
-                    llm_model.system_prompt = system_prompt_prd
-                    draft_prd, input_tokens, output_tokens = llm_model.generate_text(
-                        prompt=f"Generate a PRD for a product named {product_name} with the following description: {product_description}. Only respond with the PRD and in Markdown format. BE DETAILED. If you think user is not asking for PRD return nothing."
-                    )
-                    critique_rounds = 2  # Set the number of critique rounds
-                    for round in range(critique_rounds):
-                        st.session_state['history'].append({'role': 'user', 'content': draft_prd})
-                        status_message = f"Draft PRD Done. Reviewing it...Round {round+1} of {critique_rounds}"
-                        st.info(status_message)
-                        llm_model.system_prompt = system_prompt_director
-                        critique_response, input_tokens, output_tokens = llm_model.generate_text(
-                            prompt=f"Critique the PRD: {draft_prd}. It was generated by PM who was given these instructions: \n Product named {product_name} \n Product description: {product_description}. Only respond in Markdown format. BE DETAILED. If you think user is not asking for PRD return nothing."
-                        )
-                        st.session_state['history'].append({'role': 'user', 'content': critique_response})
-                        status_message = "Making adjustments.."
-                        st.info(status_message)
-                        if round != 0:
+                    with span("create_prd") as trace:
+                        with span("draft"):
                             llm_model.system_prompt = system_prompt_prd
                             draft_prd, input_tokens, output_tokens = llm_model.generate_text(
-                                prompt=f"Given the Feedback from your manager:{critique_response} \n Improve upon your Draft PRD {draft_prd}. \n Only respond with the PRD and in Markdown format. BE VERY DETAILED. If you think user is not asking for PRD return nothing."
-                            )
-                        else:
-                            fast_llm_model.system_prompt = system_prompt_prd
-                            draft_prd, input_tokens, output_tokens = fast_llm_model.generate_text(
-                                prompt=f"Given the Feedback from your manager:{critique_response} \n Improve upon your Draft PRD {draft_prd}. \n Only respond with the PRD and in Markdown format. BE VERY DETAILED. If you think user is not asking for PRD return nothing."
+                                prompt=f"Generate a PRD for a product named {product_name} with the following description: {product_description}. Only respond with the PRD and in Markdown format. BE DETAILED. If you think user is not asking for PRD return nothing."
                             )
+                        critique_rounds = 2  # Set the number of critique rounds
+                        for round in range(critique_rounds):
+                            st.session_state['history'].append({'role': 'user', 'content': draft_prd})
+                            status_message = f"Draft PRD Done. Reviewing it...Round {round+1} of {critique_rounds}"
+                            st.info(status_message)
+                            with span(f"critique {round+1}"):
+                                llm_model.system_prompt = system_prompt_director
+                                critique_response, input_tokens, output_tokens = llm_model.generate_text(
+                                    prompt=f"Critique the PRD: {draft_prd}. It was generated by PM who was given these instructions: \n Product named {product_name} \n Product description: {product_description}. Only respond in Markdown format. BE DETAILED. If you think user is not asking for PRD return nothing."
+                                )
+                            st.session_state['history'].append({'role': 'user', 'content': critique_response})
+                            status_message = "Making adjustments.."
+                            st.info(status_message)
+                            with span(f"revise {round+1}"):
+                                if round != 0:
+                                    llm_model.system_prompt = system_prompt_prd
+                                    draft_prd, input_tokens, output_tokens = llm_model.generate_text(
+                                        prompt=f"Given the Feedback from your manager:{critique_response} \n Improve upon your Draft PRD {draft_prd}. \n Only respond with the PRD and in Markdown format. BE VERY DETAILED. If you think user is not asking for PRD return nothing."
+                                    )
+                                else:
+                                    fast_llm_model.system_prompt = system_prompt_prd
+                                    draft_prd, input_tokens, output_tokens = fast_llm_model.generate_text(
+                                        prompt=f"Given the Feedback from your manager:{critique_response} \n Improve upon your Draft PRD {draft_prd}. \n Only respond with the PRD and in Markdown format. BE VERY DETAILED. If you think user is not asking for PRD return nothing."
+                                    )
                     st.markdown(draft_prd, unsafe_allow_html=True)
                     st.session_state['history'].append({'role': 'user', 'content': draft_prd})
                     data = create_data_prd(st.session_state['user']['email'], product_name, product_description, draft_prd, True)
@@ -71,6 +77,7 @@ def create_prd(system_prompt_prd, system_prompt_director, llm_model, fast_llm_mo
                         file_name="Product_Requirements_Document.md",
                         mime="text/markdown"
                     )
+                    show_timing_panel(trace)
                 except Exception as e:
                     st.error(f"Failed to generate PRD. Please try again later. Error: {str(e)}")
 
@@ -97,24 +104,28 @@ def improve_prd(system_prompt_prd, system_prompt_director, llm_model, supabase):
         else:
             with st.spinner('Improving PRD...'):
                 try:
-                    llm_model.system_prompt = f"You are a meticulous editor for improving product documents. {system_prompt_prd}. If you think user is not sharing the PRD return nothing."
-                    draft_prd, input_tokens, output_tokens = llm_model.generate_text(
-                        prompt=f"Improve the following PRD: {prd_text}"
-                    )
-                    st.session_state['history'].append({'role': 'user', 'content': draft_prd})
-                    status_message = "Draft PRD Done. Reviewing it..."
-                    st.info(status_message)
-                    llm_model.system_prompt = system_prompt_director
-                    critique_response, input_tokens, output_tokens = llm_model.generate_text(
-                        prompt=f"Critique the PRD: {draft_prd}. Only respond in Markdown format. BE DETAILED. If you think user is not asking for PRD return nothing."
-                    )
-                    st.session_state['history'].append({'role': 'user', 'content': critique_response})
-                    status_message = "Making final adjustments.."
-                    st.info(status_message)
-                    llm_model.system_prompt = system_prompt_prd
-                    response, input_tokens, output_tokens = llm_model.generate_text(
-                        prompt=f"Given the Feedback from your manager:{critique_response} \n Improve upon your Draft PRD {draft_prd}. \n Only respond with the PRD and in Markdown format. BE VERY DETAILED. If you think user is not asking for PRD return nothing."
-                    )
+                    with span("improve_prd") as trace:
+                        with span("draft"):
+                            llm_model.system_prompt = f"You are a meticulous editor for improving product documents. {system_prompt_prd}. If you think user is not sharing the PRD return nothing."
+                            draft_prd, input_tokens, output_tokens = llm_model.generate_text(
+                                prompt=f"Improve the following PRD: {prd_text}"
+                            )
+                        st.session_state['history'].append({'role': 'user', 'content': draft_prd})
+                        status_message = "Draft PRD Done. Reviewing it..."
+                        st.info(status_message)
+                        with span("critique"):
+                            llm_model.system_prompt = system_prompt_director
+                            critique_response, input_tokens, output_tokens = llm_model.generate_text(
+                                prompt=f"Critique the PRD: {draft_prd}. Only respond in Markdown format. BE DETAILED. If you think user is not asking for PRD return nothing."
+                            )
+                        st.session_state['history'].append({'role': 'user', 'content': critique_response})
+                        status_message = "Making final adjustments.."
+                        st.info(status_message)
+                        with span("revise"):
+                            llm_model.system_prompt = system_prompt_prd
+                            response, input_tokens, output_tokens = llm_model.generate_text(
+                                prompt=f"Given the Feedback from your manager:{critique_response} \n Improve upon your Draft PRD {draft_prd}. \n Only respond with the PRD and in Markdown format. BE VERY DETAILED. If you think user is not asking for PRD return nothing."
+                            )
                     st.markdown(response, unsafe_allow_html=True)
                     st.session_state['history'].append({'role': 'user', 'content': response})
                     data = create_data_prd(st.session_state['user']['email'], "Improve PRD", prd_text, response, False)
@@ -129,6 +140,7 @@ def improve_prd(system_prompt_prd, system_prompt_director, llm_model, supabase):
                         file_name="Product_Requirements_Document.md",
                         mime="text/markdown"
                     )
+                    show_timing_panel(trace)
                 except Exception as e:
                     st.error(f"Failed to improve PRD. Please try again later. Error: {str(e)}")
 
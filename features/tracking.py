@@ -1,6 +1,8 @@
 import streamlit as st
 from storage.supabase_client import create_record, read_records
 from utils.data_loading import create_tracking_plan
+from utils.tracing import show_timing_panel
+from api.llm.tracing import span
 import os
 
 tracking_table = os.environ.get('SUPABASE_TRACKING_TABLE')
@@ -43,26 +45,30 @@ def tracking_plan(system_prompt_tracking, user_prompt_tracking, system_prompt_di
                     user_prompt = user_prompt.replace("{customer}", customer_name)
                     user_prompt = user_prompt.replace("{details}", other_details)
                     user_prompt = user_prompt.replace("{prd}", prd_text)
-                    llm_model.system_prompt = system_prompt_tracking
-                    draft_plan, input_tokens, output_tokens = llm_model.generate_text(
-                        prompt = user_prompt, temperature=0.2 
-                    )
-                    st.session_state['history'].append({'role': 'user', 'content': draft_plan})
-                    status_message = "Draft tracking Done. Reviewing the plan..."
-                    st.info(status_message)
-                    fast_llm_model.system_prompt = system_prompt_directorDA
-                    critique_response, input_tokens, output_tokens = fast_llm_model.generate_text(
-                        prompt = f"Critique the Tracking Plan: {draft_plan}. Only respond in Markdown format. BE DETAILED. If you think user is not asking for tracking plan return nothing.\n Context: ### PRD \n {prd_text} \n ### Feature Name \n {feature_name} \n ### Additional Details \n {other_details} ",
-                        temperature=0.3
-                    )
-                    st.session_state['history'].append({'role': 'user', 'content': critique_response})
-                    status_message = "Making final adjustments.."
-                    st.info(status_message)
-                    llm_model.system_prompt = system_prompt_tracking
-                    response, input_tokens, output_tokens = llm_model.generate_text(
-                        prompt = f"Given the Feedback from your manager:{critique_response} \n Improve upon your draft tracking plan {draft_plan}. \n Only respond with the tracking plan and in Markdown. BE VERY DETAILED. If you think user is not asking for tracking plan return nothing.",
-                        temperature=0.1                    
-                    )                                          
+                    with span("tracking_plan") as trace:
+                        with span("draft"):
+                            llm_model.system_prompt = system_prompt_tracking
+                            draft_plan, input_tokens, output_tokens = llm_model.generate_text(
+                                prompt = user_prompt, temperature=0.2 
+                            )
+                        st.session_state['history'].append({'role': 'user', 'content': draft_plan})
+                        status_message = "Draft tracking Done. Reviewing the plan..."
+                        st.info(status_message)
+                        with span("critique"):
+                            fast_llm_model.system_prompt = system_prompt_directorDA
+                            critique_response, input_tokens, output_tokens = fast_llm_model.generate_text(
+                                prompt = f"Critique the Tracking Plan: {draft_plan}. Only respond in Markdown format. BE DETAILED. If you think user is not asking for tracking plan return nothing.\n Context: ### PRD \n {prd_text} \n ### Feature Name \n {feature_name} \n ### Additional Details \n {other_details} ",
+                                temperature=0.3
+                            )
+                        st.session_state['history'].append({'role': 'user', 'content': critique_response})
+                        status_message = "Making final adjustments.."
+                        st.info(status_message)
+                        with span("revise"):
+                            llm_model.system_prompt = system_prompt_tracking
+                            response, input_tokens, output_tokens = llm_model.generate_text(
+                                prompt = f"Given the Feedback from your manager:{critique_response} \n Improve upon your draft tracking plan {draft_plan}. \n Only respond with the tracking plan and in Markdown. BE VERY DETAILED. If you think user is not asking for tracking plan return nothing.",
+                                temperature=0.1                    
+                            )                                          
                     st.markdown(response, unsafe_allow_html=True)
                     st.session_state['history'].append({'role': 'user', 'content': response})
                     # save the data
@@ -78,6 +84,7 @@ def tracking_plan(system_prompt_tracking, user_prompt_tracking, system_prompt_di
                         file_name="tracking_plan.md",
                         mime="text/markdown"
                     )                       
+                    show_timing_panel(trace)
                 except Exception as e:
                     st.error(f"Failed to generate tracking plan. Please try again later. Error: {str(e)}")
     pass 
\ No newline at end of file
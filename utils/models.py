@@ -1,24 +1,56 @@
 from api.llm.openai_llm import OpenAIWrapper
 from api.llm.groq_llm import GroqWrapper
 from api.llm.anthropic_llm import AnthropicWrapper
+from api.llm.router import RoutedModel, get_router
+from api.llm.cascade import AcceptanceCheck, CascadeModel
 import os
 import openai
 import streamlit as st
 
 def build_models():
     """
-    Builds and initializes the GPT-3.5-turbo and GPT-4-turbo models.
+    Builds the quality and fast text models used by the features.
+
+    Both are routed models: on every call the router in `api.llm.router` picks the
+    best healthy model of the tier from the registry, using live latency and error
+    rates. Their SDK clients come from the process-wide registry in
+    `api.llm.clients`, so all sessions share one keep-alive connection pool per
+    provider and API key.
+    Returns:
+        tuple: A tuple containing the quality-tier and fast-tier models.
+    """
+    quality_model = RoutedModel(tier="quality")
+    fast_model = RoutedModel(tier="fast")
+
+    return quality_model, fast_model
+
+def build_cascade_model(min_chars=300, required_sections=()):
+    """
+    Builds a cascade model for drafts that a cheap model can usually handle.
+
+    Each call goes to Groq's llama3-70b-8192 first. Only if the answer is shorter
+    than `min_chars`, lacks one of `required_sections` (Markdown headings) or is
+    a refusal, the quality-tier routed model answers instead. Prompts too long for
+    llama3-70b-8192's context window go to the quality model directly. Escalation
+    counts and the latency saved are recorded in `api.llm.cascade.cascade_stats`.
+    Pass `min_chars=0` for chat, whose replies are often short.
     Returns:
-        tuple: A tuple containing the initialized GPT-3.5-turbo and GPT-4-turbo models.
-    Raises:
-        ValueError: If the OPENAI_API_KEY environment variable is not set.
+        CascadeModel: The cascade model.
     """
-    gpt4_model = OpenAIWrapper(model ="gpt-4o")
-    groq_model = GroqWrapper(model = "llama3-70b-8192")
-    claude_model = AnthropicWrapper(model="claude-3-5-sonnet-20240620")
+    router = get_router()
 
+    def quality_latency():
+        # Only for the stats: no quality model configured must not fail the call.
+        ranked = router.rank(tier="quality")
+        return router.expected_latency(*ranked[0]) if ranked else None
 
-    return claude_model, gpt4_model
+    return CascadeModel(
+        GroqWrapper(model="llama3-70b-8192"),
+        RoutedModel(tier="quality", router=router),
+        check=AcceptanceCheck(min_chars=min_chars, required_sections=required_sections),
+        quality_latency=quality_latency,
+        cheap_spec=router.models.get(("groq", "llama3-70b-8192")),
+    )
 
 def transcribe_audio(audio_path):
     """Transcribe the downloaded audio file using OpenAI's Whisper model."""
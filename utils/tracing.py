@@ -0,0 +1,29 @@
+import pandas as pd
+import streamlit as st
+
+def show_timing_panel(trace):
+    """
+    Shows a collapsible panel with the duration of every stage of a trace.
+
+    Args:
+        trace: The root span returned by `api.llm.tracing.span` once its block has finished.
+
+    Returns:
+        None
+    """
+    depth = {}
+    rows = []
+    for span in sorted(trace.spans, key=lambda span: span.start):
+        depth[span.span_id] = depth.get(span.parent_id, -1) + 1
+        attributes = span.attributes
+        rows.append({
+            "Stage": "    " * depth[span.span_id] + span.name,
+            "Model": attributes.get("model", ""),
+            "Prompt chars": attributes.get("prompt_chars"),
+            "Input tokens": attributes.get("input_tokens"),
+            "Output tokens": attributes.get("output_tokens"),
+            "Seconds": round(span.duration, 2),
+            "Error": span.error or "",
+        })
+    with st.expander(f"Timing ({trace.duration:.1f}s)"):
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)